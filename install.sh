@@ -27,7 +27,7 @@ install_dependencies() {
     # Instalar dependencias generales.
     echo "Instalando python3, venv, pip, nodejs (con npm), nginx, git, docker y docker-compose..."
     # Añadimos smartmontools y hdparm que ya estaban
-    sudo apt install -y python3 python3-venv python3-pip nodejs nginx git docker.io docker-compose smartmontools hdparm
+    sudo apt install -y python3 python3-venv python3-pip nodejs nginx git docker.io docker-compose smartmontools hdparm ffmpeg
 
     # Añadimos el usuario al grupo docker para poder ejecutar comandos docker sin sudo
     # Cierra la sesión SSH y vuelve a conectarte para que el cambio surta efecto
@@ -65,7 +65,7 @@ setup_flask() {
     echo "Activando entorno virtual e instalando dependencias Python..."
     source $VENV_DIR/bin/activate
     # !!! MODIFICACION: Añadimos requests y python-dotenv !!!
-    pip install flask flask-cors gunicorn psutil netifaces bcrypt requests python-dotenv
+    pip install flask flask-cors gunicorn psutil netifaces bcrypt requests python-dotenv Pillow
     deactivate
 
     echo "🔹 Configuración de Flask completada."
@@ -176,11 +176,14 @@ Requires=docker.service
 [Service]
 User=$USER
 WorkingDirectory=$BACKEND_DIR
+# Las descargas autorizadas por Flask las sirve Nginx desde su location interna (ver setup_nginx)
+Environment=NASPI_ACCEL_REDIRECT=/_raid_files/
 
 # Esperar a que el contenedor de Portainer esté activo antes de arrancar
 ExecStartPre=/usr/bin/bash -c 'until docker inspect -f "{{.State.Running}}" portainer 2>/dev/null | grep true; do echo "Esperando a que Portainer arranque..."; sleep 3; done'
 
-ExecStart=$VENV_DIR/bin/gunicorn -w 8 --timeout 3600 --limit-request-line 8190 --limit-request-field_size 8190 -b 0.0.0.0:$FLASK_PORT app:app
+# gthread: cada conexión SSE (/api/events) ocupa un hilo y no un worker completo
+ExecStart=$VENV_DIR/bin/gunicorn -w 8 -k gthread --threads 16 --timeout 3600 --limit-request-line 8190 --limit-request-field_size 8190 -b 0.0.0.0:$FLASK_PORT app:app
 Restart=always
 StandardOutput=append:/var/log/flask.log
 StandardError=append:/var/log/flask_error.log
@@ -191,6 +194,32 @@ EOF
    echo "Archivo de servicio Flask creado."
 }
 
+# Servicio de trabajos en segundo plano (borrados, copias, movimientos y archivados; ver job_engine.py)
+setup_jobs_service() {
+    echo "🔹 Creando servicio Systemd para los trabajos en segundo plano..."
+    sudo tee /etc/systemd/system/naspi-jobs.service > /dev/null <<EOF
+[Unit]
+Description=NASPi Background Jobs
+After=network.target local-fs.target
+
+[Service]
+User=$USER
+WorkingDirectory=$BACKEND_DIR
+ExecStart=$VENV_DIR/bin/python job_engine.py
+# Los trabajos no deben quitar CPU ni disco a las peticiones de los usuarios
+Nice=10
+IOSchedulingClass=best-effort
+IOSchedulingPriority=7
+Restart=always
+StandardOutput=append:/var/log/naspi_jobs.log
+StandardError=append:/var/log/naspi_jobs.log
+
+[Install]
+WantedBy=multi-user.target
+EOF
+   echo "Archivo de servicio de trabajos creado."
+}
+
 # Configurar Nginx
 setup_nginx() {
     echo "🔹 Configurando Nginx..."
@@ -220,6 +249,18 @@ server {
         proxy_connect_timeout 600s;
     }
 
+    # Descargas: Flask autoriza y responde con X-Accel-Redirect; Nginx envía el fichero (Range, sendfile). Los
+    # validadores son los de Flask: ETag (checksum de la subida si existe) y Digest se copian de su respuesta
+    location /_raid_files/ {
+        internal;
+        alias /mnt/raid/files/;
+        sendfile on;
+        tcp_nopush on;
+        etag off;
+        add_header ETag \$upstream_http_etag always;
+        add_header Digest \$upstream_http_digest always;
+    }
+
     error_page 404 /index.html;
 }
 EOF
@@ -245,7 +286,8 @@ setup_logrotate() {
     # Contenido exacto del archivo logrotate proporcionado originalmente
     sudo tee /etc/logrotate.d/proyecto > /dev/null <<EOF
 /var/log/flask.log
-/var/log/flask_error.log {
+/var/log/flask_error.log
+/var/log/naspi_jobs.log {
     weekly
     rotate 4
     compress
@@ -263,6 +305,8 @@ enable_and_start_services() {
     sudo systemctl daemon-reload
     sudo systemctl enable --now flask.service
     echo "Servicio Flask iniciado."
+    sudo systemctl enable --now naspi-jobs.service
+    echo "Servicio de trabajos iniciado."
 
     # También habilitamos y arrancamos Docker por si no lo estaba
     sudo systemctl enable --now docker.service
@@ -300,13 +344,13 @@ instructions() {
     echo "   PORTAINER_USERNAME=<tu_usuario_portainer>"
     echo "   PORTAINER_PASSWORD=<tu_password_portainer>"
     echo "   PORTAINER_ENVIRONMENT_ID=1 # Confirma si tu entorno Docker es el ID 1 en Portainer"
-    echo "   ADMIN_API_KEY=<una_clave_admin_aleatoria_muy_segura>" # Genera una clave larga y aleatoria
+    echo "   # ADMIN_API_KEY=<clave_aleatoria> # Opcional: solo para llamar a /api/admin desde scripts (la web usa la sesión del login)"
     echo "   -------------------------------------------------------------------------"
     echo "3. Accede a Portainer por primera vez para configurar el usuario administrador:"
     echo "   🌐 https://<IP_Raspberry>:$PORTAINER_PORT_HTTPS"
     echo "4. (Opcional pero recomendado) Dentro de Portainer, crea un usuario de API dedicado o un token de API si tu versión lo permite, con permisos solo para gestionar stacks/contenedores en el entorno relevante. Usa esas credenciales en el archivo .env en lugar de tu usuario/password principal."
     echo "5. Reinicia el servicio Flask después de crear/actualizar el .env:"
-    echo "   sudo systemctl restart flask.service"
+    echo "   sudo systemctl restart flask.service naspi-jobs.service"
     echo ""
     echo "Una vez completados los pasos finales, podrás acceder a:"
     echo "🌐 Tu NASPi App (React + Flask API): http://naspi.local (o la IP de tu Raspberry Pi)"
@@ -386,6 +430,7 @@ main() {
     setup_flask
     setup_react
     setup_flask_service
+    setup_jobs_service
     setup_nginx
     setup_logrotate
     # NOTA: La instalación de Portainer se hace antes de arrancar servicios principales
@@ -57,17 +57,37 @@ def get_telematic_info():
     
     return info
 #-----------------------------------------------------------------------------------------------------------------------------------
-# --> get_hardware_info() --> info:dict
-# Descripción: Función principal encargada de recabar la información del hardware y devolverla en forma de diccionario
-#-----------------------------------------------------------------------------------------------------------------------------------
-def get_hardware_info():
-    RAM_used_GB = round(psutil.virtual_memory()[3]/1000000000, 2) # Memoria RAM usada en GB
-    RAM=""+str(RAM_used_GB)+" GB ("+str(psutil.virtual_memory()[2])+"%)"
+# cpu_interval:float|None --> get_hardware_info() --> info:dict
+# Descripción: Función principal encargada de recabar la información del hardware y devolverla en forma de diccionario.
+# Con cpu_interval=None el uso de CPU se calcula respecto a la llamada anterior sin bloquear (lo usa metrics_sampler.py)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_hardware_info(cpu_interval=4):
+    return format_hardware_info(get_hardware_metrics(cpu_interval))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# cpu_interval:float|None --> get_hardware_metrics() --> metrics:dict
+# Descripción: Recaba los valores numéricos del hardware (CPU %, temperatura, RAM y disco RAID) sin formatear
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_hardware_metrics(cpu_interval=4):
+    memory = psutil.virtual_memory()
+    return dict(
+        cpu=psutil.cpu_percent(cpu_interval),
+        temp=get_cpu_temperature(),
+        ram_used=memory[3],
+        ram_percent=memory[2],
+        disk=get_disk(path=RAID_PATH)
+    )
+#-----------------------------------------------------------------------------------------------------------------------------------
+# metrics:dict --> format_hardware_info() --> info:dict
+# Descripción: Da a los valores de get_hardware_metrics() el formato de texto que espera el frontend
+#-----------------------------------------------------------------------------------------------------------------------------------
+def format_hardware_info(metrics):
+    RAM_used_GB = round(metrics["ram_used"]/1000000000, 2) # Memoria RAM usada en GB
+    RAM=""+str(RAM_used_GB)+" GB ("+str(metrics["ram_percent"])+"%)"
 
-    cpu_usage=str(psutil.cpu_percent(4))+" %"
-    cpu_Temp = get_cpu_temperature()
+    cpu_usage=str(metrics["cpu"])+" %"
+    cpu_Temp = metrics["temp"]
 
-    disk_stat=get_disk(path=RAID_PATH)
+    disk_stat=metrics["disk"]
 
     info = dict(used_CPU=cpu_usage,Temp_CPU=f"{cpu_Temp}°C",used_RAM=RAM,disk=str(disk_stat))
     
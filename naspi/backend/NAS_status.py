@@ -7,14 +7,97 @@
 #Librerias
 import psutil
 import re
+import os
+import time
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 # Lista de discos a monitorear (ajusta según tu configuración)
 DISKS = ["/mnt/raid/files"]
-DEVICES = ["/dev/sda", "/dev/sdb", "/dev/sdc"]
+DEFAULT_DEVICES = ["/dev/sda", "/dev/sdb", "/dev/sdc"]
+IGNORED_BLOCK_DEVICES = ("loop", "ram", "zram", "mmcblk", "md", "dm-", "sr", "nbd")  # No son discos del RAID
+
+SMART_TTL = 300             # Segundos que se reutiliza el estado SMART de cada disco
+SECTOR_SIZE = 512           # /proc/diskstats siempre cuenta sectores de 512 bytes
+PROBE_TIMEOUT = 15          # Segundos máximos por sonda (smartctl) antes de darla por colgada
+SPEED_PROBE_TIMEOUT = 30    # hdparm -t lee durante ~3 s, se le da más margen
+MAX_PARALLEL_PROBES = 4     # Sondas simultáneas como máximo
+
+_smart_cache = {}           # device -> (timestamp, estado)
+_smart_lock = threading.Lock()
+_device_types = {}          # device -> tipo para smartctl -d (solo detecciones que han llegado a ejecutarse)
 #-----------------------------------------------------------------------------------------------------------------------------------
 # FUNCIONES
 #-----------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> discover_devices() --> devices:list
+# Descripción: Descubre los discos a monitorizar. Primero busca los miembros de los arrays de /proc/mdstat (resolviendo
+# particiones a su disco); si no hay RAID, usa los discos físicos de /sys/block. Si no encuentra nada, usa DEFAULT_DEVICES.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _parent_disk(name):
+    """Devuelve el disco al que pertenece una partición (sda1 -> sda) usando /sys/class/block."""
+    if os.path.exists(f"/sys/class/block/{name}/partition"):
+        return os.path.basename(os.path.dirname(os.path.realpath(f"/sys/class/block/{name}")))
+    return name
+
+def discover_devices():
+    devices = set()
+    try:
+        with open("/proc/mdstat", "r") as f:
+            for line in f:
+                if line.startswith("md") and " : " in line:
+                    for member in re.findall(r"(\w+)\[\d+\]", line.split(" : ", 1)[1]):
+                        devices.add(_parent_disk(member))
+    except OSError:
+        pass
+
+    if not devices:
+        try:
+            for name in os.listdir("/sys/block"):
+                if not name.startswith(IGNORED_BLOCK_DEVICES) and os.path.exists(f"/sys/block/{name}/device"):
+                    devices.add(name)
+        except OSError:
+            pass
+
+    return [f"/dev/{name}" for name in sorted(devices)] or list(DEFAULT_DEVICES)
+
+DEVICES = discover_devices()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# cmd:list, timeout:float --> run_command() --> output:str
+# Descripción: Ejecuta un comando con tiempo máximo. Si se cuelga (p.ej. un puente USB-SATA que no responde) se le envía
+# SIGTERM, que sudo sí reenvía al comando, y después SIGKILL; se lanza subprocess.TimeoutExpired sin esperar más.
+# Si el comando termina con error se lanza subprocess.CalledProcessError como check_output.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def run_command(cmd, timeout=PROBE_TIMEOUT):
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        output, _ = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.terminate()
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=output)
+    return output
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# probe:callable, devices:list --> probe_devices() --> results:dict
+# Descripción: Ejecuta probe(device) para todos los dispositivos a la vez en un pool acotado. La latencia total pasa a ser
+# la de la sonda más lenta (acotada por su timeout) en lugar de la suma de todas.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def probe_devices(probe, devices=None):
+    devices = list(DEVICES if devices is None else devices)
+    if not devices:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(devices), MAX_PARALLEL_PROBES)) as pool:
+        return dict(zip(devices, pool.map(probe, devices)))
+
 #-----------------------------------------------------------------------------------------------------------------------------------
 # --> get_disk_usage() --> usage:dict
 # Descripción: Obtiene el uso de cada disco (total, usado, libre y porcentaje de uso).
@@ -33,72 +116,123 @@ def get_disk_usage():
 # --> get_disk_temperature() --> temperatures:dict
 # Descripción: Obtiene la temperatura de cada disco SSD usando smartctl.
 #-----------------------------------------------------------------------------------------------------------------------------------
-def get_disk_temperature():
-    temperatures = {}
-    for device in DEVICES:
-        try:
-            # Ejecutar smartctl con -d sat por si es USB
-            temp_output = subprocess.check_output(f"smartctl -A -d sat {device}", shell=True).decode()
+def get_device_temperature(device):
+    try:
+        # Ejecutar smartctl con -d sat por si es USB
+        temp_output = run_command(["smartctl", "-A", "-d", "sat", device])
 
-            # Buscar la línea de temperatura usando regex
-            match = re.search(r"Temperature.*?(\d+)\s*C", temp_output)
+        # Buscar la línea de temperatura usando regex
+        match = re.search(r"Temperature.*?(\d+)\s*C", temp_output)
+        
+        if match:
+            temp_value = int(match.group(1))  # Extraer el número correcto
+            return f"{temp_value}°C"
+        else:
+            return "No se encontró temperatura en SMART"
             
-            if match:
-                temp_value = int(match.group(1))  # Extraer el número correcto
-                temperatures[device] = f"{temp_value}°C"
-            else:
-                temperatures[device] = "No se encontró temperatura en SMART"
-                
-        except Exception as e:
-            temperatures[device] = f"Error: {e} (Posible falta de soporte SMART en USB)"
+    except subprocess.TimeoutExpired:
+        return "Error: smartctl no respondió a tiempo"
+    except Exception as e:
+        return f"Error: {e} (Posible falta de soporte SMART en USB)"
 
-    return temperatures
+def get_disk_temperature():
+    return probe_devices(get_device_temperature)
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 # --> get_smart_status() --> smart_status:dict
 # Descripción: Verifica el estado SMART de cada disco y devuelve "Healthy" o "Warning".
 #-----------------------------------------------------------------------------------------------------------------------------------
 def detect_device_type(device):
-    """Intenta detectar el tipo de dispositivo correcto para smartctl."""
+    """Intenta detectar el tipo de dispositivo correcto para smartctl. El resultado se memoriza por dispositivo, salvo si
+    smartctl falla o no responde: entonces se usa "auto" y se vuelve a intentar en la siguiente consulta."""
+    if device in _device_types:
+        return _device_types[device]
     try:
-        output = subprocess.check_output(["sudo", "smartctl", "-i", device], text=True, stderr=subprocess.STDOUT)
-        if "SATA" in output or "ATA" in output:
-            return "sat"
-        elif "SCSI" in output or "NVMe" in output:
-            return "scsi"
-        else:
-            return "auto"  # Usa auto si no se detecta claramente
-    except subprocess.CalledProcessError:
+        output = run_command(["sudo", "smartctl", "-i", device])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         return "auto"
+    if "SATA" in output or "ATA" in output:
+        device_type = "sat"
+    elif "SCSI" in output or "NVMe" in output:
+        device_type = "scsi"
+    else:
+        device_type = "auto"  # Usa auto si no se detecta claramente
+    _device_types[device] = device_type
+    return device_type
+
+def get_device_smart_status(device):
+    device_type = detect_device_type(device)  # Detecta tipo de dispositivo
+    try:
+        status_output = run_command(["sudo", "smartctl", "-H", "-d", device_type, device])
+        if "SMART Health Status: OK" in status_output:
+            return "Healthy"
+        else:
+            return "Warning"
+    except subprocess.CalledProcessError as e:
+        return f"Error: {e.output.strip()}"
+    except subprocess.TimeoutExpired:
+        return "Error: smartctl no respondió a tiempo"
+    except Exception as e:
+        return f"Unexpected Error: {str(e)}"
 
-def get_smart_status():
+def get_smart_status(max_age=SMART_TTL):
     smart_status = {}
+    expired = []
+    now = time.time()
 
-    for device in DEVICES:
-        device_type = detect_device_type(device)  # Detecta tipo de dispositivo
-        try:
-            status_output = subprocess.check_output(
-                ["sudo", "smartctl", "-H", "-d", device_type, device],
-                text=True, stderr=subprocess.STDOUT
-            )
-            if "SMART Health Status: OK" in status_output:
-                smart_status[device] = "Healthy"
+    with _smart_lock:
+        for device in DEVICES:
+            cached = _smart_cache.get(device)
+            if cached and now - cached[0] < max_age:
+                smart_status[device] = cached[1]
             else:
-                smart_status[device] = "Warning"
-        except subprocess.CalledProcessError as e:
-            smart_status[device] = f"Error: {e.output.strip()}"
-        except Exception as e:
-            smart_status[device] = f"Unexpected Error: {str(e)}"
+                expired.append(device)
+
+    # Solo se consultan (en paralelo) los discos cuya entrada ha caducado
+    for device, status in probe_devices(get_device_smart_status, expired).items():
+        with _smart_lock:
+            _smart_cache[device] = (time.time(), status)
+        smart_status[device] = status
+
+    return {device: smart_status[device] for device in DEVICES}
 
-    return smart_status
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> read_diskstats() --> stats:dict
+# Descripción: Lee de /proc/diskstats los bytes leídos y escritos acumulados por cada dispositivo de DEVICES.
+# Es una lectura pasiva del kernel: no genera ninguna E/S en los discos.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_diskstats():
+    names = {os.path.basename(device): device for device in DEVICES}
+    stats = {}
+    with open("/proc/diskstats", "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 10 and fields[2] in names:
+                stats[names[fields[2]]] = (int(fields[5]) * SECTOR_SIZE, int(fields[9]) * SECTOR_SIZE)
+    return stats
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# previous:dict, current:dict, elapsed:float --> get_disk_throughput() --> throughput:dict
+# Descripción: Calcula la velocidad de lectura/escritura (MB/s) de cada disco entre dos lecturas de read_diskstats()
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_disk_throughput(previous, current, elapsed):
+    throughput = {}
+    for device, (read_bytes, written_bytes) in current.items():
+        prev_read, prev_written = previous.get(device, (read_bytes, written_bytes))
+        throughput[device] = {
+            "read": round(max(read_bytes - prev_read, 0) / elapsed / 1e6, 2),
+            "write": round(max(written_bytes - prev_written, 0) / elapsed / 1e6, 2),
+        }
+    return throughput
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 # device:str --> get_disk_speed(device:str) --> speed_line
-# Descripción: Mide la velocidad de lectura de cada disco usando hdparm.
+# Descripción: Mide la velocidad de lectura de cada disco usando hdparm. Es un benchmark activo que lee del disco durante
+# varios segundos, por lo que solo se usa a mano desde la línea de comandos (la API usa read_diskstats()).
 #-----------------------------------------------------------------------------------------------------------------------------------
 def get_disk_speed(device):
     try:
-        speed_output = subprocess.check_output(f"sudo hdparm -t {device}", shell=True).decode()
+        speed_output = run_command(["sudo", "hdparm", "-t", device], timeout=SPEED_PROBE_TIMEOUT)
         speed_line = [line for line in speed_output.split("\n") if "MB/sec" in line]
 
         if speed_line:
@@ -115,5 +249,5 @@ if __name__ == "__main__":
     print("📌 Disk Usage:", get_disk_usage())
     print("🌡️ Temperatures:", get_disk_temperature())
     print("✅ SMART Status:", get_smart_status())
-    for dev in DEVICES:
-        print(f"⚡ Speed {dev}:", get_disk_speed(dev))
+    for dev, speed in probe_devices(get_disk_speed).items():
+        print(f"⚡ Speed {dev}:", speed)
@@ -1,24 +1,40 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from functools import wraps
-from werkzeug.utils import secure_filename
 import time
+from datetime import datetime
 import os
+import errno
 import subprocess
 import json
-import uuid
+import hmac
 import bcrypt
-import Info_checker as info
-import NAS_status as NASStatus
-import shutil  # Importamos shutil para eliminar carpetas
+import metrics_sampler
+import event_bus
+import file_transfer
+import upload_sessions
+import checksum_index
+import dir_listing
+import fs_hooks
+import search_index
+import usage_index
+import job_engine
+import archive_stream
+import thumbnails
+import dedup_index
+import user_store
+import sessions
+from fs_cache import CACHE as fs_cache
+import shutil
 import traceback  # Esto ayuda a capturar errores detallados
+from urllib.parse import unquote
 
 app = Flask(__name__)
-CORS(app, origins="http://naspi.local", supports_credentials=True, methods=["GET", "POST", "DELETE"], allow_headers=["Content-Type", "X-Admin-API-Key"])
+CORS(app, origins="http://naspi.local", supports_credentials=True, methods=["GET", "POST", "PUT", "DELETE"], allow_headers=["Content-Type", "Authorization", "X-Admin-API-Key", "X-Filename", "X-Upload-Offset", "X-Chunk-SHA256", "X-Content-SHA256"])
 
 # Configuración del sistema de archivos
-RAID_PATH = "/mnt/raid/files"
-CHUNK_UPLOAD_DIR = "/mnt/raid/tmp_chunks"  # Carpeta temporal
+RAID_PATH = fs_hooks.RAID_PATH
+CHUNK_UPLOAD_DIR = upload_sessions.SESSIONS_DIR  # Carpeta temporal
 portainer_manager = None
 has_attempted_restart = False
 
@@ -28,14 +44,6 @@ if not os.path.exists(RAID_PATH):
 if not os.path.exists(CHUNK_UPLOAD_DIR):
     os.makedirs(CHUNK_UPLOAD_DIR)
 
-# Configuración del archivo de usuarios
-USERS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'users.json')
-
-if not os.path.exists(USERS_FILE):
-    os.makedirs(os.path.dirname(USERS_FILE), exist_ok=True)
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump([], f, indent=2)
-
 ALLOWED_EXTENSIONS = {
     'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 
     'ppt', 'pptx', 'zip', 'rar', '7z', 'tar', 'gz', 'tar.gz', 'mp4', 'avi', 'mkv', 'mov', 'wmv'
@@ -43,20 +51,38 @@ ALLOWED_EXTENSIONS = {
 
 app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024 * 1024  # 20GB
 
-# Utilidades de usuario
-def read_users():
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def save_users(users):
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, indent=2)
+# Muestreo de métricas en segundo plano (un único worker por host toma las muestras)
+metrics_sampler.start()
+# Rastreo periódico del RAID para el índice de búsqueda (también un único worker por host, con prioridad mínima)
+search_index.start_crawler(RAID_PATH)
+# Reconstrucción periódica del índice de uso de disco por carpeta (ídem)
+usage_index.start_reconciler(RAID_PATH)
+thumbnails.start_sweeper()
+dedup_index.start_scanner(RAID_PATH)
 
+# Utilidades de usuario (los usuarios se guardan en user_store.py)
 def hash_password(password):
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def check_password(password, hashed):
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+# Usuario de la sesión de la petición (cookie o cabecera Authorization: Bearer), o None
+def current_user():
+    token = request.cookies.get(sessions.COOKIE_NAME)
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        token = auth[7:].strip()
+    return sessions.verify(token)
+
+
+# Guarda en el índice de checksums el digest calculado al subir un fichero (path relativo a RAID_PATH)
+def record_checksum(path, algorithm, digest, chunk_size=None):
+    path = os.path.normpath(path.strip('/'))
+    try:
+        checksum_index.record(path, os.stat(os.path.join(RAID_PATH, path)), algorithm, digest, chunk_size)
+    except Exception as e:
+        print(f"[WARN] No se pudo guardar el checksum de {path}: {e}")
 #------------------------------------------------------------------------------------------------------------------
 # Ruta para reiniciar NASPi
 # POST:method --> /api/reboot
@@ -82,22 +108,122 @@ def shutdown():
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
 # Ruta para listar archivos
-# GET:method --> /api/files --> files
+# GET:method, path, sort, order, offset, limit --> /api/files --> {entries, files, folders, total, nextOffset}
 #------------------------------------------------------------------------------------------------------------------
 # Rutas API
 @app.route('/api/files', methods=['GET'])
 def list_files():
     try:
         current_path = request.args.get('path', '').strip('/')
-        directory = os.path.join(RAID_PATH, current_path)
+        directory = file_transfer.safe_path(RAID_PATH, current_path)
+        if directory is None:
+            return jsonify({"error": "Ruta no permitida"}), 403
 
-        if not os.path.exists(directory) or not os.path.isdir(directory):
+        if not os.path.isdir(directory):
             return jsonify({"error": "Directorio no encontrado"}), 404
 
-        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-        folders = [f for f in os.listdir(directory) if os.path.isdir(os.path.join(directory, f))]
+        sort = request.args.get('sort', 'name')
+        order = request.args.get('order', 'asc')
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+
+        # Listado desde la caché en memoria (sin tocar los discos); si no se puede cachear se lee el directorio
+        cached = fs_cache.get(directory)
+        if cached is not None:
+            version, entries = cached
+            etag = f"{version}-{sort}-{order}-{offset}-{limit}"
+        else:
+            entries = None
+            etag = dir_listing.directory_etag(directory, sort, order, offset, limit)
+
+        # Si el directorio no ha cambiado desde la última consulta el cliente reutiliza su copia
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers={"ETag": f'W/"{etag}"'})
+
+        listing = dir_listing.list_directory(directory, sort, order, offset, limit, entries)
+        files = [e["name"] for e in listing["entries"] if e["type"] == "file"]
+        folders = [e["name"] for e in listing["entries"] if e["type"] == "folder"]
+
+        response = jsonify(dict(listing, files=files, folders=folders, path=current_path))
+        response.headers["ETag"] = f'W/"{etag}"'
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para buscar archivos y carpetas por nombre en todo el RAID (ver search_index.py)
+# GET:method, q, type, min_size, modified_after, path, limit, offset --> /api/search --> {results, took_ms}
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/search', methods=['GET'])
+def search_files():
+    try:
+        started = time.perf_counter()
+        min_size = request.args.get('min_size')
+        modified_after = request.args.get('modified_after')
+        results = search_index.search(
+            request.args.get('q', ''),
+            kind=request.args.get('type') or None,
+            min_size=int(min_size) if min_size else None,
+            modified_after=parse_timestamp(modified_after) if modified_after else None,
+            path=request.args.get('path', ''),
+            limit=int(request.args.get('limit', 50)),
+            offset=int(request.args.get('offset', 0)),
+        )
+        return jsonify({"results": results, "took_ms": round((time.perf_counter() - started) * 1000, 1)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Acepta un timestamp Unix o una fecha ISO 8601 (2024-05-01, 2024-05-01T10:00:00)
+def parse_timestamp(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para consultar qué ocupa cada carpeta del RAID (ver usage_index.py)
+# GET:method, path, depth --> /api/storage/usage --> {usage, filesystem}
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/storage/usage', methods=['GET'])
+def storage_usage():
+    try:
+        current_path = request.args.get('path', '').strip('/')
+        depth = int(request.args.get('depth', 1))
+        if not usage_index.is_built():
+            return jsonify({"error": "El índice de uso se está construyendo"}), 503, {"Retry-After": "60"}
+
+        tree = usage_index.usage(current_path, depth)
+        if tree is None:
+            return jsonify({"error": "Directorio no encontrado"}), 404
 
-        return jsonify({"files": files, "folders": folders, "path": current_path})
+        disk = shutil.disk_usage(RAID_PATH)
+        return jsonify({
+            "usage": tree,
+            "filesystem": {"total": disk.total, "used": disk.used, "free": disk.free},
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para consultar los ficheros duplicados del RAID y el espacio que se recuperaría (ver dedup_index.py). Para
+# deduplicarlos se lanza un trabajo: POST /api/jobs {"type": "dedup", "params": {"sets": [...], "mode": "hardlink"}}
+# GET:method, min_size, limit, offset --> /api/storage/duplicates --> {sets, totalSets, reclaimableBytes, lastScan}
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/storage/duplicates', methods=['GET'])
+def storage_duplicates():
+    try:
+        if not dedup_index.is_built():
+            return jsonify({"error": "La búsqueda de duplicados aún no ha terminado"}), 503, {"Retry-After": "3600"}
+        min_size = int(request.args.get('min_size', 0))
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        offset = max(0, int(request.args.get('offset', 0)))
+        return jsonify(dedup_index.duplicates(min_size, limit, offset))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
@@ -107,14 +233,8 @@ def list_files():
 # Rutas API
 @app.route('/api/nas_status', methods=['GET'])
 def NAS_Status():
-    DEVICES = ["/dev/sda", "/dev/sdb", "/dev/sdc"]
     try:
-        ssd_status = NASStatus.get_smart_status()
-        dev_speed = []
-        for dev in DEVICES:
-            dev_speed.append(NASStatus.get_disk_speed(dev))
-    
-        dev_info = dict(status=ssd_status,speed=dev_speed)
+        dev_info = metrics_sampler.get_nas_status()
         return jsonify(dev_info)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -129,28 +249,58 @@ def login():
         username = data.get("username")
         password = data.get("password")
 
-        users = read_users()
-        user = next((u for u in users if u["username"] == username), None)
+        user = user_store.get_by_username(username)
 
-        # Comparar contraseñas sin hash
+        # bcrypt solo aquí: las siguientes peticiones presentan el token de sesión
         if user and check_password(password,user["password"]):
-            return jsonify({
+            token, expires = sessions.create_session(user)
+            response = jsonify({
                 "message": "Login successful",
                 "user": {
                     "id": user["id"],
                     "username": user["username"],
                     "role": user["role"]
-                }
+                },
+                "token": token,
+                "expiresAt": expires
             })
+            response.set_cookie(sessions.COOKIE_NAME, token, max_age=sessions.SESSION_TTL, httponly=True,
+                                samesite="Strict", secure=request.is_secure)
+            return response
         else:
             return jsonify({"message": "Invalid credentials"}), 401
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
+# Ruta para cerrar la sesión actual
+# POST:method --> /api/logout --> revocar sesión
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    try:
+        user = current_user()
+        if user:
+            sessions.revoke(user["sessionId"])
+        response = jsonify({"message": "Logged out"})
+        response.delete_cookie(sessions.COOKIE_NAME, samesite="Strict")
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para consultar la sesión actual (el frontend la usa para restaurar el login al recargar)
+# GET:method --> /api/session --> user
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/session', methods=['GET'])
+def session_info():
+    user = current_user()
+    if user is None:
+        return jsonify({"message": "Not authenticated"}), 401
+    return jsonify({"user": {"id": user["id"], "username": user["username"], "role": user["role"]}})
+#------------------------------------------------------------------------------------------------------------------
 # Ruta para gestionar users
-# GET:method, users.json --> /api/users --> user
-# DELETE:method, user --> /api/users --> users.json
-# POST:method, user --> /api/users --> users.json
+# GET:method --> /api/users --> users
+# DELETE:method, user --> /api/users --> user_store
+# POST:method, user --> /api/users --> user_store
 #------------------------------------------------------------------------------------------------------------------
 @app.route('/api/users', methods=['GET', 'POST', 'DELETE'])
 def users():
@@ -161,44 +311,36 @@ def users():
             password = data.get("password")
             role = data.get("role", "user")
 
-            users = read_users()
-            if any(user["username"] == username for user in users):
+            if not username or not password:
+                return jsonify({"message": "Username and password are required"}), 400
+            if user_store.get_by_username(username):
                 return jsonify({"message": "Username already exists"}), 400
 
-            new_user = {
-                "id": str(uuid.uuid4()),
-                "username": username,
-                "password": hash_password(password),
-                "role": role
-            }
-
-            users.append(new_user)
-            save_users(users)
+            try:
+                user_store.add_user(username, hash_password(password), role)
+            except user_store.UserExistsError:
+                # Otro worker ha creado el mismo usuario entre la comprobación y la inserción
+                return jsonify({"message": "Username already exists"}), 400
 
             return jsonify({"message": "User added successfully"}), 201
 
         elif request.method == 'GET':
-            users = read_users()
-            safe_users = [{"id": user["id"], "username": user["username"], "role": user["role"]} for user in users]
-            return jsonify(safe_users), 200
+            return jsonify(user_store.list_users()), 200
 
         elif request.method == 'DELETE':
             user_id = request.args.get("id")
             if not user_id:
                 return jsonify({"message": "Valid user ID is required"}), 400
 
-            users = read_users()
-            updated_users = [user for user in users if user["id"] != user_id]
-
-            if len(updated_users) == len(users):
+            if not user_store.delete_user(user_id):
                 return jsonify({"message": "User not found"}), 404
+            sessions.revoke_user(user_id)
 
-            save_users(updated_users)
             return jsonify({"message": "User deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
-# Ruta para descargar un archivo
+# Ruta para descargar un archivo (con Range/If-Range, ETag y Last-Modified; ver file_transfer.py)
 # GET:method --> /api/files/<filename> --> file
 # DELETE:method --> /api/files/<filename> --> Eliminar archivo
 #------------------------------------------------------------------------------------------------------------------
@@ -208,9 +350,21 @@ def file_operations(filename):
 
     if request.method == 'GET':
         try:
-            dir_path = os.path.dirname(filename)  # Extraer la carpeta del archivo
-            file_name = os.path.basename(filename)  # Extraer solo el nombre del archivo
-            return send_from_directory(os.path.join(RAID_PATH, dir_path), file_name, as_attachment=True)
+            download_path = file_transfer.safe_path(RAID_PATH, filename)
+            if download_path is None:
+                return jsonify({"error": "Ruta no permitida"}), 403
+            if not os.path.isfile(download_path):
+                return jsonify({"error": "Archivo no encontrado"}), 404
+
+            # Si el fichero conserva el checksum calculado al subirlo se usa como ETag y cabecera Digest (también con
+            # X-Accel-Redirect: Nginx copia ambas cabeceras de esta respuesta, ver file_transfer.py)
+            rel_path = os.path.relpath(download_path, os.path.realpath(RAID_PATH))
+            checksum = checksum_index.lookup(rel_path, os.stat(download_path))
+            if checksum is None:
+                return file_transfer.send_file(download_path, rel_path)
+            response = file_transfer.send_file(download_path, rel_path, etag=checksum["digest"])
+            response.headers["Digest"] = checksum_index.digest_header(checksum)
+            return response
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -219,12 +373,144 @@ def file_operations(filename):
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
+                fs_hooks.file_changed("deleted", filename)
                 return jsonify({"message": "Archivo eliminado con éxito"}), 200
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
         else:
             return jsonify({"error": "Archivo no encontrado"}), 404
 #------------------------------------------------------------------------------------------------------------------
+# Ruta para obtener la miniatura de una imagen o vídeo (ver thumbnails.py)
+# GET:method, size, v --> /api/thumbnail/<path> --> image/jpeg
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/thumbnail/<path:filename>', methods=['GET'])
+def thumbnail(filename):
+    try:
+        path = file_transfer.safe_path(RAID_PATH, filename)
+        if path is None:
+            return jsonify({"error": "Ruta no permitida"}), 403
+        if not os.path.isfile(path):
+            return jsonify({"error": "Archivo no encontrado"}), 404
+
+        size = request.args.get('size', thumbnails.DEFAULT_SIZE, type=int)
+        rel_path = os.path.relpath(path, os.path.realpath(RAID_PATH))
+        thumb_path, key = thumbnails.get_thumbnail(path, rel_path, size)
+
+        etag = f'"{key[:32]}-{thumbnails.snap_size(size)}"'
+        # Con ?v= (la fecha de modificación del fichero) la URL cambia si cambia el fichero: se puede cachear sin revalidar
+        cache_control = "private, max-age=31536000, immutable" if request.args.get('v') else "private, max-age=86400"
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+        with open(thumb_path, 'rb') as f:
+            return Response(f.read(), mimetype='image/jpeg', headers=headers)
+    except thumbnails.ThumbnailError as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para descargar una carpeta o varias rutas como un único archivo ZIP (ZIP64) o tar generado al vuelo
+# GET:method, path (repetible), format, name --> /api/archive --> stream application/zip | application/x-tar
+# POST:method, {paths, format, name} --> /api/archive (para selecciones demasiado largas para la URL)
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/archive', methods=['GET', 'POST'])
+def download_archive():
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or request.form.to_dict(flat=False)
+            rel_paths = data.get("paths", [])
+            fmt = data.get("format", "zip")
+            name = data.get("name")
+            if isinstance(fmt, list):  # Formulario HTML: cada campo llega como lista
+                fmt, name = fmt[0], (name or [None])[0]
+        else:
+            rel_paths = request.args.getlist('path')
+            fmt = request.args.get('format', 'zip')
+            name = request.args.get('name')
+
+        if fmt not in archive_stream.FORMATS:
+            return jsonify({"error": f"format debe ser uno de: {', '.join(archive_stream.FORMATS)}"}), 400
+        if isinstance(rel_paths, str):
+            rel_paths = [rel_paths]
+        if not rel_paths:
+            return jsonify({"error": "Falta path"}), 400
+
+        paths = []
+        for rel_path in rel_paths:
+            path = file_transfer.safe_path(RAID_PATH, rel_path)
+            if path is None:
+                return jsonify({"error": "Ruta no permitida"}), 403
+            if not os.path.exists(path):
+                return jsonify({"error": f"No encontrado: {rel_path}"}), 404
+            paths.append(path)
+
+        if not name:
+            name = os.path.basename(paths[0]) if len(paths) == 1 else "NASPi"
+        filename = f"{name or 'NASPi'}.{fmt}"
+
+        # Sin Content-Length (el tamaño final no se conoce hasta terminar): se envía por bloques según se genera
+        return Response(stream_with_context(archive_stream.stream_archive(paths, fmt)),
+                        mimetype=archive_stream.MIMETYPES[fmt], headers={
+            "Content-Disposition": file_transfer.content_disposition(filename),
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",  # Nginx no debe acumular el archivo antes de enviarlo
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para mover (o renombrar) archivos y carpetas dentro del RAID
+# POST:method, {sources, destination, name} --> /api/files/move --> 200 {moved} | 202 job si hay que copiar entre discos
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/files/move', methods=['POST'])
+def move_files():
+    try:
+        data = request.get_json(silent=True) or {}
+        params = job_engine.validate("move", {"sources": data.get("sources"), "destination": data.get("destination", ""),
+                                              "name": data.get("name")})
+        sources, destination = params["sources"], params["destination"]
+        name = params.get("name")  # Nuevo nombre (solo con un origen)
+
+        targets = [os.path.join(destination, name or os.path.basename(src)) for src in sources]
+        for src, target in zip(sources, targets):
+            if src != target and os.path.lexists(os.path.join(RAID_PATH, target)):
+                return jsonify({"error": f"Ya existe: {target}", "path": target}), 409
+
+        # Mismo sistema de ficheros: rename atómico, sin copiar datos
+        moved = []
+        for index, (src, target) in enumerate(zip(sources, targets)):
+            try:
+                os.rename(os.path.join(RAID_PATH, src), os.path.join(RAID_PATH, target))
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Distinto disco (p.ej. un punto de montaje dentro del RAID): el resto se mueve como trabajo
+                job = job_engine.submit("move", {"sources": sources[index:], "destination": destination, "name": name})
+                return job_accepted(job, "Moviendo en segundo plano")
+            fs_hooks.file_changed("moved_from", src)
+            fs_hooks.file_changed("moved_to", target)
+            moved.append(target)
+
+        return jsonify({"message": "Movido correctamente", "moved": moved}), 200
+    except job_engine.JobError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para copiar archivos y carpetas dentro del RAID. La copia (reflink o copy_file_range cuando se puede, ver
+# file_copy.py) se hace como trabajo en segundo plano con progreso
+# POST:method, {sources, destination} --> /api/files/copy --> 202 job
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/files/copy', methods=['POST'])
+def copy_files():
+    try:
+        data = request.get_json(silent=True) or {}
+        job = job_engine.submit("copy", {"sources": data.get("sources"), "destination": data.get("destination", "")})
+        return job_accepted(job, "Copiando en segundo plano")
+    except job_engine.JobError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
 # Ruta para subir un archivo
 # POST:method, file --> /api/files
 #------------------------------------------------------------------------------------------------------------------
@@ -234,6 +520,10 @@ def allowed_file(filename):
 @app.route('/api/upload', methods=['POST'])
 def upload():
     try:
+        # Fichero único como cuerpo crudo: nombre en X-Filename (codificado como URL) y carpeta en ?path=
+        if request.mimetype == 'application/octet-stream':
+            return upload_raw()
+
         if 'files' not in request.files:
             return jsonify({"message": "No file part"}), 400
 
@@ -250,15 +540,35 @@ def upload():
         for file in files:
             if file.filename == '':
                 continue
-            filepath = os.path.join(upload_dir, file.filename)
-            file.save(filepath)
+            # Se copia calculando el SHA-256 al vuelo (sin volver a leer el fichero del RAID)
+            digest = upload_sessions.store_stream(file.stream, upload_dir, file.filename,
+                                                  app.config['MAX_CONTENT_LENGTH'])
+            record_checksum(os.path.join(current_path, file.filename), checksum_index.ALGORITHM_SHA256, digest)
             uploaded_files.append(file.filename)
+            fs_hooks.file_changed("uploaded", os.path.join(current_path, file.filename))
 
         return jsonify({"message": "Files uploaded successfully", "files": uploaded_files})
 
+    except upload_sessions.UploadError as e:
+        return upload_error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def upload_raw():
+    current_path = request.args.get('path', '').strip('/')
+    filename = unquote(request.headers.get('X-Filename', ''))
+    upload_dir = file_transfer.safe_path(RAID_PATH, current_path)
+    if upload_dir is None:
+        return jsonify({"error": "Ruta no permitida"}), 403
+
+    limit = request.content_length if request.content_length is not None else app.config['MAX_CONTENT_LENGTH']
+    digest = upload_sessions.store_stream(request.stream, upload_dir, filename, limit,
+                                          request.headers.get('X-Content-SHA256'), request.content_length)
+    record_checksum(os.path.join(current_path, filename), checksum_index.ALGORITHM_SHA256, digest)
+
+    fs_hooks.file_changed("uploaded", os.path.join(current_path, filename))
+    return jsonify({"message": "Files uploaded successfully", "files": [filename], "sha256": digest})
+
 @app.route('/api/upload_chunk', methods=['POST'])
 def upload_chunk():
     try:
@@ -281,6 +591,7 @@ def upload_chunk():
         # Verificar si es el último chunk
         if chunk_index == total_chunks - 1:
             os.rename(temp_filename, final_filename)
+            fs_hooks.file_changed("uploaded", os.path.join(current_path, filename))
             return jsonify({"message": "Archivo subido completamente."}), 200
 
         return jsonify({"message": f"Chunk {chunk_index + 1} recibido."}), 200
@@ -323,6 +634,98 @@ def cancel_upload():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
+# Rutas de sesiones de subida (ver upload_sessions.py). Sustituyen a /api/upload_chunk: los chunks se pueden enviar
+# en paralelo, en cualquier orden y repetidos, y la subida se puede reanudar consultando los que faltan.
+# POST:method, {filename, path, size, chunkSize} --> /api/uploads --> {sessionId, chunkSize, totalChunks}
+# GET:method --> /api/uploads/<id> --> {receivedChunks, missing, ...}
+# PUT:method, chunk (octet-stream o multipart), X-Chunk-SHA256 --> /api/uploads/<id>/chunks/<index>
+# POST:method, {sha256Tree} --> /api/uploads/<id>/complete
+# DELETE:method --> /api/uploads/<id>
+#------------------------------------------------------------------------------------------------------------------
+def upload_error_response(e):
+    return jsonify(dict(e.extra, error=str(e))), e.status_code
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    try:
+        data = request.get_json() or {}
+        current_path = (data.get('path') or '').strip('/')
+        upload_dir = file_transfer.safe_path(RAID_PATH, current_path)
+        if upload_dir is None:
+            return jsonify({"error": "Ruta no permitida"}), 403
+
+        session = upload_sessions.create_session(
+            upload_dir, current_path, data.get('filename', ''), int(data.get('size', -1)),
+            int(data.get('chunkSize') or upload_sessions.DEFAULT_CHUNK_SIZE))
+        return jsonify(upload_sessions.session_status(session)), 201
+
+    except upload_sessions.UploadError as e:
+        return upload_error_response(e)
+    except ValueError:
+        return jsonify({"error": "Tamaño no válido"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<session_id>', methods=['GET', 'DELETE'])
+def upload_session(session_id):
+    try:
+        session = upload_sessions.load_session(session_id)
+        if request.method == 'GET':
+            return jsonify(upload_sessions.session_status(session)), 200
+
+        upload_sessions.cancel_session(session)
+        return jsonify({"message": f"Subida de '{session['filename']}' cancelada."}), 200
+
+    except upload_sessions.UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<session_id>/chunks/<int:chunk_index>', methods=['PUT', 'POST'])
+def upload_session_chunk(session_id, chunk_index):
+    try:
+        session = upload_sessions.load_session(session_id)
+
+        # Cuerpo crudo (application/octet-stream): se vuelca de request.stream al RAID sin pasar por el parser multipart
+        if request.mimetype == 'application/octet-stream':
+            offset, length = upload_sessions.chunk_bounds(session, chunk_index)
+            if request.content_length is not None and request.content_length != length:
+                return jsonify({"error": f"El chunk {chunk_index} debe medir {length} bytes"}), 400
+            if request.headers.get('X-Upload-Offset', str(offset)) != str(offset):
+                return jsonify({"error": f"El chunk {chunk_index} empieza en el byte {offset}"}), 400
+            stream = request.stream
+        elif 'chunk' in request.files:
+            stream = request.files['chunk'].stream
+        else:
+            return jsonify({"error": "Falta el chunk"}), 400
+
+        written, digest = upload_sessions.write_chunk(session, chunk_index, stream,
+                                                      request.headers.get('X-Chunk-SHA256'))
+        return jsonify({"chunk": chunk_index, "size": written, "sha256": digest}), 200
+
+    except upload_sessions.UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"[ERROR] Fallo en subida de chunk: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    try:
+        session = upload_sessions.load_session(session_id)
+        data = request.get_json(silent=True) or {}
+        digest = upload_sessions.complete_session(session, data.get('sha256Tree'))
+        rel_path = os.path.join(session['path'], session['filename'])
+        record_checksum(rel_path, checksum_index.ALGORITHM_SHA256_TREE, digest, session['chunk_size'])
+        fs_hooks.file_changed("uploaded", rel_path)
+        return jsonify({"message": "Archivo subido completamente.", "file": session['filename'],
+                        "sha256Tree": digest, "chunkSize": session['chunk_size']}), 200
+
+    except upload_sessions.UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
 # Ruta para crear una carpeta
 # POST:method, name:string --> /api/create_folder
 #------------------------------------------------------------------------------------------------------------------
@@ -338,6 +741,7 @@ def create_folder():
 
         folder_path = os.path.join(RAID_PATH, current_path, folder_name) if current_path else os.path.join(RAID_PATH, folder_name)
         os.makedirs(folder_path, exist_ok=True)
+        fs_hooks.file_changed("folder_created", os.path.join(current_path, folder_name))
 
         return jsonify({"message": f"Carpeta '{folder_name}' creada en '{current_path}'", "folder": folder_name})
 
@@ -358,34 +762,130 @@ def delete_folder(foldername):
         return jsonify({"error": "No es una carpeta válida"}), 400
 
     try:
-        shutil.rmtree(folder_path)  # 🔥 Elimina la carpeta y todo su contenido
-        return jsonify({"message": f"Carpeta eliminada correctamente: {foldername}"}), 200
+        # El borrado recursivo puede tardar minutos: se encola y se responde al momento (ver job_engine.py)
+        job = job_engine.submit("delete", {"paths": [foldername]})
+        return job_accepted(job, f"Eliminando carpeta en segundo plano: {foldername}")
+
+    except job_engine.JobError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Trabajos en segundo plano (borrado, copia, movimiento y archivado; ver job_engine.py)
+# POST:method, type, params --> /api/jobs --> 202 + job
+# GET:method, status --> /api/jobs --> [job, ...]
+#------------------------------------------------------------------------------------------------------------------
+def job_accepted(job, message=None):
+    response = jsonify({"message": message or "Trabajo encolado", "jobId": job["id"], "job": job})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return response
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+def jobs():
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            if data.get("type") in job_engine.ADMIN_JOB_TYPES:
+                error = admin_auth_error()
+                if error is not None:
+                    return error
+            return job_accepted(job_engine.submit(data.get("type"), data.get("params", {})))
+
+        status = request.args.get('status')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        return jsonify({"jobs": job_engine.list_jobs(status, limit)})
+    except job_engine.JobError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Estado de un trabajo y cancelación
+# GET:method --> /api/jobs/<id> --> job
+# POST:method --> /api/jobs/<id>/cancel --> job
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    try:
+        job = job_engine.get_job(job_id)
+        if job is None:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    try:
+        job = job_engine.cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        return jsonify(job)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
 # Ruta para recoger datos de telematica
-# GET:method --> /api/telematic --> [ip,gateway,mask]]
+# GET:method --> /api/telematic --> [ip,gateway,mask,dns,timestamp]
 #------------------------------------------------------------------------------------------------------------------
 @app.route('/api/telematic', methods=['GET'])
 def get_telematic():
     try:
-        data = info.get_telematic_info()
+        data = metrics_sampler.get_telematic_info()
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 #------------------------------------------------------------------------------------------------------------------
 # Ruta para recoger datos de hardware
-# GET:method --> /api/hardware --> [CPU usada, Temp CPU, RAM usada, Uso del disco]]
+# GET:method --> /api/hardware --> [CPU usada, Temp CPU, RAM usada, Uso del disco, timestamp]
 #------------------------------------------------------------------------------------------------------------------
 @app.route('/api/hardware', methods=['GET'])
 def get_hardware():
     try:
-        data = info.get_hardware_info()
+        data = metrics_sampler.get_hardware_info()
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+#------------------------------------------------------------------------------------------------------------------
+# Ruta para recoger el histórico de una métrica de hardware
+# GET:method, metric, from, to, step --> /api/hardware/history --> [[timestamp, valor], ...]
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/hardware/history', methods=['GET'])
+def get_hardware_history():
+    try:
+        metric = request.args.get('metric', 'cpu')
+        end = float(request.args.get('to', time.time()))
+        start = float(request.args.get('from', end - 3600))
+        step = request.args.get('step', type=int)
+
+        if metric not in metrics_sampler.METRICS:
+            return jsonify({"error": f"Métrica no válida. Opciones: {', '.join(metrics_sampler.METRICS)}"}), 400
+
+        step, points = metrics_sampler.get_history(metric, start, end, step)
+        return jsonify({"metric": metric, "from": start, "to": end, "step": step, "points": points})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
     
+#------------------------------------------------------------------------------------------------------------------
+# Canal de eventos (Server-Sent Events) que sustituye al polling del frontend
+# GET:method --> /api/events --> stream text/event-stream (hardware, nas_status, services, files, jobs)
+#------------------------------------------------------------------------------------------------------------------
+@app.route('/api/events', methods=['GET'])
+def events():
+    def stream():
+        yield "retry: 3000\n\n"
+        for event in event_bus.subscribe():
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Nginx no debe acumular la respuesta
+    })
+
 #------------------------------------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------------------------------------
 
@@ -408,10 +908,10 @@ if backend_dir not in sys.path:
     sys.path.append(backend_dir)
 
 try:
-    from portainer_manager import PortainerManager
+    import portainer_supervisor
 except ImportError as e:
     print(f"Error al importar PortainerManager: {e}")
-    PortainerManager = None
+    portainer_supervisor = None
 
 PORTAINER_URL = os.getenv('PORTAINER_URL')
 PORTAINER_USERNAME = os.getenv('PORTAINER_USERNAME')
@@ -421,47 +921,57 @@ try:
 except (ValueError, TypeError):
     PORTAINER_ENVIRONMENT_ID = 1
 
+# La conexión con Portainer se supervisa en segundo plano (login, comprobaciones y reintentos con espera exponencial)
+if portainer_supervisor and all([PORTAINER_URL, PORTAINER_USERNAME, PORTAINER_PASSWORD]):
+    portainer_supervisor.start(PORTAINER_URL, PORTAINER_USERNAME, PORTAINER_PASSWORD, PORTAINER_ENVIRONMENT_ID)
+
+# Clave opcional para usar las rutas de administración desde scripts (el frontend usa la sesión del login)
 ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
-if not ADMIN_API_KEY or ADMIN_API_KEY == 'replace_with_a_secure_random_key':
-    print("Advertencia: ADMIN_API_KEY no configurada correctamente.")
+if ADMIN_API_KEY == 'replace_with_a_secure_random_key':
+    print("Advertencia: ADMIN_API_KEY tiene el valor de ejemplo; se ignora.")
+    ADMIN_API_KEY = None
 
 def is_admin(api_key):
-    return api_key is not None and ADMIN_API_KEY is not None and api_key == ADMIN_API_KEY
+    return api_key is not None and ADMIN_API_KEY is not None and hmac.compare_digest(api_key, ADMIN_API_KEY)
+
+# Respuesta de error si la petición no viene de un administrador: sesión de un usuario admin (el frontend) o
+# X-Admin-API-Key (scripts). None si está autorizada
+def admin_auth_error():
+    user = current_user()
+    if user is not None:
+        if user["role"] != "admin":
+            return jsonify({"success": False, "message": "Se requiere un usuario administrador"}), 403
+    elif not is_admin(request.headers.get('X-Admin-API-Key')):
+        return jsonify({"success": False, "message": "Autenticación requerida"}), 401
+    return None
 
 def require_admin(func):
-    from functools import wraps
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        admin_key = request.headers.get('X-Admin-API-Key')
-        if not is_admin(admin_key):
-            return jsonify({"success": False, "message": "Autenticación requerida"}), 401
+        error = admin_auth_error()
+        if error is not None:
+            return error
         return func(*args, **kwargs)
     return decorated_function
 
+# Rutas que necesitan Portainer: sin esperas dentro de la petición. Si no está disponible se responde 503 con Retry-After
 def check_portainer_manager(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
         global portainer_manager
 
-        max_retries = 5
-        delay = 2  # segundos entre intentos
-
-        if portainer_manager is None and PortainerManager and all([PORTAINER_URL, PORTAINER_USERNAME, PORTAINER_PASSWORD, ADMIN_API_KEY]):
-            for attempt in range(max_retries):
-                try:
-                    print(f"🔁 Intentando inicializar PortainerManager (intento {attempt + 1}/{max_retries})...")
-                    portainer_manager = PortainerManager(PORTAINER_URL, PORTAINER_USERNAME, PORTAINER_PASSWORD, PORTAINER_ENVIRONMENT_ID)
-                    print("✅ PortainerManager inicializado correctamente.")
-                    break
-                except Exception as e:
-                    print(f"⚠️ Fallo al inicializar PortainerManager: {e}")
-                    time.sleep(delay)
-
-        if portainer_manager is None:
+        if portainer_supervisor is None:
             return jsonify({"success": False, "message": "PortainerManager no está disponible"}), 503
+        try:
+            portainer_manager = portainer_supervisor.get_manager()
+        except portainer_supervisor.PortainerUnavailable as e:
+            response = jsonify({"success": False, "message": str(e)})
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, 503
 
         return func(*args, **kwargs)
     return decorated_function
+
 # RUTAS API PARA PORTAINER
 @app.route('/api/admin/available-services', methods=['GET'])
 @require_admin
@@ -473,19 +983,28 @@ def get_available_services_route():
         result["available_services"] = result.pop("services")
     return jsonify(result), status_code
 
+# Operaciones sobre servicios: se encolan como trabajos (job_engine.py, tipo "service") y se responde al momento con
+# 202 y el id del trabajo. El progreso (descarga de imágenes y despliegue) se sigue en /api/jobs/<id> o por SSE ("jobs")
+def submit_service_operation(action, service_name):
+    try:
+        job = job_engine.submit("service", {"action": action, "service": service_name.lower()})
+        return job_accepted(job, f"Operación {action} de {service_name} encolada")
+    except job_engine.JobError as e:
+        return jsonify({"success": False, "message": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
 @app.route('/api/admin/install/<service_name>', methods=['POST'])
 @require_admin
 @check_portainer_manager
 def install_service_route(service_name):
-    result, status_code = portainer_manager.install_service(service_name.lower())
-    return jsonify(result), status_code
+    return submit_service_operation("install", service_name)
 
 @app.route('/api/admin/uninstall/<service_name>', methods=['DELETE'])
 @require_admin
 @check_portainer_manager
 def uninstall_service_route(service_name):
-    result, status_code = portainer_manager.uninstall_service(service_name.lower())
-    return jsonify(result), status_code
+    return submit_service_operation("uninstall", service_name)
 
 @app.route('/api/services', methods=['GET'])
 @check_portainer_manager
@@ -496,14 +1015,12 @@ def list_services_route():
 @app.route('/api/services/start/<service_name>', methods=['POST'])
 @check_portainer_manager
 def start_service_route(service_name):
-    result, status_code = portainer_manager.start_service(service_name.lower())
-    return jsonify(result), status_code
+    return submit_service_operation("start", service_name)
 
 @app.route('/api/services/stop/<service_name>', methods=['POST'])
 @check_portainer_manager
 def stop_service_route(service_name):
-    result, status_code = portainer_manager.stop_service(service_name.lower())
-    return jsonify(result), status_code
+    return submit_service_operation("stop", service_name)
 
 #------------------------------------------------------------------------------------------------------------------
 # MANEJO GLOBAL DE ERRORES
@@ -0,0 +1,170 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: archive_stream.py
+# Descripción: Generación en streaming de archivos ZIP (ZIP64) y tar de carpetas o selecciones del RAID. El archivo se
+# produce por bloques a medida que se leen los ficheros, sin fichero temporal y con memoria constante: la descarga
+# (/api/archive) envía cada bloque en cuanto existe y el trabajo de archivado (job_engine.py) lo escribe a disco. Los
+# formatos ya comprimidos (fotos, vídeo, audio, zips...) se guardan sin volver a comprimir.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import stat
+import tarfile
+import zipfile
+
+# Variables Globales
+FORMATS = ("zip", "tar")
+MIMETYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+BLOCK_SIZE = 1024 * 1024    # Bytes leídos de cada fichero por iteración
+COMPRESS_LEVEL = 1          # Deflate rápido: en la Raspberry el nivel por defecto no llega a la velocidad de la red
+STORED_EXTENSIONS = {       # Ya comprimidos: se guardan tal cual
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp4", ".mkv", ".mov", ".avi", ".webm", ".mp3", ".aac", ".ogg", ".flac", ".m4a", ".pdf", ".docx", ".xlsx", ".pptx",
+}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _Sink:
+    """Destino de escritura no posicionable: acumula lo que escribe zipfile hasta que el generador lo recoge."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# paths:list --> iter_members() --> generator(path:str, arcname:str, st:stat_result)
+# Descripción: Recorre las rutas absolutas pedidas (ficheros o carpetas) y devuelve cada entrada con su nombre dentro del
+# archivo (relativo a la carpeta que contiene cada ruta pedida). Los enlaces simbólicos se omiten
+#-----------------------------------------------------------------------------------------------------------------------------------
+def iter_members(paths):
+    for path in paths:
+        base = os.path.dirname(path)
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                st = os.lstat(current)
+            except OSError as e:
+                print(f"[WARN] Se omite {current} del archivo: {e}")
+                continue
+            if not (stat.S_ISDIR(st.st_mode) or stat.S_ISREG(st.st_mode)):
+                continue
+            yield current, os.path.relpath(current, base), st
+            if stat.S_ISDIR(st.st_mode):
+                try:
+                    names = sorted(os.listdir(current), reverse=True)
+                except OSError as e:
+                    print(f"[WARN] No se pudo leer {current}: {e}")
+                    continue
+                stack.extend(os.path.join(current, name) for name in names if not name.endswith(".uploading"))
+
+def _read_blocks(path, size):
+    """Bloques de un fichero, como mucho size bytes (lo que medía al empezar, para que la cabecera siga siendo válida)."""
+    with open(path, 'rb') as f:
+        while size > 0:
+            data = f.read(min(BLOCK_SIZE, size))
+            if not data:
+                break
+            size -= len(data)
+            yield data
+#-----------------------------------------------------------------------------------------------------------------------------------
+# paths:list, progress:callable|None --> stream_zip() --> generator(bytes)
+# Descripción: ZIP64 en streaming (con data descriptors, porque el destino no es posicionable). progress(items, nbytes)
+# se llama por cada bloque leído y cada fichero terminado
+#-----------------------------------------------------------------------------------------------------------------------------------
+def stream_zip(paths, progress=None):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True, strict_timestamps=False) as archive:
+        for path, arcname, st in iter_members(paths):
+            if stat.S_ISDIR(st.st_mode):
+                info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+                info.CRC = 0
+                archive.mkdir(info)
+                yield sink.drain()
+                continue
+            info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+            if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info._compresslevel = COMPRESS_LEVEL  # zipfile no expone el nivel por entrada de otra forma
+            try:
+                with archive.open(info, 'w') as out:
+                    for block in _read_blocks(path, st.st_size):
+                        out.write(block)
+                        if progress:
+                            progress(0, len(block))
+                        data = sink.drain()
+                        if data:
+                            yield data
+            except OSError as e:
+                # Ya se ha enviado la cabecera: la entrada queda con el contenido leído hasta el error
+                print(f"[WARN] Error leyendo {path} para el archivo: {e}")
+            if progress:
+                progress(1, 0)
+            yield sink.drain()
+    yield sink.drain()  # Directorio central
+#-----------------------------------------------------------------------------------------------------------------------------------
+# paths:list, progress:callable|None --> stream_tar() --> generator(bytes)
+# Descripción: tar (formato PAX: nombres largos y ficheros de más de 8 GB) en streaming. Las cabeceras se generan con
+# tarfile y el contenido se envía por bloques, sin pasar el fichero entero por memoria
+#-----------------------------------------------------------------------------------------------------------------------------------
+def stream_tar(paths, progress=None):
+    written = 0
+    for path, arcname, st in iter_members(paths):
+        info = tarfile.TarInfo(arcname)
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = st.st_mtime
+        info.uid, info.gid = st.st_uid, st.st_gid
+        if stat.S_ISDIR(st.st_mode):
+            info.type = tarfile.DIRTYPE
+        else:
+            info.size = st.st_size
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        yield header
+        written += len(header)
+        if info.isdir():
+            continue
+
+        sent = 0
+        try:
+            for block in _read_blocks(path, info.size):
+                sent += len(block)
+                if progress:
+                    progress(0, len(block))
+                yield block
+        except OSError as e:
+            print(f"[WARN] Error leyendo {path} para el archivo: {e}")
+        if sent < info.size:
+            yield bytes(info.size - sent)  # Fichero truncado o ilegible: se rellena para no romper el tar
+        padding = -info.size % tarfile.BLOCKSIZE
+        yield bytes(padding)
+        written += info.size + padding
+        if progress:
+            progress(1, 0)
+
+    # Fin de archivo: dos bloques vacíos y relleno hasta el tamaño de registro
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield bytes(end)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# paths:list, fmt:str, progress:callable|None --> stream_archive() --> generator(bytes)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def stream_archive(paths, fmt="zip", progress=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"format debe ser uno de: {', '.join(FORMATS)}")
+    generator = stream_zip if fmt == "zip" else stream_tar
+    for data in generator(paths, progress):
+        if data:
+            yield data
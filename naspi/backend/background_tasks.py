@@ -0,0 +1,101 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: background_tasks.py
+# Descripción: Utilidades para tareas en segundo plano compartidas entre los workers de gunicorn. Permite elegir un único
+# proceso "líder" por host (mediante flock) y compartir resultados entre procesos a través de ficheros JSON en memoria (/dev/shm)
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import json
+import time
+import fcntl
+import tempfile
+import threading
+import traceback
+import subprocess
+
+# Variables Globales
+LOCK_DIR = "/run/lock" if os.access("/run/lock", os.W_OK) else tempfile.gettempdir()    # Locks de liderazgo
+SHARED_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()   # Ficheros compartidos en RAM
+
+_shared_cache = {}  # name -> (mtime_ns, size, data)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# name:str, target:callable --> run_as_host_leader() --> thread:Thread
+# Descripción: Lanza un hilo daemon que intenta obtener el lock "name" del host. Solo el proceso que lo consigue ejecuta
+# target(); el resto reintenta cada retry_interval segundos, de modo que si el líder muere otro worker toma el relevo.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def run_as_host_leader(name, target, retry_interval=5):
+    lock_path = os.path.join(LOCK_DIR, f"naspi_{name}.lock")
+
+    def _loop():
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                time.sleep(retry_interval)
+                continue
+
+            try:
+                target()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            time.sleep(retry_interval)
+
+    thread = threading.Thread(target=_loop, name=f"naspi-{name}", daemon=True)
+    thread.start()
+    return thread
+#-----------------------------------------------------------------------------------------------------------------------------------
+# name:str, data:dict --> write_shared_json() --> None
+# Descripción: Escribe de forma atómica (fichero temporal + rename) un JSON accesible por todos los workers del host
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_shared_json(name, data):
+    path = os.path.join(SHARED_DIR, f"naspi_{name}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# name:str --> read_shared_json() --> data:dict|None
+# Descripción: Lee un JSON compartido. El contenido se cachea por (mtime, tamaño) para no volver a parsearlo si no ha cambiado
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_shared_json(name):
+    path = os.path.join(SHARED_DIR, f"naspi_{name}.json")
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    cached = _shared_cache.get(name)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return cached[2] if cached else None
+
+    _shared_cache[name] = (st.st_mtime_ns, st.st_size, data)
+    return data
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> lower_thread_priority() --> None
+# Descripción: Baja al mínimo la prioridad de CPU (nice 19) y de E/S (clase idle de ionice) del hilo que la llama, sin
+# afectar al resto del worker. Pensado para rastreos del RAID que no deben competir con las peticiones de los usuarios.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def lower_thread_priority():
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)  # En Linux la prioridad es por hilo
+    except (OSError, AttributeError) as e:
+        print(f"[WARN] No se pudo bajar la prioridad de CPU del hilo {tid}: {e}")
+    try:
+        subprocess.run(["ionice", "-c", "3", "-p", str(tid)], check=True, capture_output=True, timeout=5)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[WARN] No se pudo bajar la prioridad de E/S del hilo {tid}: {e}")
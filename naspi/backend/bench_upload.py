@@ -0,0 +1,170 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: bench_upload.py
+# Descripción: Benchmark de ingesta de subidas. Compara la ruta multipart antigua (request.files + chunk.read() + append)
+# con el cuerpo crudo application/octet-stream volcado desde request.stream (upload_sessions.write_chunk). Cada modo se
+# ejecuta en un subproceso propio para medir su pico de memoria (RSS) sin que el otro lo contamine.
+#
+# Uso: python bench_upload.py [--size-mb 512] [--chunk-mb 8] [--dir /mnt/raid/tmp_chunks]
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from flask import Flask, request, jsonify
+import upload_sessions
+
+# Variables Globales
+MODES = ("multipart", "raw")
+BOUNDARY = "naspibenchboundary"
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# work_dir:str --> build_app() --> Flask
+# Descripción: App mínima con las dos rutas de ingesta tal y como las implementa app.py
+#-----------------------------------------------------------------------------------------------------------------------------------
+def build_app(work_dir):
+    app = Flask(__name__)
+
+    # Ruta antigua: Werkzeug vuelca la parte a un temporal y después se copia al destino
+    @app.route('/multipart', methods=['POST'])
+    def multipart():
+        chunk = request.files['chunk']
+        with open(os.path.join(work_dir, "multipart.bin"), 'ab') as f:
+            f.write(chunk.read())
+        return jsonify({"ok": True})
+
+    # Ruta nueva: el cuerpo se escribe en su offset directamente desde el socket
+    @app.route('/raw/<session_id>/<int:index>', methods=['PUT'])
+    def raw(session_id, index):
+        session = upload_sessions.load_session(session_id)
+        upload_sessions.write_chunk(session, index, request.stream)
+        return jsonify({"ok": True})
+
+    return app
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, size:int --> make_payload() --> None
+# Descripción: Genera el fichero de prueba por bloques para que el propio benchmark no infle el RSS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def make_payload(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(len(block), remaining)])
+            remaining -= len(block)
+
+def _multipart_body(path, payload, offset, length):
+    """Escribe en path el cuerpo multipart de un chunk y devuelve su tamaño."""
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"chunk\"; filename=\"blob\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    with open(payload, 'rb') as src, open(path, 'wb') as dst:
+        dst.write(head)
+        src.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = src.read(min(1024 * 1024, remaining))
+            dst.write(data)
+            remaining -= len(data)
+        dst.write(tail)
+    return len(head) + length + len(tail)
+
+class _Slice:
+    """Vista de solo lectura de [offset, offset+length) de un fichero, usada como input_stream del cliente de pruebas."""
+
+    def __init__(self, f, offset, length):
+        self.f, self.remaining = f, length
+        f.seek(offset)
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+#-----------------------------------------------------------------------------------------------------------------------------------
+# mode:str, payload:str, chunk_size:int, work_dir:str --> run_mode() --> result:dict
+# Descripción: Sube payload chunk a chunk con el modo indicado y mide MB/s y el pico de RSS del proceso
+#-----------------------------------------------------------------------------------------------------------------------------------
+def run_mode(mode, payload, chunk_size, work_dir):
+    app = build_app(work_dir)
+    client = app.test_client()
+    size = os.path.getsize(payload)
+    upload_sessions.SESSIONS_DIR = os.path.join(work_dir, "sessions")
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    elapsed = 0.0  # Solo cuenta el tiempo dentro de las peticiones, no el de preparar los cuerpos
+    if mode == "multipart":
+        body_path = os.path.join(work_dir, "body.tmp")
+        for offset in range(0, size, chunk_size):
+            length = min(chunk_size, size - offset)
+            body_size = _multipart_body(body_path, payload, offset, length)
+            with open(body_path, 'rb') as body:
+                started = time.perf_counter()
+                response = client.post('/multipart', input_stream=body, content_length=body_size,
+                                       content_type=f"multipart/form-data; boundary={BOUNDARY}")
+                elapsed += time.perf_counter() - started
+            assert response.status_code == 200, response.data
+        os.remove(body_path)
+    else:
+        session = upload_sessions.create_session(work_dir, "", "raw.bin", size, chunk_size)
+        with open(payload, 'rb') as f:
+            for index in range(session["total_chunks"]):
+                offset, length = upload_sessions.chunk_bounds(session, index)
+                started = time.perf_counter()
+                response = client.put(f"/raw/{session['id']}/{index}", input_stream=_Slice(f, offset, length),
+                                      content_length=length, content_type="application/octet-stream")
+                elapsed += time.perf_counter() - started
+                assert response.status_code == 200, response.data
+        upload_sessions.complete_session(session)
+
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / (1024 * 1024) / elapsed, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_growth_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+    }
+#-----------------------------------------------------------------------------------------------------------------------------------
+# MAIN
+#-----------------------------------------------------------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de subida multipart frente a cuerpo crudo")
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    parser.add_argument("--dir", default=None, help="Directorio de trabajo (por defecto un temporal)")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--payload", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    chunk_size = args.chunk_mb * 1024 * 1024
+
+    # Subproceso: un único modo
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.payload, chunk_size, args.dir)))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="naspi-bench-", dir=args.dir)
+    try:
+        payload = os.path.join(work_dir, "payload.bin")
+        make_payload(payload, args.size_mb * 1024 * 1024)
+        print(f"Payload {args.size_mb} MB en chunks de {args.chunk_mb} MB ({work_dir})")
+        print(f"{'modo':<10} {'segundos':>9} {'MB/s':>8} {'pico RSS MB':>12} {'+RSS MB':>8}")
+        for mode in MODES:
+            mode_dir = os.path.join(work_dir, mode)
+            os.makedirs(mode_dir)
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--payload", payload, "--dir", mode_dir,
+                 "--chunk-mb", str(args.chunk_mb)],
+                check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['mode']:<10} {r['seconds']:>9} {r['mb_per_s']:>8} {r['peak_rss_mb']:>12} {r['rss_growth_mb']:>8}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: checksum_index.py
+# Descripción: Índice de checksums de los ficheros del RAID (SQLite en data/checksums.db). Guarda el digest calculado al
+# subir cada fichero junto con su tamaño y fecha de modificación; si el fichero cambia por otra vía la entrada deja de
+# coincidir y se ignora. Las descargas usan el digest como ETag y cabecera Digest.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import base64
+import sqlite3
+import threading
+
+# Variables Globales
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'data', 'checksums.db')
+ALGORITHM_SHA256 = "sha256"            # SHA-256 del contenido completo
+ALGORITHM_SHA256_TREE = "sha256-tree"  # SHA-256 de la concatenación de los SHA-256 de cada chunk (subidas por sesión)
+
+_local = threading.local()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+        conn = sqlite3.connect(INDEX_FILE, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS checksums (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            algorithm TEXT NOT NULL,
+                            chunk_size INTEGER,
+                            digest TEXT NOT NULL)""")
+        _local.conn = conn
+    return conn
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, st:stat_result, algorithm:str, digest:str, chunk_size:int|None --> record() --> None
+# Descripción: Guarda (o reemplaza) el digest hexadecimal de path para la versión del fichero descrita por st
+#-----------------------------------------------------------------------------------------------------------------------------------
+def record(path, st, algorithm, digest, chunk_size=None):
+    with _connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?)",
+                     (path, st.st_size, st.st_mtime_ns, algorithm, chunk_size, digest))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, st:stat_result --> lookup() --> entry:dict|None
+# Descripción: Digest de path si la entrada corresponde a la versión actual del fichero (mismo tamaño y mtime)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def lookup(path, st):
+    row = _connection().execute(
+        "SELECT algorithm, chunk_size, digest FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ?",
+        (path, st.st_size, st.st_mtime_ns)).fetchone()
+    if row is None:
+        return None
+    return {"algorithm": row[0], "chunk_size": row[1], "digest": row[2]}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str --> forget() --> None
+# Descripción: Elimina la entrada de path y, si es una carpeta, las de todo su contenido
+#-----------------------------------------------------------------------------------------------------------------------------------
+def forget(path):
+    prefix = path.rstrip('/') + '/'
+    with _connection() as conn:
+        conn.execute("DELETE FROM checksums WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# entry:dict --> digest_header() --> value:str
+# Descripción: Valor de la cabecera Digest (RFC 3230) para una entrada del índice. El digest por chunks no es un algoritmo
+# estándar, así que se anuncia como "x-sha256-tree-<chunk_size>" para que el cliente sepa cómo recalcularlo.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def digest_header(entry):
+    value = base64.b64encode(bytes.fromhex(entry["digest"])).decode('ascii')
+    if entry["algorithm"] == ALGORITHM_SHA256:
+        return f"sha-256={value}"
+    return f"x-sha256-tree-{entry['chunk_size']}={value}"
@@ -0,0 +1,231 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: dedup_index.py
+# Descripción: Detección de ficheros duplicados en el RAID (SQLite en data/dedup.db). El escaneo descarta por etapas para
+# leer lo mínimo: primero agrupa por tamaño, después calcula un hash parcial (los primeros PARTIAL_SIZE bytes) solo de
+# los ficheros cuyo tamaño coincide con otro, y el SHA-256 completo solo de los que además coinciden en ese prefijo. Los
+# hashes se guardan junto con el tamaño y la fecha de modificación, así que en los siguientes escaneos solo se leen los
+# ficheros nuevos o modificados. Los ficheros que ya son enlaces duros entre sí (mismo inodo) no cuentan como duplicados.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import defaultdict
+import checksum_index
+import background_tasks as bg
+
+# Variables Globales
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'data', 'dedup.db')
+SCAN_INTERVAL = 24 * 3600       # Segundos entre escaneos
+MIN_SIZE = 64 * 1024            # Ficheros más pequeños no compensan (ni en espacio ni en lecturas)
+PARTIAL_SIZE = 64 * 1024        # Bytes del hash parcial
+BUFFER_SIZE = 1024 * 1024
+HIDDEN_SUFFIXES = (".uploading",)
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+        conn = sqlite3.connect(INDEX_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,      -- relativa al RAID
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    partial TEXT,               -- hash de los primeros PARTIAL_SIZE bytes (si hizo falta)
+                    full TEXT,                  -- SHA-256 completo (si hizo falta)
+                    scan_id INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS files_full ON files(full);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        _local.conn = conn
+    return conn
+
+def hash_file(path, limit=None):
+    """SHA-256 hexadecimal de path (o de sus primeros limit bytes)."""
+    h = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            data = f.read(BUFFER_SIZE if remaining is None else min(BUFFER_SIZE, remaining))
+            if not data:
+                break
+            h.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+    return h.hexdigest()
+
+def _walk(root):
+    """(ruta relativa, stat) de todos los ficheros regulares del RAID de al menos MIN_SIZE bytes."""
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel_dir)) as it:
+                for entry in it:
+                    if entry.name.startswith('.') and entry.name.endswith(HIDDEN_SUFFIXES):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if rel_dir or entry.name != "lost+found":
+                                stack.append(os.path.join(rel_dir, entry.name))
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if st.st_size >= MIN_SIZE:
+                        yield os.path.join(rel_dir, entry.name), st
+        except OSError as e:
+            print(f"[WARN] No se pudo leer {rel_dir or '/'} para buscar duplicados: {e}")
+
+def is_built():
+    return _connection().execute("SELECT 1 FROM meta WHERE key = 'last_scan'").fetchone() is not None
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> scan() --> stats:dict
+# Descripción: Escaneo incremental del RAID. Devuelve cuántos ficheros se han visto y cuántos se han tenido que leer
+#-----------------------------------------------------------------------------------------------------------------------------------
+def scan(root):
+    conn = _connection()
+    scan_id = int(time.time())
+    known = {path: (size, mtime_ns, ino, partial, full) for path, size, mtime_ns, ino, partial, full
+             in conn.execute("SELECT path, size, mtime_ns, ino, partial, full FROM files")}
+
+    # 1. Tamaño: un fichero con un tamaño único no puede tener duplicados
+    files = {}
+    by_size = defaultdict(set)
+    for rel_path, st in _walk(root):
+        cached = known.get(rel_path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            partial, full = cached[3], cached[4]
+        else:
+            partial = full = None
+        files[rel_path] = [st.st_size, st.st_mtime_ns, st.st_ino, partial, full]
+        by_size[st.st_size].add(st.st_ino)
+
+    def _candidates(group_of):
+        """Agrupa los ficheros con group_of y devuelve los de grupos con más de un inodo distinto."""
+        groups = defaultdict(list)
+        for rel_path, info in files.items():
+            key = group_of(rel_path, info)
+            if key is not None:
+                groups[key].append(rel_path)
+        for paths in groups.values():
+            if len({files[p][2] for p in paths}) > 1:
+                yield from paths
+
+    stats = {"files": len(files), "partial_hashed": 0, "full_hashed": 0}
+
+    # 2. Hash parcial de los ficheros cuyo tamaño coincide con otro
+    for rel_path in list(_candidates(lambda p, info: info[0] if len(by_size[info[0]]) > 1 else None)):
+        info = files[rel_path]
+        if info[3] is None:
+            try:
+                info[3] = hash_file(os.path.join(root, rel_path), PARTIAL_SIZE)
+                stats["partial_hashed"] += 1
+            except OSError:
+                continue
+
+    # 3. Hash completo de los que coinciden en tamaño y prefijo (se reutiliza el SHA-256 de la subida si lo hay)
+    for rel_path in list(_candidates(lambda p, info: (info[0], info[3]) if info[3] else None)):
+        info = files[rel_path]
+        if info[4] is not None:
+            continue
+        path = os.path.join(root, rel_path)
+        try:
+            entry = checksum_index.lookup(rel_path, os.stat(path))
+            if entry is not None and entry["algorithm"] == checksum_index.ALGORITHM_SHA256:
+                info[4] = entry["digest"]
+            else:
+                info[4] = hash_file(path)
+                stats["full_hashed"] += 1
+        except OSError:
+            continue
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         [(p, *info, scan_id) for p, info in files.items()])
+        conn.execute("DELETE FROM files WHERE scan_id < ?", (scan_id,))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_scan', ?)", (str(time.time()),))
+    return stats
+#-----------------------------------------------------------------------------------------------------------------------------------
+# min_size:int, limit:int, offset:int --> duplicates() --> report:dict
+# Descripción: Conjuntos de duplicados (ficheros con el mismo SHA-256 y distinto inodo), de más a menos espacio
+# recuperable, y el total recuperable del RAID
+#-----------------------------------------------------------------------------------------------------------------------------------
+def duplicates(min_size=0, limit=100, offset=0):
+    conn = _connection()
+    groups = """
+        SELECT full, size, COUNT(DISTINCT ino) AS copies FROM files
+        WHERE full IS NOT NULL AND size >= ? GROUP BY full, size HAVING copies > 1"""
+    total_sets, reclaimable = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(size * (copies - 1)), 0) FROM ({groups})", (min_size,)).fetchone()
+    rows = conn.execute(f"{groups} ORDER BY size * (copies - 1) DESC LIMIT ? OFFSET ?",
+                        (min_size, limit, offset)).fetchall()
+
+    sets = []
+    for digest, size, copies in rows:
+        paths = [p for p, in conn.execute("SELECT path FROM files WHERE full = ? AND size = ? ORDER BY mtime_ns, path",
+                                            (digest, size))]
+        sets.append({"sha256": digest, "size": size, "copies": copies, "reclaimable": size * (copies - 1),
+                     "paths": paths})
+    last_scan = conn.execute("SELECT value FROM meta WHERE key = 'last_scan'").fetchone()
+    return {"sets": sets, "totalSets": total_sets, "reclaimableBytes": reclaimable,
+            "lastScan": float(last_scan[0]) if last_scan else None}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# digest:str --> duplicate_set() --> entries:list
+# Descripción: Ficheros de un conjunto de duplicados con los datos del último escaneo (para comprobar que no han cambiado)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def duplicate_set(digest):
+    rows = _connection().execute("SELECT path, size, mtime_ns, ino FROM files WHERE full = ? ORDER BY mtime_ns, path",
+                                 (digest,)).fetchall()
+    return [{"path": p, "size": size, "mtime_ns": mtime_ns, "ino": ino} for p, size, mtime_ns, ino in rows]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, st:stat_result, digest:str --> record() --> None
+# Descripción: Actualiza la entrada de un fichero cuyo contenido se conoce (p.ej. tras sustituirlo por un enlace duro)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def record(path, st, digest):
+    with _connection() as conn:
+        conn.execute("UPDATE files SET size = ?, mtime_ns = ?, ino = ?, full = ? WHERE path = ?",
+                     (st.st_size, st.st_mtime_ns, st.st_ino, digest, path))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str --> forget() --> None
+# Descripción: Elimina del índice path y, si es una carpeta, todo su contenido
+#-----------------------------------------------------------------------------------------------------------------------------------
+def forget(path):
+    prefix = path.rstrip('/') + '/'
+    with _connection() as conn:
+        conn.execute("DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> start_scanner() --> None
+# Descripción: Arranca el escaneo periódico en el worker líder del host, con prioridad mínima de CPU y E/S
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start_scanner(root):
+    def _scan_forever():
+        bg.lower_thread_priority()
+        while True:
+            row = _connection().execute("SELECT value FROM meta WHERE key = 'last_scan'").fetchone()
+            wait = float(row[0]) + SCAN_INTERVAL - time.time() if row else 0
+            if wait > 0:
+                time.sleep(min(wait, 3600))
+                continue
+            started = time.monotonic()
+            stats = scan(root)
+            print(f"[INFO] Búsqueda de duplicados: {stats['files']} ficheros, {stats['partial_hashed']} hashes parciales "
+                  f"y {stats['full_hashed']} completos en {time.monotonic() - started:.1f} s")
+
+    bg.run_as_host_leader("dedup_scanner", _scan_forever, retry_interval=60)
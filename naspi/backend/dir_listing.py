@@ -0,0 +1,93 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: dir_listing.py
+# Descripción: Listado de directorios del RAID para /api/files. Una sola pasada de os.scandir: el tipo de cada entrada sale
+# del propio DirEntry (d_type, sin stat) y solo se hace stat de las entradas que se devuelven, salvo que se ordene por
+# tamaño o fecha. Admite ordenación, paginación por offset/limit y un ETag débil para responder 304.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+
+# Variables Globales
+SORT_KEYS = ("name", "size", "mtime", "type")
+MAX_LIMIT = 5000                    # Tamaño máximo de página
+HIDDEN_SUFFIXES = (".uploading",)   # Temporales de subidas en curso (ver upload_sessions.py)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class ListingError(ValueError):
+    """Parámetros de listado no válidos."""
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _is_hidden(name):
+    return name.startswith('.') and name.endswith(HIDDEN_SUFFIXES)
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _entry_info(entry, is_dir):
+    """Diccionario de una entrada. DirEntry cachea el stat, así que cada entrada se consulta como mucho una vez."""
+    try:
+        st = entry.stat()
+        size, mtime = (0 if is_dir else st.st_size), st.st_mtime
+    except OSError:
+        size, mtime = 0, 0  # Enlace roto o borrado durante el listado
+    return {"name": entry.name, "type": "folder" if is_dir else "file", "size": size, "mtime": mtime}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str --> directory_etag() --> etag:str
+# Descripción: ETag débil del directorio. Cambia al crear, borrar o renombrar entradas (mtime del directorio); no refleja
+# cambios de contenido de ficheros ya existentes, por eso es débil
+#-----------------------------------------------------------------------------------------------------------------------------------
+def directory_etag(path, *params):
+    st = os.stat(path)
+    suffix = "-".join(str(p) for p in params)
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{suffix}"
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, sort:str, order:str, offset:int, limit:int|None, entries:list|None --> list_directory() --> listing:dict
+# Descripción: Lista path con las carpetas primero y después los ficheros, ambos ordenados por sort. Devuelve la página
+# pedida (entries) junto con el total y el offset de la siguiente página (None si es la última). Si se pasan entries
+# (p.ej. desde fs_cache) se ordenan y paginan esas en lugar de leer el disco.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def list_directory(path, sort="name", order="asc", offset=0, limit=None, entries=None):
+    if sort not in SORT_KEYS:
+        raise ListingError(f"sort debe ser uno de: {', '.join(SORT_KEYS)}")
+    if order not in ("asc", "desc"):
+        raise ListingError("order debe ser asc o desc")
+    if offset < 0 or (limit is not None and not 0 < limit <= MAX_LIMIT):
+        raise ListingError(f"offset debe ser >= 0 y limit estar entre 1 y {MAX_LIMIT}")
+
+    reverse = order == "desc"
+    if entries is not None:
+        total = len(entries)
+        entries = sorted(entries, key=lambda e: (e[sort], e["name"].casefold()) if sort in ("size", "mtime")
+                         else e["name"].casefold(), reverse=reverse)
+        entries.sort(key=lambda e: e["type"] != "folder")
+        return _page(entries[offset:offset + limit if limit else None], offset, total)
+
+    with os.scandir(path) as it:
+        scanned = [(entry, _is_dir(entry)) for entry in it if not _is_hidden(entry.name)]
+
+    if sort in ("name", "type"):
+        # Sin stat: se ordena con la información de scandir y solo se consultan las entradas de la página
+        scanned.sort(key=lambda e: e[0].name.casefold(), reverse=reverse)
+        scanned.sort(key=lambda e: not e[1])
+        page = scanned[offset:offset + limit if limit else None]
+        entries = [_entry_info(entry, is_dir) for entry, is_dir in page]
+    else:
+        entries = [_entry_info(entry, is_dir) for entry, is_dir in scanned]
+        entries.sort(key=lambda e: (e[sort], e["name"].casefold()), reverse=reverse)
+        entries.sort(key=lambda e: e["type"] != "folder")
+        entries = entries[offset:offset + limit if limit else None]
+    return _page(entries, offset, len(scanned))
+
+def _page(entries, offset, total):
+    next_offset = offset + len(entries)
+    return {
+        "entries": entries,
+        "total": total,
+        "offset": offset,
+        "nextOffset": next_offset if next_offset < total else None,
+    }
@@ -0,0 +1,93 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: event_bus.py
+# Descripción: Bus de eventos entre procesos para el canal SSE (/api/events). Cualquier worker (o proceso auxiliar) publica
+# eventos añadiendo una línea JSON a un fichero en memoria (/dev/shm); cada conexión SSE lo va leyendo desde el final.
+# Así un cambio hecho en un worker llega a las pestañas conectadas a cualquier otro worker sin que estas hagan polling.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import json
+import time
+import fcntl
+import background_tasks as bg
+
+# Variables Globales
+SPOOL_PATH = os.path.join(bg.SHARED_DIR, "naspi_events.log")
+MAX_SPOOL_SIZE = 1024 * 1024    # Al superar 1 MB se rota el fichero (los lectores reabren el nuevo)
+POLL_INTERVAL = 0.25            # Segundos entre comprobaciones de eventos nuevos
+KEEPALIVE_INTERVAL = 15         # Segundos sin eventos tras los que se entrega un keepalive (None)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# event:str, data:any --> publish() --> None
+# Descripción: Publica un evento para todos los suscriptores del host
+#-----------------------------------------------------------------------------------------------------------------------------------
+def publish(event, data):
+    line = json.dumps({"id": time.time_ns(), "event": event, "data": data}, separators=(',', ':')) + "\n"
+    while True:
+        fd = os.open(SPOOL_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Otro proceso puede haber rotado el fichero entre el open y el flock: el lock y la escritura tienen que ser
+            # sobre el fichero vigente, si no el evento acabaría en el .old que ya nadie lee
+            try:
+                current = os.stat(SPOOL_PATH).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                continue
+            if os.fstat(fd).st_size > MAX_SPOOL_SIZE:
+                os.replace(SPOOL_PATH, SPOOL_PATH + ".old")
+                continue  # Se reabre (y bloquea) el fichero nuevo
+            os.write(fd, line.encode('utf-8'))
+            return
+        finally:
+            os.close(fd)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> subscribe() --> generator
+# Descripción: Generador infinito con los eventos publicados a partir de ahora, como dicts {id, event, data}. Si no llega
+# nada en KEEPALIVE_INTERVAL segundos entrega None para que el llamante pueda mantener viva la conexión.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _open_spool(at_end):
+    fd = os.open(SPOOL_PATH, os.O_RDONLY | os.O_CREAT, 0o600)
+    f = os.fdopen(fd, 'r', encoding='utf-8')
+    if at_end:
+        f.seek(0, os.SEEK_END)
+    return f
+
+def subscribe():
+    f = _open_spool(at_end=True)
+    pending = ""
+    last_delivery = time.monotonic()
+    try:
+        while True:
+            chunk = f.readline()
+            if chunk:
+                pending += chunk
+                if not pending.endswith("\n"):
+                    continue  # Línea a medio escribir, se completa en la siguiente lectura
+                line, pending = pending, ""
+                try:
+                    yield json.loads(line)
+                    last_delivery = time.monotonic()
+                except ValueError:
+                    pass
+                continue
+
+            # Sin datos nuevos: comprobar si el fichero se ha rotado
+            try:
+                rotated = os.stat(SPOOL_PATH).st_ino != os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                f.close()
+                f = _open_spool(at_end=False)
+                pending = ""
+                continue
+
+            if time.monotonic() - last_delivery >= KEEPALIVE_INTERVAL:
+                yield None
+                last_delivery = time.monotonic()
+            time.sleep(POLL_INTERVAL)
+    finally:
+        f.close()
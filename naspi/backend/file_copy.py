@@ -0,0 +1,85 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: file_copy.py
+# Descripción: Copia de ficheros dentro del servidor usando el camino más rápido que admita el sistema de ficheros: reflink
+# (ioctl FICLONE, instantáneo en Btrfs/XFS: los bloques se comparten hasta que se modifican), copy_file_range (la copia
+# la hace el kernel, y en ext4 sobre el mismo disco sin pasar por espacio de usuario) y, si nada de eso está disponible,
+# sendfile con bloques grandes. Ninguno de los tres copia los datos a memoria de Python.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import errno
+import fcntl
+import shutil
+
+# Variables Globales
+FICLONE = 0x40049409                # _IOW(0x94, 9, int), ver ioctl_ficlone(2)
+CHUNK_SIZE = 64 * 1024 * 1024       # Bytes por llamada al kernel (entre llamadas se informa del progreso)
+# Errores que indican que el método no está soportado para este par de ficheros y hay que probar el siguiente
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _reflink(fd_in, fd_out):
+    try:
+        fcntl.ioctl(fd_out, FICLONE, fd_in)
+        return True
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRORS:
+            return False
+        raise
+
+def _copy_range(fd_in, fd_out, size, progress):
+    """copy_file_range por bloques. Devuelve los bytes copiados, o None si el kernel no lo admite para estos ficheros."""
+    copied = 0
+    while copied < size:
+        try:
+            n = os.copy_file_range(fd_in, fd_out, min(CHUNK_SIZE, size - copied))
+        except OSError as e:
+            if copied == 0 and e.errno in UNSUPPORTED_ERRORS:
+                return None
+            raise
+        if n == 0:
+            break  # El fichero ha encogido durante la copia
+        copied += n
+        if progress:
+            progress(n)
+    return copied
+
+def _sendfile(fd_in, fd_out, offset, size, progress):
+    while offset < size:
+        n = os.sendfile(fd_out, fd_in, offset, min(CHUNK_SIZE, size - offset))
+        if n == 0:
+            break
+        offset += n
+        if progress:
+            progress(n)
+    return offset
+#-----------------------------------------------------------------------------------------------------------------------------------
+# src:str, dst:str, progress:callable|None --> copy_file() --> method:str
+# Descripción: Copia src en dst (que no debe existir) y conserva permisos y fechas. progress(nbytes) se llama tras cada
+# bloque copiado y puede lanzar una excepción para interrumpir la copia (el fichero a medias lo borra el llamante).
+# Devuelve el método usado: "reflink", "copy_file_range" o "sendfile"
+#-----------------------------------------------------------------------------------------------------------------------------------
+def copy_file(src, dst, progress=None):
+    fd_in = os.open(src, os.O_RDONLY)
+    try:
+        size = os.fstat(fd_in).st_size
+        fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size and _reflink(fd_in, fd_out):
+                method = "reflink"
+                if progress:
+                    progress(size)
+            else:
+                method = "copy_file_range"
+                copied = _copy_range(fd_in, fd_out, size, progress)
+                if copied is None:
+                    method = "sendfile"
+                    os.lseek(fd_out, 0, os.SEEK_SET)
+                    _sendfile(fd_in, fd_out, 0, size, progress)
+        finally:
+            os.close(fd_out)
+    finally:
+        os.close(fd_in)
+    shutil.copystat(src, dst)
+    return method
@@ -0,0 +1,117 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: file_transfer.py
+# Descripción: Descargas de ficheros del RAID con soporte de Range/If-Range, ETag y Last-Modified. Flask solo autoriza la
+# petición: si Nginx está configurado (NASPI_ACCEL_REDIRECT) la transferencia se le delega con X-Accel-Redirect y el
+# worker queda libre al momento; si no, los bytes se envían con os.sendfile a través de wsgi.file_wrapper de gunicorn.
+# Los validadores que valen son siempre los de Flask (ETag con el checksum de la subida si existe, cabecera Digest): la
+# location de Nginx tiene "etag off" y copia ETag y Digest de la respuesta de Flask, y las peticiones condicionales por
+# ETag (If-None-Match, If-Range con ETag) las resuelve Flask porque Nginx no conoce ese ETag.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import mimetypes
+from urllib.parse import quote
+from flask import request, Response
+from werkzeug.http import http_date
+
+# Variables Globales
+ACCEL_REDIRECT_PREFIX = os.getenv("NASPI_ACCEL_REDIRECT")  # Location interna de Nginx, p.ej. "/_raid_files/"
+BLOCK_SIZE = 1024 * 1024                                    # Tamaño de bloque si no se puede usar sendfile
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str, rel_path:str --> safe_path() --> path:str|None
+# Descripción: Resuelve rel_path dentro de root. Devuelve None si la ruta final (tras resolver "..", y enlaces) sale de root
+#-----------------------------------------------------------------------------------------------------------------------------------
+def safe_path(root, rel_path):
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, rel_path.strip('/')))
+    if path != root and not path.startswith(root + os.sep):
+        return None
+    return path
+#-----------------------------------------------------------------------------------------------------------------------------------
+# st:stat_result --> make_etag() --> etag:str
+# Descripción: ETag fuerte (sin comillas) a partir de la fecha de modificación y el tamaño del fichero
+#-----------------------------------------------------------------------------------------------------------------------------------
+def make_etag(st):
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def content_disposition(filename):
+    ascii_name = filename.encode('ascii', 'replace').decode('ascii').replace('"', '').replace('?', '_')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+def _iter_file(f, length):
+    """Genera el contenido del fichero desde su posición actual, como mucho length bytes."""
+    try:
+        while length > 0:
+            data = f.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, rel_path:str, etag:str|None --> send_file() --> Response
+# Descripción: Construye la respuesta de descarga de un fichero ya autorizado. rel_path es la ruta relativa al RAID que se
+# usa para la redirección interna de Nginx. Si no se indica etag se usa make_etag().
+#-----------------------------------------------------------------------------------------------------------------------------------
+def send_file(path, rel_path, etag=None, as_attachment=True):
+    st = os.stat(path)
+    filename = os.path.basename(path)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = etag or make_etag(st)
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+    }
+    if as_attachment:
+        headers["Content-Disposition"] = content_disposition(filename)
+
+    # Nginx sirve el fichero (Range e If-Modified-Since incluidos) desde su location interna
+    if ACCEL_REDIRECT_PREFIX and not request.if_none_match and not request.if_range.etag:
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(rel_path.strip('/'))
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    # Peticiones condicionales: el cliente ya tiene esta versión
+    if request.if_none_match:
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+    elif request.if_modified_since and int(st.st_mtime) <= request.if_modified_since.timestamp():
+        return Response(status=304, headers=headers)
+
+    # Range solo se respeta si If-Range (cuando viene) coincide con la versión actual del fichero
+    start, stop, status = 0, st.st_size, 200
+    if request.range is not None:
+        if_range = request.if_range
+        range_valid = (
+            (not if_range.etag and not if_range.date)
+            or (if_range.etag is not None and if_range.etag == etag)
+            or (if_range.date is not None and int(st.st_mtime) <= if_range.date.timestamp())
+        )
+        if range_valid:
+            byte_range = request.range.range_for_length(st.st_size)
+            if byte_range is not None:
+                start, stop = byte_range
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{stop - 1}/{st.st_size}"
+            elif len(request.range.ranges) == 1:
+                headers["Content-Range"] = f"bytes */{st.st_size}"
+                return Response(status=416, headers=headers)
+            # Varios rangos: se ignoran y se envía el fichero completo
+
+    length = stop - start
+    headers["Content-Length"] = str(length)
+    if request.method == 'HEAD':
+        return Response(status=status, headers=headers, mimetype=mimetype)
+
+    f = open(path, 'rb')
+    f.seek(start)
+    # gunicorn reconoce su wsgi.file_wrapper y envía el fichero con os.sendfile desde la posición actual hasta
+    # Content-Length, sin pasar los datos por Python
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    body = file_wrapper(f, BLOCK_SIZE) if file_wrapper and hasattr(os, 'sendfile') else _iter_file(f, length)
+
+    return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
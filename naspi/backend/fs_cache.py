@@ -0,0 +1,288 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: fs_cache.py
+# Descripción: Caché en memoria de los metadatos del árbol del RAID (nombre, tipo, tamaño y fecha de cada entrada) para
+# servir los listados sin despertar los discos. Cada directorio cacheado tiene un watch de inotify: los eventos del kernel
+# actualizan solo la entrada afectada (no hay TTL), y las rutas de la API refrescan además de forma explícita lo que
+# modifican (ver fs_hooks.py) para que el propio worker vea el cambio al instante. La caché está acotada por número de entradas y de
+# directorios; al llenarse se expulsan los directorios usados hace más tiempo (LRU) y se retira su watch.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import uuid
+import errno
+import ctypes
+import ctypes.util
+import stat
+import struct
+import threading
+from collections import OrderedDict
+
+# Variables Globales
+MAX_CACHED_ENTRIES = 200000     # Entradas totales (sumando todos los directorios) por worker
+MAX_CACHED_DIRS = 1024          # Directorios (= watches de inotify) por worker
+HIDDEN_SUFFIXES = (".uploading",)
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (struct inotify_event)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _CachedDir:
+    """Contenido cacheado de un directorio: nombre -> (is_dir, size, mtime)."""
+
+    __slots__ = ("wd", "entries", "token", "version")
+
+    def __init__(self, wd, entries):
+        self.wd = wd
+        self.entries = entries
+        self.token = uuid.uuid4().hex[:8]  # Distingue cachés de distintos workers/escaneos en el ETag
+        self.version = 0
+
+    @property
+    def etag(self):
+        return f"{self.token}-{self.version:x}"
+
+class MetadataCache:
+    """Caché LRU de directorios del RAID invalidada por inotify."""
+
+    def __init__(self, max_entries=MAX_CACHED_ENTRIES, max_dirs=MAX_CACHED_DIRS):
+        self.max_entries = max_entries
+        self.max_dirs = max_dirs
+        self._dirs = OrderedDict()  # path -> _CachedDir (el último es el más reciente)
+        self._wds = {}              # wd -> path
+        self._pending = {}          # wd -> {escaneo: hubo eventos} (directorios escaneándose todavía, uno o varios hilos)
+        self._total = 0
+        self._lock = threading.Lock()
+        self._fd = None
+        self._libc = None
+        self._thread = None
+
+    #-------------------------------------------------------------------------------------------------------------------
+    # inotify (ctypes sobre libc, sin dependencias externas)
+    #-------------------------------------------------------------------------------------------------------------------
+    def _ensure_inotify(self):
+        """Abre el descriptor de inotify y arranca el hilo lector. Devuelve False si inotify no está disponible."""
+        if self._fd is not None:
+            return self._fd >= 0
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = self._libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError):
+            fd = -1
+        if fd < 0:
+            print("[WARN] inotify no disponible: los listados del RAID no se cachearán")
+            self._fd = -1
+            return False
+        self._fd = fd
+        self._thread = threading.Thread(target=self._read_events, name="naspi-fs-cache", daemon=True)
+        self._thread.start()
+        return True
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                print("[WARN] Límite de watches de inotify alcanzado (fs.inotify.max_user_watches)")
+            return None
+        return wd
+
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except InterruptedError:
+                continue
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                try:
+                    self._handle_event(wd, mask, os.fsdecode(name))
+                except Exception as e:
+                    print(f"[WARN] Error procesando evento de inotify: {e}")
+
+    def _handle_event(self, wd, mask, name):
+        with self._lock:
+            if mask & IN_Q_OVERFLOW:
+                # Se han perdido eventos: no se puede saber qué ha cambiado
+                self._clear_locked()
+                for scans in self._pending.values():
+                    scans.update(dict.fromkeys(scans, True))
+                return
+            scans = self._pending.get(wd)
+            if scans:
+                scans.update(dict.fromkeys(scans, True))  # Directorio escaneándose: los escaneos se repetirán
+            path = self._wds.get(wd)
+            if path is None:
+                return
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                self._drop_tree_locked(path)
+                return
+            if not name or name.startswith('.') and name.endswith(HIDDEN_SUFFIXES):
+                return
+
+            self._refresh_entry_locked(path, name, removed=bool(mask & (IN_DELETE | IN_MOVED_FROM)))
+
+    #-------------------------------------------------------------------------------------------------------------------
+    # Gestión de la caché (siempre con self._lock tomado)
+    #-------------------------------------------------------------------------------------------------------------------
+    def _refresh_entry_locked(self, path, name, removed=False):
+        """Actualiza (o quita) una sola entrada de un directorio cacheado sin volver a escanearlo."""
+        cached = self._dirs.get(path)
+        if cached is None:
+            return
+        child = os.path.join(path, name)
+        info = None if removed else _stat_entry(child)
+        if info is None:
+            if cached.entries.pop(name, None) is not None:
+                self._total -= 1
+            self._drop_tree_locked(child)
+        else:
+            self._total += name not in cached.entries
+            cached.entries[name] = info
+        cached.version += 1
+
+    def _drop_locked(self, path):
+        cached = self._dirs.pop(path, None)
+        if cached is None:
+            return
+        self._total -= len(cached.entries)
+        self._wds.pop(cached.wd, None)
+        self._libc.inotify_rm_watch(self._fd, cached.wd)
+
+    def _drop_tree_locked(self, path):
+        prefix = path.rstrip('/') + '/'
+        for cached_path in [p for p in self._dirs if p == path or p.startswith(prefix)]:
+            self._drop_locked(cached_path)
+
+    def _clear_locked(self):
+        for path in list(self._dirs):
+            self._drop_locked(path)
+
+    def _evict_locked(self, incoming):
+        while self._dirs and (self._total + incoming > self.max_entries or len(self._dirs) >= self.max_dirs):
+            self._drop_locked(next(iter(self._dirs)))
+
+    #-------------------------------------------------------------------------------------------------------------------
+    # API pública
+    #-------------------------------------------------------------------------------------------------------------------
+    def get(self, path):
+        """Devuelve (etag, entries) del directorio path, con entries como lista de dicts. Si no está en caché lo escanea
+        y empieza a vigilarlo. Devuelve None si no se puede cachear (sin inotify, sin watches o directorio demasiado
+        grande), y el llamante debe leer el disco directamente."""
+        path = os.path.realpath(path)
+        with self._lock:
+            cached = self._dirs.get(path)
+            if cached is not None:
+                self._dirs.move_to_end(path)
+                return cached.etag, _as_dicts(cached.entries)
+            if not self._ensure_inotify():
+                return None
+
+        # El watch se añade antes de escanear; si llega algún evento durante el escaneo se repite, porque scandir puede
+        # haber leído ya la posición de la entrada que ha cambiado
+        wd = self._add_watch(path)
+        if wd is None:
+            return None
+        # Dos peticiones simultáneas del mismo directorio reciben el mismo wd: cada escaneo lleva su propia marca y el
+        # registro del wd solo se borra cuando termina el último
+        scan_id = object()
+        with self._lock:
+            self._pending.setdefault(wd, {})[scan_id] = False
+        for _attempt in range(3):
+            entries = _scan(path)
+            with self._lock:
+                scans = self._pending.get(wd, {})
+                if not scans.get(scan_id, True):
+                    break
+                scans[scan_id] = False
+
+        with self._lock:
+            scans = self._pending.get(wd, {})
+            dirty = scans.pop(scan_id, True)
+            if not scans:
+                self._pending.pop(wd, None)
+            if dirty or len(entries) > self.max_entries:
+                if wd not in self._wds and wd not in self._pending:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                return None
+            existing = self._dirs.get(path)
+            if existing is not None:  # Otro hilo lo ha cacheado mientras tanto (el kernel devuelve el mismo wd)
+                return existing.etag, _as_dicts(existing.entries)
+            self._evict_locked(len(entries))
+            cached = _CachedDir(wd, entries)
+            self._dirs[path] = cached
+            self._wds[wd] = path
+            self._total += len(entries)
+            return cached.etag, _as_dicts(entries)
+
+    def refresh(self, path):
+        """Vuelve a leer los metadatos de path en el listado cacheado de su directorio padre (o lo quita si ya no
+        existe). Si path era un directorio que ya no existe también se olvida su subárbol."""
+        path = os.path.realpath(path)
+        with self._lock:
+            if self._fd is None or self._fd < 0:
+                return
+            self._refresh_entry_locked(os.path.dirname(path), os.path.basename(path))
+
+    def invalidate(self, path, recursive=False):
+        """Olvida el directorio path (y, si recursive, todo lo que cuelga de él)."""
+        path = os.path.realpath(path)
+        with self._lock:
+            if self._fd is None or self._fd < 0:
+                return
+            if recursive:
+                self._drop_tree_locked(path)
+            else:
+                self._drop_locked(path)
+
+    def stats(self):
+        with self._lock:
+            return {"dirs": len(self._dirs), "entries": self._total}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _stat_entry(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    is_dir = stat.S_ISDIR(st.st_mode)
+    return (is_dir, 0 if is_dir else st.st_size, st.st_mtime)
+
+def _scan(path):
+    entries = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith('.') and entry.name.endswith(HIDDEN_SUFFIXES):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                st = entry.stat()
+                entries[entry.name] = (is_dir, 0 if is_dir else st.st_size, st.st_mtime)
+            except OSError:
+                continue
+    return entries
+
+def _as_dicts(entries):
+    return [{"name": name, "type": "folder" if is_dir else "file", "size": size, "mtime": mtime}
+            for name, (is_dir, size, mtime) in entries.items()]
+
+# Caché del proceso (cada worker de gunicorn tiene la suya)
+CACHE = MetadataCache()
@@ -0,0 +1,54 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: fs_hooks.py
+# Descripción: Punto único por el que pasan los cambios que la API (o los trabajos en segundo plano) hacen en el árbol del
+# RAID. Cada cambio se reparte a todo lo que mantiene estado sobre los ficheros: la caché de metadatos (fs_cache), los
+# índices de checksums, búsqueda, uso de disco y duplicados, las miniaturas y el canal SSE de los clientes. Los índices
+# que se añadan después se enganchan aquí. Se llama desde las rutas HTTP, así que no debe recorrer el disco: el contenido
+# de una carpeta nueva (movida o copiada) lo indexan después, en segundo plano, el rastreador de búsqueda y el de uso.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import event_bus
+import checksum_index
+import dedup_index
+import search_index
+import usage_index
+import thumbnails
+from fs_cache import CACHE
+
+# Variables Globales
+RAID_PATH = "/mnt/raid/files"
+REMOVED_ACTIONS = ("deleted", "folder_deleted", "moved_from")
+RESCAN_ACTIONS = ("changed",)  # El contenido de una carpeta ha cambiado (p.ej. un borrado cancelado a medias)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# action:str, path:str --> file_changed() --> None
+# Descripción: Notifica un cambio en path (relativo a RAID_PATH). action es "uploaded", "folder_created", "copied" o
+# "moved_to" si path existe ahora; "deleted", "folder_deleted" o "moved_from" si ha dejado de existir; y "changed" si
+# es una carpeta cuyo contenido ha cambiado
+#-----------------------------------------------------------------------------------------------------------------------------------
+def file_changed(action, path):
+    path = os.path.normpath(path.strip('/'))
+    abs_path = os.path.join(RAID_PATH, path)
+    removed = action in REMOVED_ACTIONS
+
+    CACHE.refresh(abs_path)
+    if removed or action in RESCAN_ACTIONS:
+        CACHE.invalidate(abs_path, recursive=True)
+    if removed:
+        checksum_index.forget(path)
+        dedup_index.forget(path)
+    try:
+        search_index.update_path(RAID_PATH, path, removed=removed)
+    except Exception as e:
+        print(f"[WARN] No se pudo actualizar el índice de búsqueda para {path}: {e}")
+    try:
+        usage_index.update_path(RAID_PATH, path, removed=removed, rescan=action in RESCAN_ACTIONS)
+    except Exception as e:
+        print(f"[WARN] No se pudo actualizar el índice de uso para {path}: {e}")
+
+    if action == "uploaded":
+        thumbnails.pregenerate(abs_path, path)
+
+    event_bus.publish("files", {"action": action, "path": path, "parent": os.path.dirname(path)})
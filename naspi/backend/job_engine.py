@@ -0,0 +1,752 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: job_engine.py
+# Descripción: Cola persistente de trabajos largos (borrado recursivo, copia, movimiento y archivado sobre el RAID, y las
+# operaciones de servicios Docker: instalar, desinstalar, arrancar y parar). Los
+# workers HTTP solo encolan el trabajo en un diario SQLite (data/jobs.db) y devuelven su id al momento; un proceso aparte
+# (naspi-jobs.service, "python job_engine.py") los ejecuta con un pool de hilos acotado, guarda el progreso (elementos y
+# bytes) en el diario, lo publica por el canal SSE ("jobs") y atiende las peticiones de cancelación. Los trabajos que
+# estaban en marcha cuando el proceso se detuvo se vuelven a encolar al arrancar. Los trabajos con la misma clave de
+# bloqueo (p.ej. dos operaciones sobre el mismo servicio) se ejecutan de uno en uno, en orden de llegada.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import json
+import errno
+import shutil
+import time
+import uuid
+import stat
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import event_bus
+import fs_hooks
+import archive_stream
+import file_copy
+import dedup_index
+import usage_index
+import portainer_manager
+import portainer_supervisor
+from file_transfer import safe_path
+
+# Variables Globales
+JOURNAL_FILE = os.path.join(os.path.dirname(__file__), 'data', 'jobs.db')
+RAID_PATH = fs_hooks.RAID_PATH
+MAX_WORKERS = 2                 # Trabajos de ficheros simultáneos (comparten discos: más no termina antes)
+MAX_SERVICE_WORKERS = 2         # Operaciones de servicios simultáneas (carril propio: no esperan a las copias)
+POLL_INTERVAL = 0.5             # Segundos entre comprobaciones de trabajos nuevos
+PROGRESS_INTERVAL = 0.5         # Segundos mínimos entre escrituras de progreso (y comprobaciones de cancelación)
+JOB_RETENTION = 7 * 24 * 3600   # Los trabajos terminados se borran del diario pasado este tiempo
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+SERVICE_ACTIONS = ("install", "uninstall", "start", "stop")
+SERVICE_STAGES = {"install": "Desplegando", "uninstall": "Eliminando", "start": "Iniciando", "stop": "Deteniendo"}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+HANDLERS = {}   # tipo -> (validador de parámetros, función que ejecuta el trabajo, clave de bloqueo)
+ADMIN_JOB_TYPES = set()     # Tipos que solo puede encolar un administrador
+LANES = {"files": MAX_WORKERS, "services": MAX_SERVICE_WORKERS}    # Carril -> trabajos simultáneos
+LANE_TYPES = {lane: set() for lane in LANES}                        # Carril -> tipos que se ejecutan en él
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class JobError(ValueError):
+    """Trabajo no válido (tipo desconocido o parámetros incorrectos). status_code es el código HTTP que le corresponde."""
+    status_code = 400
+
+class JobNotFound(JobError):
+    """El trabajo se refiere a algo que no existe (p.ej. un servicio desconocido)."""
+    status_code = 404
+
+class JobConflict(JobError):
+    """Ya hay un trabajo igual en cola o en marcha."""
+    status_code = 409
+
+class JobCancelled(Exception):
+    """Se ha pedido cancelar el trabajo en curso."""
+
+class JobContext:
+    """Lo que recibe la función de cada trabajo: sus parámetros y los métodos para informar del progreso."""
+
+    def __init__(self, job_id, params, stage=None, checkpoint=None):
+        self.id = job_id
+        self.params = params
+        self.checkpoint = checkpoint or {}  # Lo que el trabajo guardó para poder reanudarse (ver set_checkpoint)
+        self.items_done = 0
+        self.bytes_done = 0
+        self.items_total = None
+        self.bytes_total = None
+        self.stage = stage          # Al reanudar un trabajo interrumpido, la fase en la que estaba
+        self._last_flush = 0.0
+
+    def set_totals(self, items=None, nbytes=None):
+        self.items_total = items
+        self.bytes_total = nbytes
+        self.flush(force=True)
+
+    def set_stage(self, stage):
+        """Fase actual del trabajo (texto para mostrar, p.ej. "Descargando imágenes")."""
+        self.stage = stage
+        self.flush(force=True)
+
+    def set_checkpoint(self, key, value):
+        """Guarda en el diario, antes de seguir, un dato que el trabajo necesita para reanudarse si el proceso se detiene
+        a medias (p.ej. la ruta de destino elegida para una copia). Al reanudarse lo encuentra en ctx.checkpoint."""
+        self.checkpoint[key] = value
+        conn = _connection()
+        with conn:
+            conn.execute("UPDATE jobs SET checkpoint = ? WHERE id = ?", (json.dumps(self.checkpoint), self.id))
+
+    def advance(self, items=0, nbytes=0):
+        """Suma progreso y, como mucho cada PROGRESS_INTERVAL, lo guarda y comprueba si se ha pedido cancelar."""
+        self.items_done += items
+        self.bytes_done += nbytes
+        self.flush()
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < PROGRESS_INTERVAL:
+            return
+        self._last_flush = now
+        self.save()
+        cancel = _connection().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        if cancel and cancel[0]:
+            raise JobCancelled()
+
+    def save(self):
+        conn = _connection()
+        with conn:
+            conn.execute("UPDATE jobs SET items_done = ?, items_total = ?, bytes_done = ?, bytes_total = ?, stage = ? "
+                         "WHERE id = ?",
+                         (self.items_done, self.items_total, self.bytes_done, self.bytes_total, self.stage, self.id))
+        _publish(self.id)
+
+    def resolve(self, rel_path):
+        """Ruta absoluta dentro del RAID (los parámetros ya se validaron al encolar, pero el árbol puede haber cambiado)."""
+        path = safe_path(RAID_PATH, rel_path)
+        if path is None:
+            raise JobError(f"Ruta fuera del RAID: {rel_path}")
+        return path
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOURNAL_FILE), exist_ok=True)
+        conn = sqlite3.connect(JOURNAL_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    params TEXT NOT NULL,           -- JSON
+                    status TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    items_done INTEGER NOT NULL DEFAULT 0,
+                    items_total INTEGER,
+                    bytes_done INTEGER NOT NULL DEFAULT 0,
+                    bytes_total INTEGER,
+                    error TEXT,
+                    result TEXT,                    -- JSON
+                    cancel_requested INTEGER NOT NULL DEFAULT 0);
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+            """)
+            # Columnas añadidas después de la primera versión del diario
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lock_key" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lock_key TEXT")
+            if "stage" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN stage TEXT")
+            if "checkpoint" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN checkpoint TEXT")  # JSON (ver JobContext.set_checkpoint)
+        _local.conn = conn
+    return conn
+
+def _row_to_job(row):
+    (job_id, job_type, params, status, created, started, finished, items_done, items_total, bytes_done, bytes_total,
+     error, result, cancel_requested, lock_key, stage, _checkpoint) = row
+    return {
+        "id": job_id, "type": job_type, "params": json.loads(params), "status": status,
+        "created": created, "started": started, "finished": finished,
+        "itemsDone": items_done, "itemsTotal": items_total, "bytesDone": bytes_done, "bytesTotal": bytes_total,
+        "error": error, "result": json.loads(result) if result else None,
+        "cancelRequested": bool(cancel_requested), "lockKey": lock_key, "stage": stage,
+    }
+
+def _publish(job_id):
+    job = get_job(job_id)
+    if job is not None:
+        event_bus.publish("jobs", job)
+
+def job_handler(job_type, validate, lock_key=None, admin=False, lane="files"):
+    """Registra la función que ejecuta los trabajos de job_type. validate(params) devuelve los parámetros normalizados
+    o lanza JobError; se llama al encolar, en el worker HTTP. lock_key(params), si se indica, da la clave que comparten
+    los trabajos que no pueden ejecutarse a la vez. admin marca los tipos que solo puede encolar un administrador, y
+    lane el carril (con su propio límite de trabajos simultáneos) en el que se ejecutan."""
+    def _register(func):
+        HANDLERS[job_type] = (validate, func, lock_key)
+        LANE_TYPES[lane].add(job_type)
+        if admin:
+            ADMIN_JOB_TYPES.add(job_type)
+        return func
+    return _register
+#-----------------------------------------------------------------------------------------------------------------------------------
+# API de los workers HTTP
+#-----------------------------------------------------------------------------------------------------------------------------------
+# job_type:str, params:dict --> validate() --> params:dict
+# Descripción: Comprueba los parámetros de un trabajo y los devuelve normalizados (rutas relativas al RAID ya resueltas)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def validate(job_type, params):
+    if job_type not in HANDLERS:
+        raise JobError(f"Tipo de trabajo no válido. Opciones: {', '.join(HANDLERS)}")
+    if not isinstance(params, dict):
+        raise JobError("params debe ser un objeto")
+    return HANDLERS[job_type][0](params)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# job_type:str, params:dict --> submit() --> job:dict
+# Descripción: Valida y encola un trabajo. Devuelve el trabajo recién creado (estado queued). Lanza JobConflict si ya hay
+# uno idéntico (mismo tipo y parámetros) en cola o en marcha
+#-----------------------------------------------------------------------------------------------------------------------------------
+def submit(job_type, params):
+    params = validate(job_type, params)
+    lock_key = HANDLERS[job_type][2]
+
+    job_id = uuid.uuid4().hex
+    encoded = json.dumps(params)
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")  # La comprobación y el INSERT no se intercalan con otro submit
+        duplicate = conn.execute("SELECT id FROM jobs WHERE type = ? AND params = ? AND status IN (?, ?)",
+                                 (job_type, encoded, STATUS_QUEUED, STATUS_RUNNING)).fetchone()
+        if duplicate is not None:
+            raise JobConflict(f"Ya hay un trabajo igual en curso ({duplicate[0]})")
+        conn.execute("INSERT INTO jobs (id, type, params, status, created, lock_key) VALUES (?, ?, ?, ?, ?, ?)",
+                     (job_id, job_type, encoded, STATUS_QUEUED, time.time(), lock_key(params) if lock_key else None))
+    _publish(job_id)
+    return get_job(job_id)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# job_id:str --> get_job() --> job:dict|None
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_job(job_id):
+    row = _connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+#-----------------------------------------------------------------------------------------------------------------------------------
+# status:str|None, limit:int --> list_jobs() --> jobs:list
+# Descripción: Trabajos más recientes primero, opcionalmente filtrados por estado
+#-----------------------------------------------------------------------------------------------------------------------------------
+def list_jobs(status=None, limit=50):
+    sql, args = "SELECT * FROM jobs", []
+    if status:
+        sql += " WHERE status = ?"
+        args.append(status)
+    rows = _connection().execute(sql + " ORDER BY created DESC LIMIT ?", args + [limit]).fetchall()
+    return [_row_to_job(row) for row in rows]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# job_id:str --> cancel() --> job:dict|None
+# Descripción: Pide cancelar un trabajo. Si aún no ha empezado se cancela en el acto; si está en marcha, el proceso de
+# trabajos lo detiene en su siguiente actualización de progreso
+#-----------------------------------------------------------------------------------------------------------------------------------
+def cancel(job_id):
+    conn = _connection()
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?, finished = ?, cancel_requested = 1 WHERE id = ? AND status = ?",
+                     (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED))
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, STATUS_RUNNING))
+    _publish(job_id)
+    return get_job(job_id)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Ejecución (proceso naspi-jobs)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _claim_next(lane):
+    """Pasa a running el trabajo en cola más antiguo del carril cuya clave de bloqueo no esté ocupada por otro en marcha.
+    Los trabajos de tipos que no tiene ningún carril los reclama el de ficheros (y fallan en _run_job). BEGIN
+    IMMEDIATE evita que dos procesos reclamen el mismo."""
+    if lane == "files":
+        other_types = [t for other, types in LANE_TYPES.items() if other != lane for t in types]
+        type_filter, type_args = f"type NOT IN ({','.join('?' * len(other_types))})", other_types
+    else:
+        type_filter, type_args = f"type IN ({','.join('?' * len(LANE_TYPES[lane]))})", list(LANE_TYPES[lane])
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(f"""
+            SELECT id FROM jobs WHERE status = ? AND {type_filter} AND (lock_key IS NULL OR lock_key NOT IN (
+                SELECT lock_key FROM jobs WHERE status = ? AND lock_key IS NOT NULL))
+            ORDER BY created LIMIT 1""", (STATUS_QUEUED, *type_args, STATUS_RUNNING)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (STATUS_RUNNING, time.time(), row[0]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row[0] if row else None
+
+def _finish(job_id, status, error=None, result=None):
+    conn = _connection()
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?, finished = ?, error = ?, result = ? WHERE id = ?",
+                     (status, time.time(), error, json.dumps(result) if result is not None else None, job_id))
+    _publish(job_id)
+
+def _run_job(job_id):
+    job = get_job(job_id)
+    if job["type"] not in HANDLERS:
+        # Encolado por otra versión del código (o el diario se ha editado a mano): no quedarse en running para siempre
+        _finish(job_id, STATUS_FAILED, error=f"Tipo de trabajo desconocido: {job['type']}")
+        return
+    checkpoint = _connection().execute("SELECT checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    ctx = JobContext(job_id, job["params"], stage=job["stage"], checkpoint=json.loads(checkpoint or "{}"))
+    ctx.flush(force=True)
+    try:
+        result = HANDLERS[job["type"]][1](ctx)
+        ctx.save()
+    except JobCancelled:
+        _finish(job_id, STATUS_CANCELLED)
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, STATUS_FAILED, error=str(e))
+    else:
+        _finish(job_id, STATUS_COMPLETED, result=result)
+
+def _recover():
+    """Al arrancar: lo que quedó en running se interrumpió con el proceso anterior y vuelve a la cola (los trabajos
+    están escritos para poder repetirse; conservan la fase en la que estaban y su checkpoint), y se purgan los trabajos
+    terminados antiguos."""
+    conn = _connection()
+    with conn:
+        count = conn.execute("UPDATE jobs SET status = ?, started = NULL WHERE status = ? AND cancel_requested = 0",
+                             (STATUS_QUEUED, STATUS_RUNNING)).rowcount
+        conn.execute("UPDATE jobs SET status = ?, finished = ? WHERE status = ?",
+                     (STATUS_CANCELLED, time.time(), STATUS_RUNNING))
+        conn.execute(f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED_STATUSES))}) AND finished < ?",
+                     (*FINISHED_STATUSES, time.time() - JOB_RETENTION))
+    if count:
+        print(f"[INFO] {count} trabajos interrumpidos vuelven a la cola")
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> run_forever() --> None
+# Descripción: Bucle del proceso de trabajos: cada carril tiene su pool y reclama trabajos de la cola mientras le queden
+# hilos libres, así una copia larga no retrasa la instalación de un servicio (ni al revés)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def run_forever():
+    _recover()
+    pools = {lane: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"naspi-job-{lane}")
+             for lane, workers in LANES.items()}
+    running = {lane: set() for lane in LANES}
+    while True:
+        claimed = False
+        for lane, workers in LANES.items():
+            running[lane] = {f for f in running[lane] if not f.done()}
+            job_id = _claim_next(lane) if len(running[lane]) < workers else None
+            if job_id is not None:
+                running[lane].add(pools[lane].submit(_run_job, job_id))
+                claimed = True
+        if not claimed:
+            time.sleep(POLL_INTERVAL)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Validación de parámetros
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _rel_path(value, must_exist=True, folder=False):
+    """Normaliza una ruta relativa al RAID y comprueba que no sale de él (y que existe, si se pide)."""
+    if not isinstance(value, str):
+        raise JobError("Las rutas deben ser cadenas")
+    path = safe_path(RAID_PATH, value)
+    if path is None:
+        raise JobError(f"Ruta no válida: {value}")
+    rel = os.path.relpath(path, os.path.realpath(RAID_PATH))
+    rel = "" if rel == "." else rel
+    if must_exist and not os.path.lexists(path):
+        raise JobError(f"No existe: {value}")
+    if folder and not os.path.isdir(path):
+        raise JobError(f"No es una carpeta: {value}")
+    return rel
+
+def _path_list(params, key):
+    values = params.get(key)
+    if isinstance(values, str):
+        values = [values]
+    if not values or not isinstance(values, list):
+        raise JobError(f"Falta {key}")
+    paths = [_rel_path(v) for v in values]
+    if "" in paths:
+        raise JobError("No se puede operar sobre la raíz del RAID")
+    return paths
+
+def _validate_delete(params):
+    return {"paths": _path_list(params, "paths")}
+
+def _validate_transfer(params):
+    sources = _path_list(params, "sources")
+    destination = _rel_path(params.get("destination", ""), folder=True)
+    for source in sources:
+        if destination == source or destination.startswith(source + '/'):
+            raise JobError(f"No se puede copiar o mover {source} dentro de sí mismo")
+    name = params.get("name")  # Nuevo nombre (solo con un origen)
+    if name is None:
+        return {"sources": sources, "destination": destination}
+    if len(sources) != 1 or not isinstance(name, str) or not name or '/' in name or name in (".", ".."):
+        raise JobError("name solo se admite con un único origen y sin '/'")
+    return {"sources": sources, "destination": destination, "name": name}
+
+def _validate_archive(params):
+    paths = _path_list(params, "paths")
+    destination = _rel_path(params.get("destination", ""), folder=True)
+    fmt = params.get("format", "zip")
+    if fmt not in archive_stream.FORMATS:
+        raise JobError(f"format debe ser uno de: {', '.join(archive_stream.FORMATS)}")
+    name = params.get("name") or (os.path.basename(paths[0]) if len(paths) == 1 else "archivo")
+    if not isinstance(name, str) or '/' in name or name in (".", ".."):
+        raise JobError("Nombre de archivo no válido")
+    return {"paths": paths, "destination": destination, "name": name, "format": fmt}
+
+def _validate_dedup(params):
+    digests = params.get("sets")
+    if not digests or not isinstance(digests, list) or not all(isinstance(d, str) and len(d) == 64 for d in digests):
+        raise JobError("sets debe ser una lista de SHA-256 (ver /api/storage/duplicates)")
+    mode = params.get("mode", "hardlink")
+    if mode not in ("hardlink", "delete"):
+        raise JobError("mode debe ser hardlink o delete")
+    return {"sets": digests, "mode": mode}
+
+def _validate_service(params):
+    action = params.get("action")
+    if action not in SERVICE_ACTIONS:
+        raise JobError(f"action debe ser uno de: {', '.join(SERVICE_ACTIONS)}")
+    service = params.get("service")
+    if not isinstance(service, str) or service.lower() not in portainer_manager.load_service_definitions():
+        raise JobNotFound(f"Servicio {service} no encontrado.")
+    return {"action": action, "service": service.lower()}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Utilidades de los trabajos
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _tree_totals(path):
+    """(elementos, bytes) de un fichero o carpeta. Para carpetas se usa el índice de uso si está construido."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        return 1, st.st_size
+    totals = usage_index.totals(os.path.relpath(path, os.path.realpath(RAID_PATH)))
+    if totals is not None:
+        return totals[1], totals[0]
+    items, nbytes = 0, 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                nbytes += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+        items += len(filenames)
+    return items, nbytes
+
+def _set_totals(ctx, paths):
+    items, nbytes = 0, 0
+    for path in paths:
+        try:
+            i, b = _tree_totals(path)
+        except OSError:
+            continue
+        items += i
+        nbytes += b
+    ctx.set_totals(items, nbytes)
+
+def _unique_destination(dest_dir, name, is_dir=False):
+    """Ruta libre en dest_dir para name: "foto.jpg", "foto (copia).jpg", "foto (copia 2).jpg"..."""
+    candidate = os.path.join(dest_dir, name)
+    stem, ext = (name, "") if is_dir else os.path.splitext(name)
+    counter = 1
+    while os.path.lexists(candidate):
+        suffix = " (copia)" if counter == 1 else f" (copia {counter})"
+        candidate = os.path.join(dest_dir, f"{stem}{suffix}{ext}")
+        counter += 1
+    return candidate
+
+def _remove_tree(ctx, path):
+    """Borra path (fichero o carpeta) de abajo arriba, informando del progreso por cada fichero."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        size = os.lstat(path).st_size
+        os.unlink(path)
+        ctx.advance(1, size)
+        return
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            file_path = os.path.join(dirpath, name)
+            try:
+                size = os.lstat(file_path).st_size
+                os.unlink(file_path)
+            except FileNotFoundError:
+                size = 0
+            ctx.advance(1, size)
+        for name in dirnames:
+            dir_path = os.path.join(dirpath, name)
+            if os.path.islink(dir_path):
+                os.unlink(dir_path)
+            else:
+                os.rmdir(dir_path)
+    os.rmdir(path)
+
+def _copy_file(ctx, src, dst):
+    """Copia un fichero por el camino más rápido disponible (ver file_copy.py), comprobando la cancelación entre bloques."""
+    file_copy.copy_file(src, dst, progress=lambda n: ctx.advance(0, n))
+    ctx.advance(1, 0)
+
+def _copy_tree(ctx, src, dst):
+    if not os.path.isdir(src) or os.path.islink(src):
+        _copy_file(ctx, src, dst)
+        return
+    os.makedirs(dst)
+    for dirpath, dirnames, filenames in os.walk(src):
+        target_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+        for name in dirnames:
+            os.makedirs(os.path.join(target_dir, name), exist_ok=True)
+        for name in filenames:
+            _copy_file(ctx, os.path.join(dirpath, name), os.path.join(target_dir, name))
+    shutil.copystat(src, dst)
+
+def _discard(path):
+    """Borra sin informar de progreso (restos de una copia a medias, original tras mover entre discos)."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+def _rel(path):
+    return os.path.relpath(path, os.path.realpath(RAID_PATH))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Tipos de trabajo
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Borrado recursivo. params: {paths: [rutas]}
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("delete", _validate_delete)
+def _delete_job(ctx):
+    paths = [ctx.resolve(p) for p in ctx.params["paths"]]
+    _set_totals(ctx, [p for p in paths if os.path.lexists(p)])
+    for rel_path, path in zip(ctx.params["paths"], paths):
+        if not os.path.lexists(path):
+            continue  # Ya borrado (p.ej. trabajo repetido tras un reinicio)
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        try:
+            _remove_tree(ctx, path)
+        except BaseException:
+            fs_hooks.file_changed("changed" if os.path.lexists(path) else "folder_deleted", rel_path)
+            raise
+        fs_hooks.file_changed("folder_deleted" if is_dir else "deleted", rel_path)
+    return {"deleted": ctx.params["paths"]}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Copia. params: {sources: [rutas], destination: carpeta, name: nombre opcional}. Si ya existe un elemento con el mismo
+# nombre se añade "(copia)".
+# El destino elegido para cada origen se guarda en el checkpoint antes de copiar: si el proceso muere a medias, al
+# reanudarse se borra esa copia incompleta y se rehace en la misma ruta (en lugar de dejarla y crear otra "(copia)")
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("copy", _validate_transfer)
+def _copy_job(ctx):
+    dest_dir = ctx.resolve(ctx.params["destination"])
+    sources = [ctx.resolve(p) for p in ctx.params["sources"]]
+    pending = [(rel, src) for rel, src in zip(ctx.params["sources"], sources)
+               if not ctx.checkpoint.get(rel, {}).get("done")]
+    _set_totals(ctx, [src for _rel_src, src in pending])
+    for rel_src, src in pending:
+        state = ctx.checkpoint.get(rel_src)
+        if state is None:
+            dst = _unique_destination(dest_dir, ctx.params.get("name") or os.path.basename(src), os.path.isdir(src))
+            ctx.set_checkpoint(rel_src, {"dst": _rel(dst), "done": False})
+        else:
+            dst = ctx.resolve(state["dst"])
+            _discard(dst)  # Copia incompleta de la ejecución interrumpida
+        try:
+            _copy_tree(ctx, src, dst)
+        except BaseException:
+            _discard(dst)  # Copia a medias (cancelada o con error): no se deja en el RAID
+            raise
+        ctx.set_checkpoint(rel_src, {"dst": _rel(dst), "done": True})
+        fs_hooks.file_changed("copied", _rel(dst))
+    return {"created": [ctx.checkpoint[rel]["dst"] for rel in ctx.params["sources"]]}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Movimiento. params: {sources: [rutas], destination: carpeta, name: nombre opcional}. Como en /api/files/move, falla
+# sin mover nada si algún destino ya existe. rename() si es el mismo sistema de ficheros. Entre discos se copia y
+# después se borra el original; el checkpoint de cada origen guarda el destino y la fase ("moving" hasta que la copia
+# está completa, "copied" mientras se borra el original y "done"), así que al reanudarse un trabajo interrumpido se
+# rehace la copia incompleta en la misma ruta o se termina de borrar el original, sin duplicar nada
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("move", _validate_transfer)
+def _move_job(ctx):
+    dest_dir = ctx.resolve(ctx.params["destination"])
+    sources = [ctx.resolve(p) for p in ctx.params["sources"]]
+    targets = [os.path.join(dest_dir, ctx.params.get("name") or os.path.basename(src)) for src in sources]
+    for rel_src, src, dst in zip(ctx.params["sources"], sources, targets):
+        if rel_src not in ctx.checkpoint and src != dst and os.path.lexists(dst):
+            raise JobConflict(f"Ya existe: {_rel(dst)}")
+    ctx.set_totals(len(sources), None)
+    moved = []
+    for rel_src, src, target in zip(ctx.params["sources"], sources, targets):
+        state = ctx.checkpoint.get(rel_src)
+        if state is None:
+            if not os.path.lexists(src):
+                continue
+            state = {"dst": _rel(target), "stage": "moving"}
+            ctx.set_checkpoint(rel_src, state)
+        dst = ctx.resolve(state["dst"])
+        if state["stage"] == "done":
+            moved.append(state["dst"])
+            continue
+
+        # Con "moving" y el original ya fuera de su sitio, el rename llegó a hacerse
+        if state["stage"] == "moving" and os.path.lexists(src):
+            _discard(dst)  # Copia incompleta de una ejecución interrumpida (no existe si es la primera)
+            try:
+                os.rename(src, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:  # Distinto sistema de ficheros: se copia y se borra el original
+                    raise
+                try:
+                    _copy_tree(ctx, src, dst)
+                except BaseException:
+                    _discard(dst)
+                    raise
+                ctx.set_checkpoint(rel_src, {**state, "stage": "copied"})
+                _discard(src)
+        elif state["stage"] == "copied":
+            _discard(src)  # Borrado del original que quedó a medias
+        ctx.set_checkpoint(rel_src, {**state, "stage": "done"})
+        ctx.advance(1, 0)
+        moved.append(state["dst"])
+        fs_hooks.file_changed("moved_from", rel_src)
+        fs_hooks.file_changed("moved_to", state["dst"])
+    return {"created": moved}
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Archivado. params: {paths: [rutas], destination: carpeta, name: nombre, format: zip|tar}
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("archive", _validate_archive)
+def _archive_job(ctx):
+    paths = [ctx.resolve(p) for p in ctx.params["paths"]]
+    dest_dir = ctx.resolve(ctx.params["destination"])
+    fmt = ctx.params["format"]
+    _set_totals(ctx, paths)
+
+    dst = _unique_destination(dest_dir, f"{ctx.params['name']}.{fmt}")
+    tmp = os.path.join(dest_dir, f".{os.path.basename(dst)}.{ctx.id}.uploading")  # Oculto en listados e índices
+    try:
+        with open(tmp, 'wb') as out:
+            for data in archive_stream.stream_archive(paths, fmt, progress=ctx.advance):
+                out.write(data)
+        os.rename(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    fs_hooks.file_changed("uploaded", _rel(dst))
+    return {"created": [_rel(dst)], "size": os.path.getsize(dst)}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Deduplicación. params: {sets: [sha256], mode: hardlink|delete}. En cada conjunto se conserva el fichero más antiguo; el
+# resto se sustituye por un enlace duro a él o se borra. Antes de tocar nada se vuelve a leer cada fichero para
+# comprobar que su contenido sigue siendo el del escaneo
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("dedup", _validate_dedup)
+def _dedup_job(ctx):
+    mode = ctx.params["mode"]
+    sets = [dedup_index.duplicate_set(digest) for digest in ctx.params["sets"]]
+    ctx.set_totals(sum(len(entries) for entries in sets), sum(e["size"] for entries in sets for e in entries))
+    reclaimed, replaced = 0, []
+
+    for digest, entries in zip(ctx.params["sets"], sets):
+        verified = []
+        for entry in entries:
+            path = ctx.resolve(entry["path"])
+            try:
+                st = os.lstat(path)
+                unchanged = st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+                if unchanged and dedup_index.hash_file(path) == digest:
+                    verified.append((entry["path"], path, st))
+            except OSError:
+                pass
+            ctx.advance(1, entry["size"])
+        if len(verified) < 2:
+            continue  # Ha cambiado desde el escaneo: ya no hay nada que deduplicar
+
+        _keep_rel, keep_path, keep_st = verified[0]
+        for rel_path, path, st in verified[1:]:
+            if st.st_ino == keep_st.st_ino and st.st_dev == keep_st.st_dev:
+                continue
+            if mode == "delete":
+                os.unlink(path)
+                fs_hooks.file_changed("deleted", rel_path)
+            else:
+                # Enlace temporal + rename: la ruta nunca deja de existir ni queda a medias
+                tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{ctx.id}.uploading")
+                try:
+                    os.link(keep_path, tmp_path)
+                except OSError as e:
+                    if e.errno == errno.EXDEV:
+                        continue
+                    raise
+                os.replace(tmp_path, path)
+                dedup_index.record(rel_path, os.lstat(path), digest)
+                fs_hooks.file_changed("copied", rel_path)
+            reclaimed += st.st_size
+            replaced.append(rel_path)
+    return {"mode": mode, "files": replaced, "reclaimedBytes": reclaimed}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Servicios Docker. params: {action: install|uninstall|start|stop, service}. Las operaciones sobre un mismo servicio se
+# ejecutan de una en una. Al instalar se descargan antes las imágenes (con progreso por capas en bytes), de modo que el
+# despliegue del stack ya no tiene que descargar nada. Si el proceso se detuvo durante el despliegue o la eliminación,
+# al reanudarse el trabajo "ya está instalado" (o "no está en Portainer") significa que la operación llegó a hacerse
+#-----------------------------------------------------------------------------------------------------------------------------------
+@job_handler("service", _validate_service, lock_key=lambda params: f"service:{params['service']}", admin=True,
+             lane="services")
+def _service_job(ctx):
+    action, service = ctx.params["action"], ctx.params["service"]
+    resumed = ctx.stage == SERVICE_STAGES[action]
+    try:
+        manager = portainer_supervisor.get_manager()
+    except portainer_supervisor.PortainerUnavailable as e:
+        raise RuntimeError(str(e))
+
+    if action == "install":
+        images = manager.service_images(service)
+        ctx.set_totals(items=len(images))
+        ctx.set_stage("Descargando imágenes")
+        layers = {}  # capa -> [bytes descargados, bytes totales]
+
+        def _progress(message):
+            layer, detail = message.get("id"), message.get("progressDetail") or {}
+            if layer is None:
+                return
+            current = layers.setdefault(layer, [0, 0])
+            if message.get("status") == "Downloading" and detail.get("total"):
+                current[:] = [detail.get("current", 0), detail["total"]]
+            elif message.get("status") in ("Download complete", "Pull complete", "Already exists"):
+                current[0] = current[1]
+            ctx.bytes_done = sum(c for c, _ in layers.values())
+            ctx.bytes_total = sum(t for _, t in layers.values())
+            ctx.flush()  # Lanza JobCancelled si se ha pedido cancelar
+
+        for image in images:
+            manager.pull_image(image, _progress)
+            ctx.advance(items=1)
+
+    ctx.set_stage(SERVICE_STAGES[action])
+    result, _status_code = getattr(manager, f"{action}_service")(service)
+    # "installed" solo viene cuando la lista de stacks se ha podido leer (si Portainer falla la respuesta es un 5xx)
+    if resumed and result.get("installed") is (action == "install"):
+        result = {"success": True, "message": result["message"]}
+    if not result.get("success"):
+        raise RuntimeError(result.get("message"))
+    ctx.set_stage(None)
+    return {"message": result["message"]}
+
+if __name__ == "__main__":
+    print(f"[INFO] Proceso de trabajos en marcha ({MAX_WORKERS} hilos de ficheros y {MAX_SERVICE_WORKERS} de servicios, "
+          f"diario en {JOURNAL_FILE})")
+    run_forever()
@@ -0,0 +1,151 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: metrics_history.py
+# Descripción: Almacén de series temporales de las métricas de hardware. Guarda CPU, temperatura, RAM, disco y red en
+# buffers circulares de varias resoluciones (1 s durante una hora, 1 min durante un día y 15 min durante un mes) sobre un
+# fichero mapeado en memoria en data/, de modo que el histórico sobrevive a reinicios y todos los workers pueden leerlo.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import math
+import mmap
+import time
+import struct
+import threading
+
+# Variables Globales
+HISTORY_FILE = os.path.join(os.path.dirname(__file__), 'data', 'metrics_history.bin')
+
+METRICS = ("cpu", "temp", "ram", "disk", "net_rx", "net_tx")  # net_* en bytes/s
+TIERS = (           # (segundos por slot, número de slots)
+    (1, 3600),      # 1 s durante 1 hora
+    (60, 1440),     # 1 min durante 1 día
+    (900, 2880),    # 15 min durante 30 días
+)
+MAX_POINTS = 2000   # Máximo de puntos devueltos por consulta
+
+_MAGIC = b"NASPIMTS"
+_HEADER = struct.Struct("<8sIII")   # magic, versión, nº métricas, nº niveles
+_HEADER_SIZE = 64                   # Alineado a 8 bytes para poder ver el resto como array de doubles
+_VERSION = 2
+_ROW = 1 + 2 * len(METRICS)         # [inicio del bucket, nº de muestras de cada métrica..., métricas...]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class MetricsHistory:
+    """Buffers circulares de doubles de ancho fijo sobre un fichero mapeado en memoria."""
+
+    def __init__(self, path=HISTORY_FILE, writable=False):
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._mm = None
+        self._values = None
+        self._offsets = []
+        offset = 0
+        for step, slots in TIERS:
+            self._offsets.append(offset)
+            offset += slots * _ROW
+        self._size = _HEADER_SIZE + offset * 8
+
+    def _open(self):
+        if self._mm is not None:
+            return True
+
+        if self.writable:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                expected = _HEADER.pack(_MAGIC, _VERSION, len(METRICS), len(TIERS))
+                if header != expected or os.fstat(fd).st_size != self._size:
+                    # Fichero nuevo o con otro formato: se reinicia con ceros
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self._size)
+                    os.pwrite(fd, expected, 0)
+                self._mm = mmap.mmap(fd, self._size, access=mmap.ACCESS_WRITE)
+            finally:
+                os.close(fd)
+        else:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                return False
+            try:
+                if os.fstat(fd).st_size != self._size:
+                    return False
+                self._mm = mmap.mmap(fd, self._size, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+
+        self._values = memoryview(self._mm)[_HEADER_SIZE:].cast('d')
+        return True
+    #-------------------------------------------------------------------------------------------------------------------------------
+    # timestamp:float, values:dict --> record() --> None
+    # Descripción: Añade una muestra a todos los niveles. En los niveles gruesos cada slot guarda la media de sus muestras;
+    # cada métrica lleva su propia cuenta, así que las muestras sin valor (None) no diluyen la media
+    #-------------------------------------------------------------------------------------------------------------------------------
+    def record(self, timestamp, values):
+        with self._lock:
+            self._open()
+            v = self._values
+            for (step, slots), offset in zip(TIERS, self._offsets):
+                bucket = int(timestamp) - int(timestamp) % step
+                base = offset + (bucket // step) % slots * _ROW
+                if v[base] != bucket:
+                    v[base] = bucket
+                    for i in range(len(METRICS)):
+                        v[base + 1 + i] = 0
+                        v[base + 1 + len(METRICS) + i] = math.nan
+
+                for i, metric in enumerate(METRICS):
+                    value = values.get(metric)
+                    if value is None:
+                        continue
+                    count = v[base + 1 + i] + 1
+                    v[base + 1 + i] = count
+                    previous = v[base + 1 + len(METRICS) + i]
+                    v[base + 1 + len(METRICS) + i] = value if count == 1 else previous + (value - previous) / count
+    #-------------------------------------------------------------------------------------------------------------------------------
+    # metric:str, start:float, end:float, step:float|None --> query() --> (step:int, points:list)
+    # Descripción: Devuelve [[timestamp, valor], ...] entre start y end reducido en el servidor a un punto cada "step"
+    # segundos. Se usa el nivel más fino cuya retención cubre el rango pedido.
+    #-------------------------------------------------------------------------------------------------------------------------------
+    def query(self, metric, start, end, step=None, now=None):
+        if metric not in METRICS:
+            raise ValueError(f"Métrica desconocida: {metric}")
+        if end <= start:
+            return 0, []
+
+        span = end - start
+        step = max(int(step or 0), math.ceil(span / MAX_POINTS), 1)
+        reference = now if now is not None else time.time()
+        tier = next(((s, n, o) for (s, n), o in zip(TIERS, self._offsets) if reference - s * n <= start), None)
+        if tier is None:
+            tier = (*TIERS[-1], self._offsets[-1])
+        tier_step, slots, offset = tier
+        step = max(step, tier_step)
+        step -= step % tier_step
+
+        with self._lock:
+            if not self._open():
+                return step, []
+            v = self._values
+            metric_index = 1 + len(METRICS) + METRICS.index(metric)
+
+            sums = {}
+            # El buffer solo conserva los últimos "slots" buckets: lo anterior a reference ya se ha sobrescrito
+            first = int(start) - int(start) % tier_step
+            first = max(first, int(reference) - int(reference) % tier_step - (slots - 1) * tier_step)
+            last = min(int(end), first + slots * tier_step)  # Más allá de reference no hay datos todavía
+            for bucket in range(first, last + 1, tier_step):
+                base = offset + (bucket // tier_step) % slots * _ROW
+                if v[base] != bucket:
+                    continue
+                value = v[base + metric_index]
+                if math.isnan(value):
+                    continue
+                key = bucket - bucket % step
+                total, count = sums.get(key, (0.0, 0))
+                sums[key] = (total + value, count + 1)
+
+        return step, [[key, round(total / count, 2)] for key, (total, count) in sorted(sums.items())]
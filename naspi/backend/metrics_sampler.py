@@ -0,0 +1,160 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: metrics_sampler.py
+# Descripción: Muestreador en segundo plano de las métricas del sistema (CPU, temperatura, RAM, disco RAID y telemática).
+# Un único worker por host toma las muestras y las publica en un snapshot compartido, de modo que /api/hardware y
+# /api/telematic responden al instante leyendo ese snapshot en lugar de bloquear el worker midiendo la CPU.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import time
+import psutil
+import Info_checker as info
+import NAS_status as NASStatus
+import background_tasks as bg
+import event_bus
+from metrics_history import MetricsHistory, METRICS
+
+# Variables Globales
+SAMPLE_INTERVAL = 1.0       # Segundos entre muestras de hardware
+TELEMATIC_INTERVAL = 30.0   # Segundos entre lecturas de la configuración de red (cambia muy poco)
+SNAPSHOT_NAME = "metrics"   # Nombre del snapshot compartido (ver background_tasks.py)
+STALE_AFTER = 10 * SAMPLE_INTERVAL  # Si el snapshot es más antiguo, el líder ha muerto y aún no hay relevo
+SMART_SNAPSHOT_NAME = "nas_status"
+SMART_CHECK_INTERVAL = 30.0 # Cada cuánto se revisa la caché SMART (cada disco se consulta como mucho cada SMART_TTL)
+
+_history = None  # MetricsHistory de solo lectura para los workers (se abre bajo demanda)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> _sample_forever() --> None
+# Descripción: Bucle del proceso líder. La primera llamada a cpu_percent(None) sirve de referencia; a partir de ahí cada
+# muestra mide el uso de CPU desde la anterior sin bloquear.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _sample_forever():
+    info.get_hardware_info(cpu_interval=None)
+    telematic = None
+    telematic_time = 0.0
+    history = MetricsHistory(writable=True)
+    net_prev = psutil.net_io_counters()
+    disks_prev = NASStatus.read_diskstats()
+    net_prev_time = time.monotonic()
+    last_hardware = None
+    last_nas_status = None
+
+    while True:
+        started = time.monotonic()
+        now = time.time()
+
+        if telematic is None or now - telematic_time >= TELEMATIC_INTERVAL:
+            try:
+                telematic = info.get_telematic_info()
+                telematic_time = now
+            except Exception as e:
+                print(f"[WARN] No se pudo leer la información telemática: {e}")
+
+        metrics = info.get_hardware_metrics(cpu_interval=None)
+        hardware = info.format_hardware_info(metrics)
+
+        net = psutil.net_io_counters()
+        disks = NASStatus.read_diskstats()
+        elapsed = max(started - net_prev_time, 1e-3)
+        throughput = NASStatus.get_disk_throughput(disks_prev, disks, elapsed)
+        disk = metrics["disk"]
+        history.record(now, {
+            "cpu": metrics["cpu"],
+            "temp": metrics["temp"],
+            "ram": metrics["ram_percent"],
+            "disk": disk.used / disk.total * 100 if disk.total else None,
+            "net_rx": max(net.bytes_recv - net_prev.bytes_recv, 0) / elapsed,
+            "net_tx": max(net.bytes_sent - net_prev.bytes_sent, 0) / elapsed,
+        })
+        net_prev, disks_prev, net_prev_time = net, disks, started
+
+        bg.write_shared_json(SNAPSHOT_NAME, {
+            "timestamp": now,
+            "hardware": hardware,
+            "telematic": telematic,
+            "telematic_timestamp": telematic_time,
+            "disks": throughput,
+        })
+
+        # Solo se empuja a los clientes SSE lo que ha cambiado desde la última muestra
+        if hardware != last_hardware:
+            event_bus.publish("hardware", dict(hardware, timestamp=now))
+            last_hardware = hardware
+        nas_status = get_nas_status()
+        if (nas_status["status"], nas_status["speed"]) != last_nas_status:
+            event_bus.publish("nas_status", nas_status)
+            last_nas_status = (nas_status["status"], nas_status["speed"])
+
+        time.sleep(max(0.0, SAMPLE_INTERVAL - (time.monotonic() - started)))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> _collect_smart_forever() --> None
+# Descripción: Bucle del líder del estado SMART. Va en un hilo propio porque smartctl tarda y no debe retrasar el muestreo
+# de 1 s; NAS_status.get_smart_status() solo vuelve a consultar los discos cuya entrada en caché ha caducado.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _collect_smart_forever():
+    while True:
+        status = NASStatus.get_smart_status()
+        bg.write_shared_json(SMART_SNAPSHOT_NAME, {"timestamp": time.time(), "status": status})
+        time.sleep(SMART_CHECK_INTERVAL)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> start() --> None
+# Descripción: Arranca el muestreador. Se llama en cada worker, pero solo el que obtiene el lock del host toma muestras
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start():
+    bg.run_as_host_leader("metrics_sampler", _sample_forever)
+    bg.run_as_host_leader("smart_collector", _collect_smart_forever)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_snapshot() --> snapshot:dict|None
+# Descripción: Devuelve el último snapshot publicado por el líder, o None si no existe o está obsoleto
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_snapshot():
+    snapshot = bg.read_shared_json(SNAPSHOT_NAME)
+    if not snapshot or time.time() - snapshot.get("timestamp", 0) > STALE_AFTER:
+        return None
+    return snapshot
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_hardware_info() --> info:dict
+# Descripción: Información de hardware del snapshot junto con la marca de tiempo de la muestra. Si todavía no hay snapshot
+# se calcula al momento sin bloquear (el uso de CPU puede ser impreciso en esa primera lectura).
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_hardware_info():
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return dict(info.get_hardware_info(cpu_interval=None), timestamp=time.time())
+    return dict(snapshot["hardware"], timestamp=snapshot["timestamp"])
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_telematic_info() --> info:dict
+# Descripción: Información telemática del snapshot junto con la marca de tiempo de la lectura
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_telematic_info():
+    snapshot = get_snapshot()
+    if snapshot is None or snapshot.get("telematic") is None:
+        return dict(info.get_telematic_info(), timestamp=time.time())
+    return dict(snapshot["telematic"], timestamp=snapshot["telematic_timestamp"])
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_nas_status() --> info:dict
+# Descripción: Estado SMART (cacheado) y velocidad de lectura/escritura actual de cada disco del RAID
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_nas_status():
+    smart = bg.read_shared_json(SMART_SNAPSHOT_NAME) or {}
+    status = smart.get("status") or {device: "Pending" for device in NASStatus.DEVICES}
+
+    snapshot = get_snapshot()
+    throughput = (snapshot or {}).get("disks") or {}
+    speed = []
+    for device in NASStatus.DEVICES:
+        rates = throughput.get(device)
+        speed.append(f"R {rates['read']} / W {rates['write']} MB/sec" if rates else "No data")
+
+    return dict(devices=NASStatus.DEVICES, status=status, speed=speed, throughput=throughput,
+                smart_timestamp=smart.get("timestamp"), timestamp=(snapshot or {}).get("timestamp"))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# metric:str, start:float, end:float, step:int|None --> get_history() --> (step:int, points:list)
+# Descripción: Consulta el histórico de una métrica (ver metrics_history.py) reducido en el servidor
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_history(metric, start, end, step=None):
+    global _history
+    if _history is None:
+        _history = MetricsHistory()
+    return _history.query(metric, start, end, step)
@@ -0,0 +1,104 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: portainer_client.py
+# Descripción: Cliente HTTP de la API de Portainer. Usa una única requests.Session con un pool de conexiones keep-alive
+# (sin abrir una conexión TCP/TLS nueva en cada llamada), renueva el JWT automáticamente cuando Portainer responde 401
+# (un solo login aunque fallen varias peticiones a la vez) y agrupa las lecturas idénticas simultáneas: si varios hilos
+# piden el mismo GET a la vez, solo uno llega a Portainer y el resto esperan su respuesta.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Variables Globales
+POOL_SIZE = 16                  # Conexiones reutilizables (una por hilo de gunicorn)
+DEFAULT_TIMEOUT = (5, 60)       # Segundos (conexión, lectura)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _Call:
+    """Petición en curso compartida por todos los hilos que piden lo mismo."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PortainerClient:
+    def __init__(self, portainer_url, username, password, verify=False, token=None):
+        self.portainer_url = portainer_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._auth_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._token = token or self._login()  # Con un JWT ya obtenido (p.ej. por otro worker) no hace login
+
+    @property
+    def token(self):
+        return self._token
+
+    def _login(self):
+        try:
+            response = self.session.post(f"{self.portainer_url}/api/auth",
+                                         json={"Username": self.username, "Password": self.password},
+                                         timeout=DEFAULT_TIMEOUT)
+            response.raise_for_status()
+            return response.json()["jwt"]
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Failed to authenticate with Portainer API: {e}")
+
+    def _refresh_token(self, stale_token):
+        """Vuelve a hacer login si nadie lo ha hecho ya desde que se usó stale_token."""
+        with self._auth_lock:
+            if self._token == stale_token:
+                print("[INFO] JWT de Portainer caducado; renovando sesión")
+                self._token = self._login()
+
+    def request(self, method, path, timeout=DEFAULT_TIMEOUT, **kwargs):
+        """Petición a la API (path relativo, p.ej. "/api/stacks"). Si el JWT ha caducado se renueva y se repite una vez.
+        Devuelve la respuesta sin comprobar el código de estado."""
+        url = f"{self.portainer_url}{path}"
+        for attempt in range(2):
+            token = self._token
+            response = self.session.request(method, url, headers={"Authorization": f"Bearer {token}"},
+                                            timeout=timeout, **kwargs)
+            if response.status_code != 401 or attempt:
+                return response
+            response.close()
+            self._refresh_token(token)
+        return response
+
+    def get_json(self, path, params=None):
+        """GET que devuelve el JSON de la respuesta (lanza requests.HTTPError si falla). Las llamadas idénticas
+        simultáneas comparten una sola petición a Portainer, así que el resultado no debe modificarse."""
+        key = (path, tuple(sorted((params or {}).items())))
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            response = self.request("GET", path, params=params)
+            response.raise_for_status()
+            call.result = response.json()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            call.done.set()
@@ -1,7 +1,13 @@
 import os
+import re
 import json
+import time
+import threading
 import traceback
 import requests
+import background_tasks as bg
+import event_bus
+from portainer_client import PortainerClient
 from dotenv import load_dotenv
 import stat  # 👈 necesario para chmod 777
 
@@ -10,64 +16,60 @@ env_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(env_path):
     load_dotenv(env_path)
 
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+SERVICES_STATE_NAME = "services_state"  # Snapshot compartido entre workers (ver background_tasks.write_shared_json)
+SERVICES_STATE_TTL = 120                # Segundos tras los que un snapshot se considera caducado y se recalcula
+EVENTS_RESYNC_INTERVAL = 60             # Sin eventos durante este tiempo, el vigilante recalcula igualmente
+EVENTS_DEBOUNCE = 1.0                   # Segundos que se agrupan los eventos de una misma operación
+# Acciones de Docker que cambian el estado de un servicio
+STATE_ACTIONS = {"create", "start", "restart", "stop", "die", "kill", "pause", "unpause", "destroy", "oom"}
+SERVICES_PATH = os.path.join(os.path.dirname(__file__), "data", "services.json")
+IMAGE_LINE = re.compile(r'^\s*image:\s*["\']?([^"\'\s#]+)')
+PULL_TIMEOUT = (5, 300)                 # Una capa grande puede tardar en dar señales de vida
+
+class StacksUnavailable(Exception):
+    """No se ha podido obtener la lista de stacks de Portainer."""
+
+def load_service_definitions():
+    if not os.path.exists(SERVICES_PATH):
+        raise FileNotFoundError(f"services.json no encontrado en {SERVICES_PATH}")
+    with open(SERVICES_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
 class PortainerManager:
-    def __init__(self, portainer_url=None, username=None, password=None, environment_id=None):
+    def __init__(self, portainer_url=None, username=None, password=None, environment_id=None, api_token=None):
         self.portainer_url = (portainer_url or os.getenv("PORTAINER_URL", "")).rstrip('/')
         self.environment_id = int(environment_id or os.getenv("PORTAINER_ENVIRONMENT_ID", 1))
         self.username = username or os.getenv("PORTAINER_USERNAME")
         self.password = password or os.getenv("PORTAINER_PASSWORD")
-        self._api_token = self._login_and_get_jwt(self.username, self.password)
+        # Sesión HTTP compartida por todas las operaciones (pool keep-alive y renovación del JWT)
+        self.client = PortainerClient(self.portainer_url, self.username, self.password, token=api_token)
         
-        services_path = os.path.join(os.path.dirname(__file__), "data", "services.json")
-        if not os.path.exists(services_path):
-            raise FileNotFoundError(f"services.json no encontrado en {services_path}")
-
-        with open(services_path, 'r', encoding='utf-8') as f:
-            self.service_compose_definitions = json.load(f)
+        self.service_compose_definitions = load_service_definitions()
 
         self.known_service_names = list(self.service_compose_definitions.keys())
 
-    def _login_and_get_jwt(self, username, password):
-        try:
-            response = requests.post(
-                f"{self.portainer_url}/api/auth",
-                json={"Username": username, "Password": password},
-                verify=False
-            )
-            response.raise_for_status()
-            return response.json()["jwt"]
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"Failed to authenticate with Portainer API: {e}")
-
-    def _get_headers(self):
-        if not self._api_token:
-            raise ValueError("JWT token not available. Make sure login succeeded.")
-        return {
-            "Authorization": f"Bearer {self._api_token}",
-            "Content-Type": "application/json"
-        }
-
     def _list_stacks(self):
+        """Stacks de Portainer. Si no se pueden listar lanza StacksUnavailable: una lista vacía haría creer que el servicio
+        no está instalado."""
         try:
-            url = f"{self.portainer_url}/api/stacks?endpointId={self.environment_id}"
-            response = requests.get(url, headers=self._get_headers(), verify=False)
-            response.raise_for_status()
-            return response.json()
+            return self.client.get_json("/api/stacks", {"endpointId": self.environment_id})
         except requests.exceptions.RequestException as e:
             traceback.print_exc()
-            return []
+            raise StacksUnavailable(f"No se pudo consultar la lista de stacks de Portainer: {e}")
 
-    def _list_containers_in_stack(self, stack_id):
-        try:
-            filters = {"stackId": str(stack_id)}
-            encoded_filters = requests.utils.quote(json.dumps(filters))
-            url = f"{self.portainer_url}/api/containers?filters={encoded_filters}&endpointId={self.environment_id}"
-            response = requests.get(url, headers=self._get_headers(), verify=False)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            traceback.print_exc()
-            return []
+    def _list_stack_containers(self):
+        """Contenedores de todos los stacks en una sola llamada, agrupados por el nombre del proyecto compose (el nombre
+        del stack en Portainer)."""
+        filters = json.dumps({"label": [COMPOSE_PROJECT_LABEL]})
+        containers = self.client.get_json(f"/api/endpoints/{self.environment_id}/docker/containers/json",
+                                          {"all": 1, "filters": filters})
+        by_project = {}
+        for container in containers:
+            project = (container.get("Labels") or {}).get(COMPOSE_PROJECT_LABEL)
+            by_project.setdefault(project, []).append(container)
+        return by_project
 
     def _ensure_volume_permissions(self, service_key):
         try:
@@ -85,19 +87,38 @@ class PortainerManager:
         except Exception as e:
             print(f"[WARN] No se pudo establecer permisos para {service_key}: {e}")
 
+    def service_images(self, service_name):
+        """Imágenes que usa el compose de un servicio."""
+        compose = self.service_compose_definitions[service_name]["compose"]
+        return [m.group(1) for m in map(IMAGE_LINE.match, compose.splitlines()) if m]
+
+    def pull_image(self, image, progress=None):
+        """Descarga una imagen a través del proxy Docker de Portainer. progress(mensaje) recibe cada línea de progreso de
+        Docker ({"id": capa, "status", "progressDetail": {"current", "total"}}). Así el despliegue posterior del stack
+        ya no tiene que descargar nada y el progreso de la descarga se puede mostrar."""
+        name, tag = image, "latest"
+        if ":" in image.rsplit("/", 1)[-1]:
+            name, tag = image.rsplit(":", 1)
+        with self.client.request("POST", f"/api/endpoints/{self.environment_id}/docker/images/create",
+                                 params={"fromImage": name, "tag": tag}, stream=True, timeout=PULL_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if "error" in message:  # Docker informa de los errores dentro del flujo, con código 200
+                    raise RuntimeError(f"Error descargando {image}: {message['error']}")
+                if progress:
+                    progress(message)
+
     def get_available_services(self):
         try:
-            stacks = self._list_stacks()
-            installed_stack_names = [stack.get('Name') for stack in stacks]
-            services_list = []
-            for service_key, service_info in self.service_compose_definitions.items():
-                installed = service_info.get("name") in installed_stack_names
-                services_list.append({
-                    "service_name": service_key,
-                    "displayName": service_info.get("displayName", service_key.capitalize()),
-                    "description": service_info.get("description", "No description available."),
-                    "installed": installed
-                })
+            services_list = [{
+                "service_name": service["service_name"],
+                "displayName": service["displayName"],
+                "description": service["description"],
+                "installed": service["status"] != 'Not Installed'
+            } for service in self._services_state()]
             return {"success": True, "available_services": services_list}, 200
         except Exception as e:
             traceback.print_exc()
@@ -110,16 +131,20 @@ class PortainerManager:
                 return {"success": False, "message": f"Servicio {service_name} no encontrado."}, 404
             stacks = self._list_stacks()
             if any(stack.get('Name') == service_info["name"] for stack in stacks):
-                return {"success": False, "message": f"Servicio {service_name} ya está instalado."}, 409
-            url = f"{self.portainer_url}/api/stacks/create/standalone/string?endpointId={self.environment_id}"
+                return {"success": False, "message": f"Servicio {service_name} ya está instalado.", "installed": True}, 409
             payload = {
                 "name": service_info["name"],
                 "stackFileContent": service_info["compose"]
             }
-            response = requests.post(url, headers=self._get_headers(), json=payload, verify=False)
+            # Sin límite de lectura: Portainer no responde hasta haber descargado las imágenes
+            response = self.client.request("POST", "/api/stacks/create/standalone/string",
+                                           params={"endpointId": self.environment_id}, json=payload, timeout=(5, None))
             response.raise_for_status()
             self._ensure_volume_permissions(service_name)  # 👈 Permisos tras instalación
+            self._after_change(service_name)
             return {"success": True, "message": f"Servicio {service_name} instalado correctamente."}, response.status_code
+        except StacksUnavailable as e:
+            return {"success": False, "message": str(e)}, 502
         except requests.exceptions.RequestException as e:
             traceback.print_exc()
             return {"success": False, "message": str(e)}, getattr(e.response, 'status_code', 500)
@@ -132,59 +157,127 @@ class PortainerManager:
             stacks = self._list_stacks()
             matching_stacks = [s for s in stacks if s.get('Name') == service_info["name"]]
             if not matching_stacks:
-                return {"success": False, "message": f"Servicio {service_name} no encontrado en Portainer."}, 404
+                return {"success": False, "message": f"Servicio {service_name} no encontrado en Portainer.",
+                        "installed": False}, 404
             stack_id = matching_stacks[0].get('Id')
-            url = f"{self.portainer_url}/api/stacks/{stack_id}?endpointId={self.environment_id}"
-            response = requests.delete(url, headers=self._get_headers(), verify=False)
+            response = self.client.request("DELETE", f"/api/stacks/{stack_id}", params={"endpointId": self.environment_id})
             response.raise_for_status()
+            self._after_change(service_name)
             return {"success": True, "message": f"Servicio {service_name} eliminado correctamente."}, response.status_code
+        except StacksUnavailable as e:
+            return {"success": False, "message": str(e)}, 502
         except requests.exceptions.RequestException as e:
             traceback.print_exc()
             return {"success": False, "message": str(e)}, getattr(e.response, 'status_code', 500)
 
+    def _build_services_state(self):
+        """Estado de todos los servicios consultado a Portainer (dos llamadas). Lanza una excepción si Portainer falla,
+        para no guardar como "no instalado" lo que solo no se ha podido consultar."""
+        known_stack_names = {s['name'] for s in self.service_compose_definitions.values()}
+        stacks = self.client.get_json("/api/stacks", {"endpointId": self.environment_id})
+        installed_stacks = {stack.get('Name'): stack for stack in stacks if stack.get('Name') in known_stack_names}
+        # Una sola consulta de contenedores para todos los stacks (antes, una por stack instalado)
+        containers_by_stack = self._list_stack_containers() if installed_stacks else {}
+        services_status_list = []
+        for service_key, service_info in self.service_compose_definitions.items():
+            stack_name = service_info["name"]
+            stack = installed_stacks.get(stack_name)
+            status = 'Not Installed'
+            stack_id = None
+            running_count = 0
+            total_count = 0
+            access_port = service_info.get("access_port")
+            if stack:
+                stack_id = stack.get('Id')
+                # Compose normaliza el nombre del proyecto a minúsculas
+                containers = containers_by_stack.get(stack_name.lower(), [])
+                running_containers = [c for c in containers if c.get('State') == 'running']
+                running_count = len(running_containers)
+                total_count = len(containers)
+                if total_count > 0:
+                    status = 'Running' if running_count > 0 else 'Stopped'
+                else:
+                    raw_status = stack.get('Status')
+                    status = 'Error/Unknown' if raw_status == 1 else 'Error/NoServices'
+            services_status_list.append({
+                "service_name": service_key,
+                "stack_name": stack_name,
+                "stack_id": stack_id,
+                "status": status,
+                "running_count": running_count,
+                "total_count": total_count,
+                "access_port": access_port,
+                "displayName": service_info.get("displayName", service_key.capitalize()),
+                "description": service_info.get("description", "No description available.")
+            })
+        return services_status_list
+
+    def refresh_services_state(self):
+        """Recalcula el estado, lo comparte con el resto de workers y lo envía a los clientes SSE."""
+        services = self._build_services_state()
+        previous = bg.read_shared_json(SERVICES_STATE_NAME)
+        bg.write_shared_json(SERVICES_STATE_NAME, {"timestamp": time.time(), "services": services})
+        if previous is None or previous["services"] != services:
+            event_bus.publish("services", services)
+        return services
+
+    def _services_state(self):
+        """Estado de los servicios desde memoria. Lo mantiene al día el vigilante de eventos (watch_services) y las
+        operaciones de este módulo; solo si el snapshot falta o ha caducado se consulta a Portainer."""
+        snapshot = bg.read_shared_json(SERVICES_STATE_NAME)
+        if snapshot and time.time() - snapshot["timestamp"] < SERVICES_STATE_TTL:
+            return snapshot["services"]
+        return self.refresh_services_state()
+
+    def _after_change(self, service_name):
+        """Write-through tras una operación: el estado nuevo se publica sin esperar a los eventos de Docker."""
+        try:
+            self.refresh_services_state()
+        except Exception as e:
+            print(f"[WARN] No se pudo actualizar el estado de los servicios tras cambiar {service_name}: {e}")
+
     def list_installed_services(self):
         try:
-            all_stacks = self._list_stacks()
-            installed_stacks = {
-                stack.get('Name'): stack for stack in all_stacks
-                if stack.get('Name') in [s['name'] for s in self.service_compose_definitions.values()]
-            }
-            services_status_list = []
-            for service_key, service_info in self.service_compose_definitions.items():
-                stack_name = service_info["name"]
-                stack = installed_stacks.get(stack_name)
-                status = 'Not Installed'
-                stack_id = None
-                running_count = 0
-                total_count = 0
-                access_port = service_info.get("access_port")
-                if stack:
-                    stack_id = stack.get('Id')
-                    containers = self._list_containers_in_stack(stack_id)
-                    running_containers = [c for c in containers if 'running' in c.get('Status', '').lower()]
-                    running_count = len(running_containers)
-                    total_count = len(containers)
-                    if total_count > 0:
-                        status = 'Running' if running_count > 0 else 'Stopped'
-                    else:
-                        raw_status = stack.get('Status')
-                        status = 'Error/Unknown' if raw_status == 1 else 'Error/NoServices'
-                services_status_list.append({
-                    "service_name": service_key,
-                    "stack_name": stack_name,
-                    "stack_id": stack_id,
-                    "status": status,
-                    "running_count": running_count,
-                    "total_count": total_count,
-                    "access_port": access_port,
-                    "displayName": service_info.get("displayName", service_key.capitalize()),
-                    "description": service_info.get("description", "No description available.")
-                })
-            return {"success": True, "services": services_status_list}, 200
+            return {"success": True, "services": self._services_state()}, 200
         except Exception as e:
             traceback.print_exc()
             return {"success": False, "message": f"Error al listar servicios: {str(e)}"}, 500
 
+    def watch_services(self):
+        """Vigilante (un único worker por host): escucha el flujo de eventos de Docker a través de Portainer y recalcula
+        el snapshot cuando un contenedor de un stack cambia de estado (agrupando los eventos de EVENTS_DEBOUNCE segundos).
+        Si no llega ningún evento en EVENTS_RESYNC_INTERVAL segundos recalcula igualmente y vuelve a conectar."""
+        dirty = threading.Event()
+
+        def _refresh_on_events():
+            while True:
+                dirty.wait()
+                time.sleep(EVENTS_DEBOUNCE)
+                dirty.clear()
+                self._after_change("contenedores")
+
+        def _watch_forever():
+            threading.Thread(target=_refresh_on_events, name="naspi-services-refresh", daemon=True).start()
+            filters = json.dumps({"type": ["container"], "label": [COMPOSE_PROJECT_LABEL]})
+            while True:
+                since = int(time.time())
+                try:
+                    self.refresh_services_state()
+                    with self.client.request("GET", f"/api/endpoints/{self.environment_id}/docker/events",
+                                             params={"filters": filters, "since": since}, stream=True,
+                                             timeout=(5, EVENTS_RESYNC_INTERVAL)) as response:
+                        response.raise_for_status()
+                        for line in response.iter_lines():
+                            if line and json.loads(line).get("Action", "").split(":")[0] in STATE_ACTIONS:
+                                dirty.set()
+                except requests.exceptions.ConnectionError:
+                    pass  # Incluye el timeout de lectura: se recalcula y se vuelve a conectar
+                except Exception as e:
+                    print(f"[WARN] Error siguiendo los eventos de Docker: {e}")
+                    time.sleep(10)
+
+        bg.run_as_host_leader("services_watcher", _watch_forever, retry_interval=30)
+
     def start_service(self, service_name):
         try:
             service_info = self.service_compose_definitions.get(service_name)
@@ -195,10 +288,12 @@ class PortainerManager:
             if not matching_stack:
                 return {"success": False, "message": f"Stack para {service_name} no encontrado."}, 404
             stack_id = matching_stack.get('Id')
-            url = f"{self.portainer_url}/api/stacks/{stack_id}/start?endpointId={self.environment_id}"
-            response = requests.post(url, headers=self._get_headers(), verify=False)
+            response = self.client.request("POST", f"/api/stacks/{stack_id}/start", params={"endpointId": self.environment_id})
             response.raise_for_status()
+            self._after_change(service_name)
             return {"success": True, "message": f"Servicio {service_name} iniciado correctamente."}, response.status_code
+        except StacksUnavailable as e:
+            return {"success": False, "message": str(e)}, 502
         except requests.exceptions.RequestException as e:
             traceback.print_exc()
             return {"success": False, "message": f"Error al iniciar servicio: {str(e)}"}, getattr(e.response, 'status_code', 500)
@@ -213,10 +308,12 @@ class PortainerManager:
             if not matching_stack:
                 return {"success": False, "message": f"Stack para {service_name} no encontrado."}, 404
             stack_id = matching_stack.get('Id')
-            url = f"{self.portainer_url}/api/stacks/{stack_id}/stop?endpointId={self.environment_id}"
-            response = requests.post(url, headers=self._get_headers(), verify=False)
+            response = self.client.request("POST", f"/api/stacks/{stack_id}/stop", params={"endpointId": self.environment_id})
             response.raise_for_status()
+            self._after_change(service_name)
             return {"success": True, "message": f"Servicio {service_name} detenido correctamente."}, response.status_code
+        except StacksUnavailable as e:
+            return {"success": False, "message": str(e)}, 502
         except requests.exceptions.RequestException as e:
             traceback.print_exc()
             return {"success": False, "message": f"Error al detener servicio: {str(e)}"}, getattr(e.response, 'status_code', 500)
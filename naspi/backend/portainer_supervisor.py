@@ -0,0 +1,130 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: portainer_supervisor.py
+# Descripción: Supervisión de la conexión con Portainer fuera de las peticiones. Un único worker por host (el líder) hace
+# el login y comprueba periódicamente que Portainer responde; si no, reintenta con espera exponencial. El estado (up/down,
+# cuándo se reintentará y el JWT vigente) se comparte con el resto de workers en memoria, de modo que cada worker crea su
+# PortainerManager con ese JWT sin hacer login y, mientras Portainer no está disponible, las rutas responden 503 con
+# Retry-After al momento en lugar de dormir dentro de la petición.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import time
+import threading
+import background_tasks as bg
+from portainer_client import PortainerClient
+from portainer_manager import PortainerManager
+
+# Variables Globales
+STATE_NAME = "portainer_state"
+HEALTH_INTERVAL = 30        # Segundos entre comprobaciones mientras Portainer está disponible
+INITIAL_BACKOFF = 2         # Primera espera tras un fallo (se duplica en cada intento)
+MAX_BACKOFF = 120
+STARTING_RETRY_AFTER = 5    # Retry-After mientras el líder aún no ha hecho el primer intento
+STALE_AFTER = 3 * HEALTH_INTERVAL   # Sin actualizar en este tiempo (más allá del reintento previsto) el estado no vale
+
+_config = None
+_manager = None
+_watching = False
+_manager_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class PortainerUnavailable(Exception):
+    """Portainer no está disponible; retry_after son los segundos recomendados antes de reintentar."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _write_state(status, **fields):
+    bg.write_shared_json(STATE_NAME, {"status": status, "checked": time.time(), **fields})
+
+def _supervise_forever():
+    global _watching
+    url, username, password, environment_id = _config
+    client = None
+    backoff = INITIAL_BACKOFF
+    while True:
+        try:
+            if client is None:
+                client = PortainerClient(url, username, password)
+                print("[INFO] Conexión con Portainer establecida")
+                # El vigilante de eventos solo hace falta una vez por host: se arranca desde aquí
+                if not _watching:
+                    _get_local_manager(client.token).watch_services()
+                    _watching = True
+            else:
+                client.request("GET", "/api/status").raise_for_status()
+            _write_state("up", token=client.token)
+            backoff = INITIAL_BACKOFF
+            time.sleep(HEALTH_INTERVAL)
+        except Exception as e:
+            client = None
+            retry_at = time.time() + backoff
+            _write_state("down", error=str(e), retryAt=retry_at)
+            print(f"[WARN] Portainer no disponible ({e}); nuevo intento en {backoff} s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+def _get_local_manager(token):
+    """PortainerManager de este worker, creado con el JWT compartido (sin login ni esperas)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            url, username, password, environment_id = _config
+            _manager = PortainerManager(url, username, password, environment_id, api_token=token)
+        return _manager
+#-----------------------------------------------------------------------------------------------------------------------------------
+# url:str, username:str, password:str, environment_id:int --> configure() --> configured:bool
+# Descripción: Datos de conexión (por defecto, los del .env). Los procesos que solo usan get_manager() (p.ej. el de
+# trabajos) no necesitan llamarla: se configuran con el .env la primera vez
+#-----------------------------------------------------------------------------------------------------------------------------------
+def configure(url=None, username=None, password=None, environment_id=None):
+    global _config
+    _config = (url or os.getenv("PORTAINER_URL"), username or os.getenv("PORTAINER_USERNAME"),
+               password or os.getenv("PORTAINER_PASSWORD"),
+               int(environment_id or os.getenv("PORTAINER_ENVIRONMENT_ID", 1)))
+    return all(_config[:3])
+#-----------------------------------------------------------------------------------------------------------------------------------
+# url:str, username:str, password:str, environment_id:int --> start() --> None
+# Descripción: Arranca la supervisión (solo la ejecuta el worker líder; el resto lee el estado compartido)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start(url, username, password, environment_id):
+    configure(url, username, password, environment_id)
+    bg.run_as_host_leader("portainer_supervisor", _supervise_forever, retry_interval=5)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_state() --> state:dict
+# Descripción: Estado compartido por el líder. Si lleva demasiado sin actualizarse (el líder se ha colgado o ha muerto y
+# aún no hay otro) se devuelve "unknown": un "up" antiguo no garantiza que Portainer siga respondiendo
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_state():
+    if _config is None:
+        configure()
+    if not all(_config[:3]):
+        return {"status": "unconfigured"}
+    state = bg.read_shared_json(STATE_NAME)
+    if state is None:
+        return {"status": "starting"}
+    expected = state["retryAt"] if state["status"] == "down" else state["checked"]
+    if time.time() - expected > STALE_AFTER:
+        return {"status": "unknown", "checked": state["checked"]}
+    return state
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> get_manager() --> manager:PortainerManager
+# Descripción: Manager de este worker si Portainer está disponible. Si no, lanza PortainerUnavailable sin esperar
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_manager():
+    state = get_state()
+    if state["status"] == "up":
+        return _get_local_manager(state["token"])
+    if state["status"] == "unconfigured":
+        raise PortainerUnavailable("Portainer no está configurado (revisa el fichero .env)", MAX_BACKOFF)
+    if state["status"] == "starting":
+        raise PortainerUnavailable("Conectando con Portainer", STARTING_RETRY_AFTER)
+    if state["status"] == "unknown":
+        raise PortainerUnavailable("Estado de Portainer desconocido: la supervisión no lo ha actualizado",
+                                   STARTING_RETRY_AFTER)
+    retry_after = max(1, round(state["retryAt"] - time.time()))
+    raise PortainerUnavailable(f"Portainer no disponible: {state['error']}", retry_after)
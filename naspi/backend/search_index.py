@@ -0,0 +1,259 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: search_index.py
+# Descripción: Índice de búsqueda de nombres y rutas de /mnt/raid/files (SQLite FTS5 con tokenizador trigram en
+# data/search_index.db). Un rastreador en segundo plano (un único worker por host, con prioridad mínima de CPU y E/S)
+# recorre el árbol completo al arrancar si el índice está vacío y después cada CRAWL_INTERVAL; entre rastreos el índice se
+# mantiene al día con los cambios que hace la propia API (ver fs_hooks.py). El contenido de las carpetas nuevas (movidas o
+# copiadas) no se recorre en el hilo que notifica el cambio: queda en cola y lo indexa el rastreador.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import time
+import sqlite3
+import threading
+import background_tasks as bg
+
+# Variables Globales
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'data', 'search_index.db')
+CRAWL_INTERVAL = 24 * 3600      # Segundos entre rastreos completos (recogen cambios hechos fuera de la API)
+PENDING_INTERVAL = 2            # Segundos entre comprobaciones de carpetas nuevas pendientes de indexar
+BATCH_SIZE = 5000               # Filas por transacción durante el rastreo
+MAX_RESULTS = 500
+HIDDEN_SUFFIXES = (".uploading",)
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class SearchError(ValueError):
+    """Parámetros de búsqueda no válidos."""
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _create_schema(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            scan_id INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS files_scan ON files(scan_id);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS pending (path TEXT PRIMARY KEY, queued REAL NOT NULL);  -- Carpetas por recorrer
+    """)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone():
+        return
+    # trigram (SQLite >= 3.34) permite buscar cualquier subcadena; si no está disponible se busca por prefijos de palabra
+    try:
+        conn.execute("CREATE VIRTUAL TABLE files_fts USING fts5(name, path, content='files', content_rowid='id', "
+                     "tokenize='trigram')")
+        tokenizer = "trigram"
+    except sqlite3.OperationalError:
+        conn.execute("CREATE VIRTUAL TABLE files_fts USING fts5(name, path, content='files', content_rowid='id', "
+                     "tokenize='unicode61 remove_diacritics 2')")
+        tokenizer = "unicode61"
+    # El índice FTS solo cambia al insertar o borrar rutas: actualizar tamaño, fecha o scan_id no lo toca
+    conn.executescript("""
+        CREATE TRIGGER files_ai AFTER INSERT ON files BEGIN
+            INSERT INTO files_fts(rowid, name, path) VALUES (new.id, new.name, new.path);
+        END;
+        CREATE TRIGGER files_ad AFTER DELETE ON files BEGIN
+            INSERT INTO files_fts(files_fts, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);
+        END;
+    """)
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('tokenizer', ?)", (tokenizer,))
+
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+        conn = sqlite3.connect(INDEX_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, conn:
+            _create_schema(conn)
+        _local.tokenizer = conn.execute("SELECT value FROM meta WHERE key = 'tokenizer'").fetchone()[0]
+        _local.conn = conn
+    return conn
+
+def _is_hidden(name):
+    return name.startswith('.') and name.endswith(HIDDEN_SUFFIXES)
+
+def _upsert(conn, rows):
+    conn.executemany("""
+        INSERT INTO files (path, name, is_dir, size, mtime, scan_id) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, size = excluded.size, mtime = excluded.mtime,
+                                        scan_id = excluded.scan_id""", rows)
+
+def _delete_tree(conn, path):
+    prefix = path + '/'
+    conn.execute("DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str, rel_path:str, removed:bool --> update_path() --> None
+# Descripción: Actualiza en el índice una ruta (relativa a root) que acaba de crearse, modificarse o borrarse. Si es una
+# carpeta nueva (p.ej. movida o copiada) su contenido se deja en cola para el rastreador (ver crawl_pending()), así que
+# la llamada no recorre el subárbol.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def update_path(root, rel_path, removed=False):
+    conn = _connection()
+    abs_path = os.path.join(root, rel_path)
+    with conn:
+        if removed or not os.path.lexists(abs_path):
+            _delete_tree(conn, rel_path)
+            return
+        st = os.stat(abs_path)
+        is_dir = os.path.isdir(abs_path)
+        _upsert(conn, [(rel_path, os.path.basename(rel_path), int(is_dir), 0 if is_dir else st.st_size,
+                        st.st_mtime, int(time.time()))])
+        if is_dir:
+            conn.execute("INSERT OR REPLACE INTO pending VALUES (?, ?)", (rel_path, time.time()))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> crawl_pending() --> count:int
+# Descripción: Recorre las carpetas que update_path() ha dejado en cola. Devuelve cuántas había
+#-----------------------------------------------------------------------------------------------------------------------------------
+def crawl_pending(root):
+    conn = _connection()
+    rows = conn.execute("SELECT path, queued FROM pending ORDER BY queued").fetchall()
+    for rel_path, queued in rows:
+        if os.path.isdir(os.path.join(root, rel_path)):
+            crawl(root, rel_path)
+        with conn:
+            # Si se ha vuelto a encolar mientras tanto (queued distinto) se recorrerá otra vez
+            conn.execute("DELETE FROM pending WHERE path = ? AND queued = ?", (rel_path, queued))
+    return len(rows)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str, start:str --> crawl() --> count:int
+# Descripción: Recorre root/start (recursivamente, por lotes) y sincroniza el índice con lo que encuentra: inserta o
+# actualiza las entradas vistas y al final borra las que ya no existen dentro de start
+#-----------------------------------------------------------------------------------------------------------------------------------
+def crawl(root, start=""):
+    conn = _connection()
+    scan_id = int(time.time())
+    stack = [start]
+    batch = []
+    count = 0
+
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel_dir)) as it:
+                for entry in it:
+                    if _is_hidden(entry.name) or (not rel_dir and entry.name == "lost+found"):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    rel_path = os.path.join(rel_dir, entry.name)
+                    batch.append((rel_path, entry.name, int(is_dir), 0 if is_dir else st.st_size, st.st_mtime, scan_id))
+                    if is_dir:
+                        stack.append(rel_path)
+        except OSError as e:
+            print(f"[WARN] No se pudo indexar {rel_dir or '/'}: {e}")
+            continue
+        if len(batch) >= BATCH_SIZE:
+            with conn:
+                _upsert(conn, batch)
+            count += len(batch)
+            batch = []
+
+    with conn:
+        _upsert(conn, batch)
+        count += len(batch)
+        # Lo que no se ha visto en este rastreo (ni se ha actualizado por la API desde que empezó) ya no existe
+        if start:
+            prefix = start + '/'
+            conn.execute("DELETE FROM files WHERE scan_id < ? AND substr(path, 1, ?) = ?", (scan_id, len(prefix), prefix))
+        else:
+            conn.execute("DELETE FROM files WHERE scan_id < ?", (scan_id,))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_crawl', ?)", (str(time.time()),))
+    return count
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> start_crawler() --> None
+# Descripción: Arranca el rastreador periódico (y el de las carpetas nuevas en cola). Solo lo ejecuta el worker líder del
+# host, con prioridad mínima
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start_crawler(root):
+    def _crawl_forever():
+        bg.lower_thread_priority()
+        while True:
+            crawl_pending(root)
+            row = _connection().execute("SELECT value FROM meta WHERE key = 'last_crawl'").fetchone()
+            wait = float(row[0]) + CRAWL_INTERVAL - time.time() if row else 0
+            if wait > 0:
+                time.sleep(min(wait, PENDING_INTERVAL))
+                continue
+            started = time.monotonic()
+            count = crawl(root)
+            print(f"[INFO] Índice de búsqueda actualizado: {count} entradas en {time.monotonic() - started:.1f} s")
+
+    bg.run_as_host_leader("search_crawler", _crawl_forever, retry_interval=60)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# query:str, kind:str|None, min_size:int|None, modified_after:float|None, path:str, limit:int, offset:int --> search()
+# --> results:list
+# Descripción: Busca query en nombres y rutas. Los resultados cuyo nombre coincide salen antes que los que solo coinciden
+# en la ruta, y dentro de cada grupo se ordenan por relevancia (bm25)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def search(query, kind=None, min_size=None, modified_after=None, path="", limit=50, offset=0):
+    terms = query.split()
+    if not terms:
+        raise SearchError("Falta el texto a buscar (q)")
+    if kind not in (None, "file", "folder"):
+        raise SearchError("type debe ser file o folder")
+    if not 0 < limit <= MAX_RESULTS or offset < 0:
+        raise SearchError(f"limit debe estar entre 1 y {MAX_RESULTS}")
+
+    conn = _connection()
+    where, params = [], []
+
+    # Los términos que el tokenizador puede indexar van a MATCH; el resto (menos de 3 letras con trigram) a LIKE
+    if _local.tokenizer == "trigram":
+        fts_terms = [t for t in terms if len(t) >= 3]
+    else:
+        fts_terms = terms
+    for term in terms:
+        if term not in fts_terms:
+            where.append("f.name LIKE ? ESCAPE '\\'")
+            params.append("%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+
+    if kind:
+        where.append("f.is_dir = ?")
+        params.append(int(kind == "folder"))
+    if min_size is not None:
+        where.append("f.size >= ?")
+        params.append(min_size)
+    if modified_after is not None:
+        where.append("f.mtime >= ?")
+        params.append(modified_after)
+    if path:
+        prefix = path.strip('/') + '/'
+        where.append("substr(f.path, 1, ?) = ?")
+        params.extend([len(prefix), prefix])
+
+    name_like = "%" + query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    if fts_terms:
+        suffix = "" if _local.tokenizer == "trigram" else "*"
+        match = " AND ".join('"' + t.replace('"', '""') + '"' + suffix for t in fts_terms)
+        sql = f"""
+            SELECT f.path, f.name, f.is_dir, f.size, f.mtime
+            FROM files_fts JOIN files f ON f.id = files_fts.rowid
+            WHERE files_fts MATCH ? {''.join(' AND ' + w for w in where)}
+            ORDER BY (f.name LIKE ? ESCAPE '\\') DESC, bm25(files_fts, 10.0, 1.0), length(f.path)
+            LIMIT ? OFFSET ?"""
+        rows = conn.execute(sql, [match] + params + [name_like, limit, offset]).fetchall()
+    else:
+        sql = f"""
+            SELECT f.path, f.name, f.is_dir, f.size, f.mtime FROM files f
+            WHERE {' AND '.join(where)}
+            ORDER BY length(f.name), f.path
+            LIMIT ? OFFSET ?"""
+        rows = conn.execute(sql, params + [limit, offset]).fetchall()
+
+    return [{"path": r[0], "name": r[1], "type": "folder" if r[2] else "file", "size": r[3], "mtime": r[4],
+             "parent": os.path.dirname(r[0])} for r in rows]
@@ -0,0 +1,162 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: sessions.py
+# Descripción: Sesiones de usuario. El login (bcrypt, lento a propósito) se hace una sola vez y emite un token firmado con
+# HMAC-SHA256 que caduca a los SESSION_TTL segundos; el token viaja en una cookie HttpOnly (o en la cabecera
+# Authorization: Bearer) y cada petición solo comprueba la firma, la caducidad y una caché en memoria del worker. Las
+# sesiones se guardan también en SQLite (data/sessions.db) para poder revocarlas: al cerrar sesión o borrar un usuario se
+# eliminan de la tabla y se actualiza un fichero "época" en memoria compartida, que todos los workers consultan (un
+# stat) para vaciar su caché.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import sqlite3
+import threading
+import background_tasks as bg
+
+# Variables Globales
+SESSIONS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'sessions.db')
+SECRET_FILE = os.path.join(os.path.dirname(__file__), 'data', 'session.key')
+EPOCH_FILE = os.path.join(bg.SHARED_DIR, "naspi_sessions_epoch")
+COOKIE_NAME = "naspi_session"
+SESSION_TTL = 7 * 24 * 3600     # Segundos de validez de una sesión
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_secret = None
+_cache = {}         # id de sesión -> usuario (solo sesiones válidas ya comprobadas en la tabla)
+_cache_epoch = None
+_cache_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(SESSIONS_FILE), exist_ok=True)
+        conn = sqlite3.connect(SESSIONS_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    expires INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS sessions_user ON sessions(user_id);
+            """)
+        _local.conn = conn
+    return conn
+
+def _get_secret():
+    """Clave HMAC: SESSION_SECRET del entorno o, si no está, una aleatoria guardada en data/session.key (la crea el
+    primer worker que la necesita; os.link falla si otro se ha adelantado y entonces se usa la suya)."""
+    global _secret
+    if _secret is None:
+        env_secret = os.getenv('SESSION_SECRET')
+        if env_secret:
+            _secret = env_secret.encode('utf-8')
+        else:
+            if not os.path.exists(SECRET_FILE):
+                tmp_path = f"{SECRET_FILE}.{os.getpid()}.tmp"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(secrets.token_bytes(32))
+                try:
+                    os.link(tmp_path, SECRET_FILE)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.unlink(tmp_path)
+            with open(SECRET_FILE, 'rb') as f:
+                _secret = f.read()
+    return _secret
+
+def _sign(payload):
+    digest = hmac.new(_get_secret(), payload.encode('ascii'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode('ascii')
+
+def _epoch():
+    try:
+        return os.stat(EPOCH_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def _bump_epoch():
+    """Avisa a todos los workers de que alguna sesión se ha revocado."""
+    with open(EPOCH_FILE, 'a'):
+        pass
+    os.utime(EPOCH_FILE, ns=(time.time_ns(), time.time_ns()))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# user:dict --> create_session() --> (token:str, expires:int)
+# Descripción: Crea una sesión para un usuario ya autenticado y devuelve el token firmado y su caducidad (epoch)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def create_session(user):
+    session_id = secrets.token_urlsafe(16)
+    now = time.time()
+    expires = int(now) + SESSION_TTL
+    with _connection() as conn:
+        conn.execute("DELETE FROM sessions WHERE expires < ?", (int(now),))
+        conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                     (session_id, user["id"], user["username"], user["role"], now, expires))
+    payload = f"{session_id}.{expires}"
+    return f"{payload}.{_sign(payload)}", expires
+#-----------------------------------------------------------------------------------------------------------------------------------
+# token:str --> verify() --> user:dict|None
+# Descripción: Usuario de la sesión ({id, username, role, sessionId}) o None si el token no es válido, ha caducado o se ha
+# revocado. En el caso habitual no toca la base de datos: firma, caducidad, un stat y un diccionario
+#-----------------------------------------------------------------------------------------------------------------------------------
+def verify(token):
+    global _cache_epoch
+    if not token:
+        return None
+    try:
+        session_id, expires, signature = token.split(".")
+        expires = int(expires)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(f"{session_id}.{expires}")) or expires < time.time():
+        return None
+
+    epoch = _epoch()
+    with _cache_lock:
+        if epoch != _cache_epoch:
+            _cache.clear()
+            _cache_epoch = epoch
+        user = _cache.get(session_id)
+    if user is not None:
+        return user
+
+    row = _connection().execute("SELECT user_id, username, role FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    if row is None:
+        return None
+    user = {"id": row["user_id"], "username": row["username"], "role": row["role"], "sessionId": session_id}
+    with _cache_lock:
+        if _cache_epoch == epoch:
+            _cache[session_id] = user
+    return user
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session_id:str --> revoke() --> None
+#-----------------------------------------------------------------------------------------------------------------------------------
+def revoke(session_id):
+    with _connection() as conn:
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+    _bump_epoch()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# user_id:str --> revoke_user() --> revoked:int
+# Descripción: Cierra todas las sesiones de un usuario (p.ej. al borrarlo)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def revoke_user(user_id):
+    with _connection() as conn:
+        revoked = conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+    _bump_epoch()
+    return revoked
@@ -0,0 +1,80 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: test_fs_cache.py
+# Descripción: Pruebas de la caché de metadatos del RAID (fs_cache.py) con varios hilos pidiendo el mismo directorio a la
+# vez, como ocurre con los hilos de gunicorn (gthread)
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fs_cache
+
+
+class ConcurrentGetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for name in ("a.txt", "b.txt"):
+            with open(os.path.join(self.tmp.name, name), "w") as f:
+                f.write(name)
+        self.cache = fs_cache.MetadataCache()
+        if not self.cache._ensure_inotify():
+            self.skipTest("inotify no disponible")
+        self._scan = fs_cache._scan
+
+    def tearDown(self):
+        fs_cache._scan = self._scan
+        self.tmp.cleanup()
+
+    def _get_concurrently(self, threads):
+        results, errors = [], []
+        barrier = threading.Barrier(threads)
+
+        def _slow_scan(path):
+            barrier.wait(timeout=5)     # Todos los hilos escanean a la vez (mismo wd)
+            time.sleep(0.05)
+            return self._scan(path)
+        fs_cache._scan = _slow_scan
+
+        def _worker():
+            try:
+                results.append(self.cache.get(self.tmp.name))
+            except Exception as e:
+                errors.append(e)
+        workers = [threading.Thread(target=_worker) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results, errors
+
+    def test_cold_gets_of_same_directory(self):
+        results, errors = self._get_concurrently(4)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsNotNone(result)
+            self.assertEqual(sorted(e["name"] for e in result[1]), ["a.txt", "b.txt"])
+        self.assertEqual(self.cache._pending, {})
+        self.assertEqual(self.cache.stats()["dirs"], 1)
+
+    def test_cached_directory_stays_watched(self):
+        self._get_concurrently(2)
+        fs_cache._scan = self._scan
+        with open(os.path.join(self.tmp.name, "c.txt"), "w") as f:
+            f.write("c")
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            names = sorted(e["name"] for e in self.cache.get(self.tmp.name)[1])
+            if "c.txt" in names:
+                break
+            time.sleep(0.02)
+        self.assertIn("c.txt", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: test_fs_hooks.py
+# Descripción: Pruebas de fs_hooks.file_changed: notificar una carpeta movida o copiada (lo que hace /api/files/move en el
+# mismo disco) no debe recorrer su subárbol en el hilo de la petición, sino dejarlo en cola para los procesos de fondo
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import event_bus
+import search_index
+import usage_index
+import fs_hooks
+
+
+class FolderMovedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.raid = os.path.join(self.tmp.name, "raid")
+        os.makedirs(os.path.join(self.raid, "big", "sub"))
+        for i in range(20):
+            with open(os.path.join(self.raid, "big", "sub", f"f{i}.txt"), "w") as f:
+                f.write("x" * i)
+
+        self._saved = (fs_hooks.RAID_PATH, event_bus.SPOOL_PATH, search_index.INDEX_FILE, usage_index.INDEX_FILE,
+                       search_index.crawl, usage_index._scan_tree)
+        fs_hooks.RAID_PATH = self.raid
+        event_bus.SPOOL_PATH = os.path.join(self.tmp.name, "events.log")
+        search_index.INDEX_FILE = os.path.join(self.tmp.name, "search_index.db")
+        usage_index.INDEX_FILE = os.path.join(self.tmp.name, "usage_index.db")
+        search_index._local = threading.local()
+        usage_index._local = threading.local()
+        os.makedirs(os.path.join(self.tmp.name, "empty"))
+        usage_index.reconcile(os.path.join(self.tmp.name, "empty"))  # Índice construido (vacío)
+
+    def tearDown(self):
+        (fs_hooks.RAID_PATH, event_bus.SPOOL_PATH, search_index.INDEX_FILE, usage_index.INDEX_FILE,
+         search_index.crawl, usage_index._scan_tree) = self._saved
+        search_index._local = threading.local()
+        usage_index._local = threading.local()
+        self.tmp.cleanup()
+
+    def test_moved_folder_is_indexed_in_background(self):
+        def _walk(*args):
+            raise AssertionError("file_changed ha recorrido el subárbol")
+        search_index.crawl = usage_index._scan_tree = _walk
+        fs_hooks.file_changed("moved_to", "big")
+
+        (search_index.crawl, usage_index._scan_tree) = self._saved[4:]
+        self.assertEqual(search_index.search("f19"), [])
+        self.assertEqual(search_index.crawl_pending(self.raid), 1)
+        self.assertEqual([r["path"] for r in search_index.search("f19")], ["big/sub/f19.txt"])
+        self.assertEqual(usage_index.apply_pending(self.raid), 1)
+        self.assertEqual(usage_index.totals("big"), (sum(range(20)), 20))
+        self.assertEqual(usage_index.totals(""), (sum(range(20)), 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
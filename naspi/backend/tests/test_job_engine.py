@@ -0,0 +1,128 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: test_job_engine.py
+# Descripción: Pruebas de la reanudación de trabajos (job_engine.py): un proceso de trabajos que muere a mitad de una copia
+# no debe dejar en el RAID la copia incompleta ni crear otra "(copia)" al repetir el trabajo
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import sys
+import time
+import errno
+import signal
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import event_bus
+import usage_index
+import job_engine
+
+CONTENT = b"x" * (256 * 1024)
+
+
+def _run_until_killed(job_id, partial_path):
+    """Proceso de trabajos que se queda colgado tras escribir la mitad del fichero (el padre lo mata con SIGKILL)."""
+    job_engine._local = threading.local()   # La conexión SQLite del padre no se puede usar tras fork()
+
+    def _copy_half(src, dst, progress=None):
+        with open(dst, 'wb') as f:
+            f.write(CONTENT[:len(CONTENT) // 2])
+        open(partial_path, 'w').close()
+        time.sleep(60)
+    job_engine.file_copy.copy_file = _copy_half
+    job_engine._run_job(job_id)
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.raid = os.path.join(self.tmp.name, "raid")
+        os.makedirs(os.path.join(self.raid, "dest"))
+        with open(os.path.join(self.raid, "foo.bin"), 'wb') as f:
+            f.write(CONTENT)
+
+        self._saved = (job_engine.JOURNAL_FILE, job_engine.RAID_PATH, job_engine.fs_hooks.file_changed,
+                       event_bus.SPOOL_PATH, usage_index.INDEX_FILE)
+        job_engine.JOURNAL_FILE = os.path.join(self.tmp.name, "jobs.db")
+        job_engine.RAID_PATH = self.raid
+        job_engine.fs_hooks.file_changed = lambda action, path: None
+        event_bus.SPOOL_PATH = os.path.join(self.tmp.name, "events.log")
+        usage_index.INDEX_FILE = os.path.join(self.tmp.name, "usage_index.db")
+        job_engine._local = threading.local()
+        usage_index._local = threading.local()
+
+    def tearDown(self):
+        (job_engine.JOURNAL_FILE, job_engine.RAID_PATH, job_engine.fs_hooks.file_changed,
+         event_bus.SPOOL_PATH, usage_index.INDEX_FILE) = self._saved
+        job_engine._local = threading.local()
+        usage_index._local = threading.local()
+        self.tmp.cleanup()
+
+    def _kill_halfway(self, job_type):
+        job = job_engine.submit(job_type, {"sources": ["foo.bin"], "destination": "dest"})
+        self.assertEqual(job_engine._claim_next("files"), job["id"])
+        partial = os.path.join(self.tmp.name, "partial")
+        child = multiprocessing.get_context("fork").Process(target=_run_until_killed, args=(job["id"], partial))
+        child.start()
+        deadline = time.time() + 10
+        while not os.path.exists(partial) and time.time() < deadline:
+            time.sleep(0.01)
+        os.kill(child.pid, signal.SIGKILL)
+        child.join()
+        self.assertEqual(job_engine.get_job(job["id"])["status"], job_engine.STATUS_RUNNING)
+        return job["id"]
+
+    def _resume(self, job_id):
+        job_engine._recover()
+        self.assertEqual(job_engine._claim_next("files"), job_id)
+        job_engine._run_job(job_id)
+        return job_engine.get_job(job_id)
+
+    def test_killed_copy_is_redone_in_place(self):
+        job = self._resume(self._kill_halfway("copy"))
+        self.assertEqual(job["status"], job_engine.STATUS_COMPLETED)
+        self.assertEqual(job["result"], {"created": [os.path.join("dest", "foo.bin")]})
+        self.assertEqual(os.listdir(os.path.join(self.raid, "dest")), ["foo.bin"])
+        with open(os.path.join(self.raid, "dest", "foo.bin"), 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_killed_cross_device_move_is_finished(self):
+        real_rename = os.rename
+
+        def _rename(src, dst):
+            if src == os.path.join(self.raid, "foo.bin"):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")  # Obliga a copiar y borrar
+            real_rename(src, dst)
+        job_engine.os.rename = _rename
+        try:
+            job = self._resume(self._kill_halfway("move"))
+        finally:
+            job_engine.os.rename = real_rename
+        self.assertEqual(job["status"], job_engine.STATUS_COMPLETED)
+        self.assertFalse(os.path.exists(os.path.join(self.raid, "foo.bin")))
+        self.assertEqual(os.listdir(os.path.join(self.raid, "dest")), ["foo.bin"])
+        with open(os.path.join(self.raid, "dest", "foo.bin"), 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_move_keeps_new_name_and_fails_on_existing_target(self):
+        job = job_engine.submit("move", {"sources": ["foo.bin"], "destination": "dest", "name": "bar.bin"})
+        self.assertEqual(job_engine._claim_next("files"), job["id"])
+        job_engine._run_job(job["id"])
+        self.assertEqual(job_engine.get_job(job["id"])["result"], {"created": [os.path.join("dest", "bar.bin")]})
+
+        with open(os.path.join(self.raid, "foo.bin"), 'wb') as f:
+            f.write(b"otro")
+        job = job_engine.submit("move", {"sources": ["foo.bin"], "destination": "dest", "name": "bar.bin"})
+        self.assertEqual(job_engine._claim_next("files"), job["id"])
+        job_engine._run_job(job["id"])
+        job = job_engine.get_job(job["id"])
+        self.assertEqual(job["status"], job_engine.STATUS_FAILED)
+        self.assertIn("Ya existe", job["error"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.raid, "dest"))), ["bar.bin"])
+        self.assertTrue(os.path.exists(os.path.join(self.raid, "foo.bin")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: thumbnails.py
+# Descripción: Miniaturas de imágenes y vídeos del RAID para /api/thumbnail. Cada fichero se decodifica una sola vez (en un
+# pool de procesos, para no bloquear el worker ni el GIL) y se generan a la vez todos los tamaños de SIZES; en los
+# vídeos se extrae un fotograma con ffmpeg. Las miniaturas se guardan en CACHE_DIR con nombre direccionado por contenido
+# (el SHA-256 del índice de checksums si existe, o un hash del tamaño y de los extremos del fichero), así que sobreviven a
+# renombrados y copias. La caché está acotada: un proceso líder borra periódicamente las menos usadas (LRU por mtime, que
+# se actualiza al servirlas). Las subidas nuevas se pregeneran en segundo plano (ver fs_hooks.py).
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import io
+import time
+import hashlib
+import threading
+import subprocess
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import checksum_index
+import background_tasks as bg
+
+# Variables Globales
+CACHE_DIR = "/mnt/raid/thumbnails"          # Fuera de /mnt/raid/files: no se lista ni se indexa
+MAX_CACHE_BYTES = 2 * 1024 ** 3             # Tamaño máximo de la caché
+SWEEP_INTERVAL = 600                        # Segundos entre comprobaciones del tamaño de la caché
+SIZES = (128, 256, 512, 1024)               # Lado mayor de cada miniatura, en píxeles
+DEFAULT_SIZE = 256
+POOL_PROCESSES = 1                          # Procesos de generación por worker de gunicorn
+SAMPLE_SIZE = 64 * 1024                     # Bytes del principio y del final que identifican el contenido
+JPEG_QUALITY = 80
+VIDEO_SEEK = 1.0                            # Segundo del vídeo del que se extrae el fotograma
+FFMPEG_TIMEOUT = 30
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4v", ".3gp"}
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = {}     # clave -> Future (peticiones simultáneas de la misma miniatura esperan a la misma generación)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class ThumbnailError(Exception):
+    """No se puede generar la miniatura (formato no soportado, fichero dañado o falta Pillow/ffmpeg)."""
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def kind_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+def snap_size(size):
+    """Tamaño de SIZES más pequeño que cubre size (o el mayor disponible)."""
+    return next((s for s in SIZES if s >= size), SIZES[-1])
+
+def content_key(path, rel_path, st):
+    """Clave de contenido de un fichero: su SHA-256 si está en el índice de checksums y, si no, un hash del tamaño y de
+    sus primeros y últimos SAMPLE_SIZE bytes (suficiente para fotos y vídeos, que cambian enteros o no cambian)."""
+    digest = checksum_index.lookup(rel_path, st)
+    if digest is not None:
+        return digest["digest"]
+    return _sample_key(path, st.st_size, st.st_mtime_ns, st.st_ino)
+
+@lru_cache(maxsize=8192)
+def _sample_key(path, size, mtime_ns, ino):
+    h = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(SAMPLE_SIZE))
+        if size > 2 * SAMPLE_SIZE:
+            f.seek(-SAMPLE_SIZE, os.SEEK_END)
+            h.update(f.read(SAMPLE_SIZE))
+    return "s" + h.hexdigest()[:63]
+
+def cache_path(key, size):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}_{size}.jpg")
+
+def _submit_locked(key, path, kind):
+    """Encola la generación de todos los tamaños de key (con _pool_lock tomado)."""
+    global _pool
+    if _pool is None:
+        # forkserver: los procesos no heredan el estado (hilos, conexiones SQLite) del worker multihilo
+        _pool = ProcessPoolExecutor(max_workers=POOL_PROCESSES, initializer=os.nice, initargs=(10,),
+                                    mp_context=multiprocessing.get_context("forkserver"))
+    future = _pool.submit(_render, path, kind, [(s, cache_path(key, s)) for s in SIZES])
+    _in_flight[key] = future
+    return future
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Generación (se ejecuta en los procesos del pool)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _video_frame(path):
+    """Fotograma de VIDEO_SEEK (o el primero, en vídeos más cortos) como PNG."""
+    for seek in (VIDEO_SEEK, 0):
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-ss", str(seek), "-i", path, "-frames:v", "1",
+                 "-vf", f"scale='min({SIZES[-1]},iw)':-2", "-f", "image2pipe", "-vcodec", "png", "-"],
+                capture_output=True, timeout=FFMPEG_TIMEOUT)
+        except FileNotFoundError:
+            raise ThumbnailError("ffmpeg no está instalado")
+        except subprocess.TimeoutExpired:
+            raise ThumbnailError("ffmpeg ha tardado demasiado")
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+    raise ThumbnailError("No se pudo extraer un fotograma del vídeo")
+
+def _render(path, kind, outputs):
+    """Decodifica path una vez y guarda una miniatura JPEG por cada (tamaño, ruta) de outputs."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise ThumbnailError("Pillow no está instalado")
+
+    source = io.BytesIO(_video_frame(path)) if kind == "video" else path
+    try:
+        with Image.open(source) as img:
+            # JPEG: el decodificador reduce la escala al leer (hasta 1/8), mucho más rápido y con menos memoria
+            img.draft("RGB", (max(s for s, _ in outputs),) * 2)
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                background = Image.new("RGB", img.size, "white")
+                background.paste(img, mask=img.convert("RGBA").getchannel("A"))
+                img = background
+            for size, out_path in sorted(outputs, reverse=True):
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                tmp_path = f"{out_path}.{os.getpid()}.tmp"
+                img.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
+                os.replace(tmp_path, out_path)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f"No se pudo leer la imagen: {e}")
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, rel_path:str, size:int --> get_thumbnail() --> (thumb_path:str, key:str)
+# Descripción: Ruta de la miniatura de path al tamaño pedido (ajustado a SIZES), generándola si no está en caché. Marca la
+# miniatura como usada para la expulsión LRU
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_thumbnail(path, rel_path, size=DEFAULT_SIZE):
+    kind = kind_of(path)
+    if kind is None:
+        raise ThumbnailError("Tipo de fichero sin miniatura")
+    size = snap_size(size)
+    key = content_key(path, rel_path, os.stat(path))
+    thumb_path = cache_path(key, size)
+
+    try:
+        os.utime(thumb_path)  # LRU: la fecha de modificación es la del último uso
+        return thumb_path, key
+    except FileNotFoundError:
+        pass
+
+    # Se generan todos los tamaños de una vez: la galería suele pedir varios del mismo fichero
+    with _pool_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _submit_locked(key, path, kind)
+            future.add_done_callback(lambda _f: _in_flight.pop(key, None))
+    future.result()
+    return thumb_path, key
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, rel_path:str --> pregenerate() --> None
+# Descripción: Encola la generación de las miniaturas de un fichero recién subido sin esperar al resultado
+#-----------------------------------------------------------------------------------------------------------------------------------
+def pregenerate(path, rel_path):
+    kind = kind_of(path)
+    if kind is None:
+        return
+    try:
+        key = content_key(path, rel_path, os.stat(path))
+    except OSError:
+        return
+    if os.path.exists(cache_path(key, SIZES[-1])):
+        return
+    with _pool_lock:
+        if key in _in_flight:
+            return
+        future = _submit_locked(key, path, kind)
+
+    def _done(f):
+        _in_flight.pop(key, None)
+        if f.exception() is not None:
+            print(f"[WARN] No se pudieron pregenerar las miniaturas de {rel_path}: {f.exception()}")
+    future.add_done_callback(_done)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> sweep() --> removed:int
+# Descripción: Si la caché supera MAX_CACHE_BYTES borra las miniaturas usadas hace más tiempo hasta dejarla al 90 %
+#-----------------------------------------------------------------------------------------------------------------------------------
+def sweep():
+    files, total = [], 0
+    for dirpath, _dirnames, filenames in os.walk(CACHE_DIR):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(".tmp") and time.time() - st.st_mtime > 3600:
+                os.unlink(path)  # Restos de una generación interrumpida
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= MAX_CACHE_BYTES:
+        return 0
+
+    removed = 0
+    for _mtime, size, path in sorted(files):
+        if total <= MAX_CACHE_BYTES * 0.9:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+def start_sweeper():
+    def _sweep_forever():
+        bg.lower_thread_priority()
+        while True:
+            try:
+                removed = sweep()
+                if removed:
+                    print(f"[INFO] Caché de miniaturas: {removed} miniaturas antiguas eliminadas")
+            except Exception as e:
+                print(f"[WARN] Error limpiando la caché de miniaturas: {e}")
+            time.sleep(SWEEP_INTERVAL)
+
+    bg.run_as_host_leader("thumbnail_sweeper", _sweep_forever, retry_interval=60)
@@ -0,0 +1,305 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: upload_sessions.py
+# Descripción: Sesiones de subida por chunks paralelas, idempotentes y reanudables. Cada sesión reserva el fichero final
+# completo, cada chunk se escribe en su offset con pwrite (pueden llegar varios a la vez y en cualquier orden, y repetir uno
+# no corrompe nada), un bitmap registra los recibidos y al completar se hace un rename atómico al nombre definitivo.
+# Cada chunk se hashea (SHA-256) mientras se escribe; el digest del fichero es el SHA-256 de la concatenación de los
+# digests de sus chunks, de modo que se obtiene sin volver a leer el fichero aunque los chunks lleguen desordenados.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import re
+import json
+import math
+import time
+import uuid
+import errno
+import fcntl
+import hashlib
+
+# Variables Globales
+SESSIONS_DIR = "/mnt/raid/tmp_chunks"   # Metadatos y bitmaps de las sesiones (no se listan en el gestor de archivos)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_MAX_AGE = 7 * 24 * 3600         # Sesiones abandonadas más antiguas se eliminan
+BUFFER_SIZE = 1024 * 1024               # Bloque de lectura del cuerpo de la petición
+DIGEST_SIZE = hashlib.sha256().digest_size
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class UploadError(Exception):
+    """Error de subida con el código HTTP que debe devolver la API."""
+
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.extra = extra
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _meta_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.json")
+
+def _bitmap_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.bitmap")
+
+def _digests_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.digests")
+
+def _remove_session_files(session_id):
+    for path in (_meta_path(session_id), _bitmap_path(session_id), _digests_path(session_id)):
+        _remove_quietly(path)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+#-----------------------------------------------------------------------------------------------------------------------------------
+# dest_dir:str, rel_dir:str, filename:str, size:int, chunk_size:int --> create_session() --> session:dict
+# Descripción: Crea una sesión de subida y reserva en disco el tamaño completo del fichero temporal
+#-----------------------------------------------------------------------------------------------------------------------------------
+def create_session(dest_dir, rel_dir, filename, size, chunk_size=DEFAULT_CHUNK_SIZE):
+    if not filename or os.path.basename(filename) != filename or filename in ('.', '..'):
+        raise UploadError("Nombre de archivo no válido")
+    if size < 0:
+        raise UploadError("Tamaño no válido")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f"El tamaño de chunk debe estar entre 1 y {MAX_CHUNK_SIZE} bytes")
+
+    purge_stale_sessions()
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    os.makedirs(dest_dir, exist_ok=True)
+
+    session_id = uuid.uuid4().hex
+    total_chunks = max(1, math.ceil(size / chunk_size))
+    temp_path = os.path.join(dest_dir, f".{filename}.{session_id}.uploading")
+
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        if size > 0:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise UploadError("No hay espacio suficiente en el RAID", 507)
+                os.ftruncate(fd, size)  # Sistema de ficheros sin fallocate
+    except Exception:
+        os.close(fd)
+        _remove_quietly(temp_path)
+        raise
+    os.close(fd)
+
+    with open(_bitmap_path(session_id), 'wb') as f:
+        f.write(bytes(math.ceil(total_chunks / 8)))
+    with open(_digests_path(session_id), 'wb') as f:
+        f.truncate(total_chunks * DIGEST_SIZE)
+
+    session = {
+        "id": session_id,
+        "filename": filename,
+        "path": rel_dir,
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": total_chunks,
+        "temp_path": temp_path,
+        "final_path": os.path.join(dest_dir, filename),
+        "created": time.time(),
+    }
+    with open(_meta_path(session_id), 'w', encoding='utf-8') as f:
+        json.dump(session, f)
+    return session
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session_id:str --> load_session() --> session:dict
+#-----------------------------------------------------------------------------------------------------------------------------------
+def load_session(session_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id or ""):
+        raise UploadError("Sesión de subida no válida")
+    try:
+        with open(_meta_path(session_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError("Sesión de subida no encontrada", 404)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict, index:int --> chunk_bounds() --> (offset:int, length:int)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def chunk_bounds(session, index):
+    if not 0 <= index < session["total_chunks"]:
+        raise UploadError(f"Chunk {index} fuera de rango (0-{session['total_chunks'] - 1})")
+    offset = index * session["chunk_size"]
+    return offset, min(session["chunk_size"], session["size"] - offset)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# stream:file, fd:int, offset:int, limit:int, hasher:hash|None --> copy_stream() --> written:int
+# Descripción: Vuelca el stream en fd a partir de offset con pwrite, reutilizando un único buffer de BUFFER_SIZE bytes.
+# Con el cuerpo crudo de la petición (request.stream) los datos van del socket al fichero sin copias intermedias.
+# Si se pasa hasher se actualiza con cada bloque. Lanza UploadError si el stream trae más de limit bytes.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def copy_stream(stream, fd, offset, limit, hasher=None):
+    written = 0
+    readinto = getattr(stream, "readinto", None)
+    buffer = memoryview(bytearray(BUFFER_SIZE)) if readinto else None
+    while True:
+        if readinto:
+            n = readinto(buffer)
+            data = buffer[:n] if n else None
+        else:
+            data = stream.read(BUFFER_SIZE)
+            n = len(data) if data else 0
+        if not n:
+            return written
+        if written + n > limit:
+            raise UploadError(f"Se esperaban como mucho {limit} bytes")
+        if hasher is not None:
+            hasher.update(data)
+        while data:
+            done = os.pwrite(fd, data, offset + written)
+            written += done
+            data = data[done:]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict, index:int, stream:file, expected_sha256:str|None --> write_chunk() --> (written:int, sha256:str)
+# Descripción: Escribe el chunk en su offset leyendo el stream por bloques y lo hashea a la vez. Solo se marca como recibido
+# si llega completo y, cuando el cliente manda su SHA-256, si coincide con lo escrito.
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_chunk(session, index, stream, expected_sha256=None):
+    offset, length = chunk_bounds(session, index)
+    hasher = hashlib.sha256()
+    try:
+        fd = os.open(session["temp_path"], os.O_WRONLY)
+    except FileNotFoundError:
+        raise UploadError("La subida ya se completó o se canceló", 410)
+    try:
+        written = copy_stream(stream, fd, offset, length, hasher)
+        if written != length:
+            raise UploadError(f"Chunk {index} incompleto: {written} de {length} bytes")
+        if expected_sha256 and expected_sha256.lower() != hasher.hexdigest():
+            raise UploadError(f"El checksum del chunk {index} no coincide", 422)
+    except BaseException:
+        # Un reenvío fallido puede haber pisado parte de un chunk ya recibido: se vuelve a pedir
+        mark_chunk(session, index, received=False)
+        raise
+    finally:
+        os.close(fd)
+
+    digests_fd = os.open(_digests_path(session["id"]), os.O_WRONLY)
+    try:
+        os.pwrite(digests_fd, hasher.digest(), index * DIGEST_SIZE)
+    finally:
+        os.close(digests_fd)
+    mark_chunk(session, index)
+    return written, hasher.hexdigest()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# stream:file, dest_dir:str, filename:str, limit:int, expected_sha256:str|None --> store_stream() --> sha256:str
+# Descripción: Subida de un fichero en una sola petición: se vuelca a un temporal calculando su SHA-256 y, si está completo
+# (y coincide con el checksum del cliente, si lo manda), se renombra a su nombre definitivo
+#-----------------------------------------------------------------------------------------------------------------------------------
+def store_stream(stream, dest_dir, filename, limit, expected_sha256=None, expected_size=None):
+    if not filename or os.path.basename(filename) != filename or filename in ('.', '..'):
+        raise UploadError("Nombre de archivo no válido")
+    os.makedirs(dest_dir, exist_ok=True)
+    temp_path = os.path.join(dest_dir, f".{filename}.{uuid.uuid4().hex}.uploading")
+    hasher = hashlib.sha256()
+
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        try:
+            written = copy_stream(stream, fd, 0, limit, hasher)
+        finally:
+            os.close(fd)
+        if expected_size is not None and written != expected_size:
+            raise UploadError(f"Subida incompleta: {written} de {expected_size} bytes")
+        if expected_sha256 and expected_sha256.lower() != hasher.hexdigest():
+            raise UploadError(f"El checksum de '{filename}' no coincide", 422)
+        os.rename(temp_path, os.path.join(dest_dir, filename))
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    return hasher.hexdigest()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict, index:int, received:bool --> mark_chunk() --> None
+# Descripción: Activa (o limpia) el bit del chunk. Se bloquea solo el byte afectado para no perder marcas concurrentes
+#-----------------------------------------------------------------------------------------------------------------------------------
+def mark_chunk(session, index, received=True):
+    byte, bit = divmod(index, 8)
+    fd = os.open(_bitmap_path(session["id"]), os.O_RDWR)
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, byte, os.SEEK_SET)
+        current = os.pread(fd, 1, byte)[0]
+        value = current | (1 << bit) if received else current & ~(1 << bit)
+        os.pwrite(fd, bytes([value]), byte)
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, byte, os.SEEK_SET)
+    finally:
+        os.close(fd)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict --> missing_chunks() --> missing:list
+#-----------------------------------------------------------------------------------------------------------------------------------
+def missing_chunks(session):
+    try:
+        with open(_bitmap_path(session["id"]), 'rb') as f:
+            bitmap = f.read()
+    except FileNotFoundError:
+        raise UploadError("Sesión de subida no encontrada", 404)
+    return [i for i in range(session["total_chunks"]) if not bitmap[i // 8] & (1 << (i % 8))]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict --> session_status() --> status:dict
+#-----------------------------------------------------------------------------------------------------------------------------------
+def session_status(session):
+    missing = missing_chunks(session)
+    return {
+        "sessionId": session["id"],
+        "filename": session["filename"],
+        "path": session["path"],
+        "size": session["size"],
+        "chunkSize": session["chunk_size"],
+        "totalChunks": session["total_chunks"],
+        "receivedChunks": session["total_chunks"] - len(missing),
+        "missing": missing,
+    }
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict --> file_digest() --> sha256_tree:str
+# Descripción: SHA-256 de la concatenación de los SHA-256 de todos los chunks (checksum_index.ALGORITHM_SHA256_TREE)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def file_digest(session):
+    with open(_digests_path(session["id"]), 'rb') as f:
+        return hashlib.sha256(f.read(session["total_chunks"] * DIGEST_SIZE)).hexdigest()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict, expected_digest:str|None --> complete_session() --> sha256_tree:str
+# Descripción: Comprueba que estén todos los chunks (y el digest del fichero si el cliente lo manda) y mueve el temporal a
+# su nombre definitivo con un rename atómico
+#-----------------------------------------------------------------------------------------------------------------------------------
+def complete_session(session, expected_digest=None):
+    missing = missing_chunks(session)
+    if missing:
+        raise UploadError("Faltan chunks por subir", 409, missing=missing)
+    digest = file_digest(session)
+    if expected_digest and expected_digest.lower() != digest:
+        raise UploadError("El checksum del fichero no coincide", 422, sha256Tree=digest)
+    try:
+        os.rename(session["temp_path"], session["final_path"])
+    except FileNotFoundError:
+        raise UploadError("La subida ya se completó o se canceló", 410)
+    _remove_session_files(session["id"])
+    return digest
+#-----------------------------------------------------------------------------------------------------------------------------------
+# session:dict --> cancel_session() --> None
+#-----------------------------------------------------------------------------------------------------------------------------------
+def cancel_session(session):
+    _remove_quietly(session["temp_path"])
+    _remove_session_files(session["id"])
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> purge_stale_sessions() --> None
+# Descripción: Elimina las sesiones (y sus temporales) abandonadas hace más de SESSION_MAX_AGE segundos
+#-----------------------------------------------------------------------------------------------------------------------------------
+def purge_stale_sessions():
+    try:
+        names = os.listdir(SESSIONS_DIR)
+    except FileNotFoundError:
+        return
+    limit = time.time() - SESSION_MAX_AGE
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            if os.path.getmtime(os.path.join(SESSIONS_DIR, name)) < limit:
+                cancel_session(load_session(name[:-5]))
+        except (UploadError, OSError, ValueError):
+            pass
@@ -0,0 +1,263 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: usage_index.py
+# Descripción: Índice de uso de disco por carpeta del RAID (un "du" precalculado en data/usage_index.db). Cada carpeta guarda
+# lo que ocupan sus ficheros directos y el total acumulado de todo su subárbol (bytes, bytes asignados en disco y número de
+# ficheros). Los cambios hechos por la API se aplican de forma incremental (solo se relee la carpeta afectada y se propaga
+# la diferencia a sus antecesoras; el subárbol de una carpeta nueva lo recorre después el proceso en segundo plano); ese
+# proceso, con prioridad mínima, además lo reconstruye periódicamente para recoger lo que cambie por otras vías.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import time
+import sqlite3
+import threading
+import background_tasks as bg
+
+# Variables Globales
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'data', 'usage_index.db')
+RECONCILE_INTERVAL = 24 * 3600  # Segundos entre reconstrucciones completas
+PENDING_INTERVAL = 2            # Segundos entre comprobaciones de carpetas nuevas pendientes de recorrer
+MAX_DEPTH = 4                   # Niveles máximos que devuelve usage()
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+        conn = sqlite3.connect(INDEX_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS dirs (
+                    path TEXT PRIMARY KEY,      -- relativa al RAID ('' es la raíz)
+                    parent TEXT,
+                    depth INTEGER NOT NULL,
+                    own_bytes INTEGER NOT NULL, -- ficheros directos de la carpeta
+                    own_alloc INTEGER NOT NULL,
+                    own_files INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,     -- subárbol completo
+                    alloc INTEGER NOT NULL,
+                    files INTEGER NOT NULL,
+                    subdirs INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS pending (path TEXT PRIMARY KEY, queued REAL NOT NULL);  -- Carpetas por recorrer
+            """)
+        _local.conn = conn
+    return conn
+
+def _depth(path):
+    return path.count('/') + 1 if path else 0
+
+def _parent(path):
+    return os.path.dirname(path) if path else None
+
+def _ancestors(path):
+    """path y todas sus carpetas antecesoras hasta la raíz ('')."""
+    chain = [path]
+    while path:
+        path = os.path.dirname(path)
+        chain.append(path)
+    return chain
+
+def _scan_own(root, rel_dir):
+    """Lee una carpeta (sin recursión). Devuelve ([bytes, asignados, ficheros], subcarpetas)."""
+    own = [0, 0, 0]
+    subdirs = []
+    with os.scandir(os.path.join(root, rel_dir)) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if rel_dir or entry.name != "lost+found":
+                        subdirs.append(os.path.join(rel_dir, entry.name))
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            own[0] += st.st_size
+            own[1] += st.st_blocks * 512
+            own[2] += 1
+    return own, subdirs
+
+def _scan_tree(root, start):
+    """Recorre root/start y devuelve las filas de la tabla dirs de todo el subárbol, con los totales ya acumulados."""
+    rows = {}
+    stack = [start]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            own, subdirs = _scan_own(root, rel_dir)
+        except OSError as e:
+            print(f"[WARN] No se pudo leer {rel_dir or '/'} para el índice de uso: {e}")
+            own, subdirs = [0, 0, 0], []
+        rows[rel_dir] = {"own": own, "total": list(own), "subdirs": len(subdirs)}
+        stack.extend(subdirs)
+
+    # Acumulación de abajo arriba: cada carpeta suma sus totales a su padre
+    for path in sorted(rows, key=_depth, reverse=True):
+        if path == start:
+            continue
+        parent_total = rows[_parent(path)]["total"]
+        for i, value in enumerate(rows[path]["total"]):
+            parent_total[i] += value
+    return [(path, _parent(path), _depth(path), *r["own"], *r["total"], r["subdirs"]) for path, r in rows.items()]
+
+def _add_to_ancestors(conn, path, delta):
+    """Suma delta (bytes, asignados, ficheros) a los totales de path y de todas sus antecesoras."""
+    if not any(delta):
+        return
+    chain = _ancestors(path)
+    conn.execute(f"UPDATE dirs SET bytes = bytes + ?, alloc = alloc + ?, files = files + ? "
+                 f"WHERE path IN ({','.join('?' * len(chain))})", (*delta, *chain))
+
+def _remove_subtree(conn, path, totals):
+    """Quita path y su subárbol de la tabla y descuenta sus totales de las antecesoras."""
+    parent = _parent(path)
+    _add_to_ancestors(conn, parent, tuple(-v for v in totals))
+    prefix = path + '/'
+    conn.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+    conn.execute("UPDATE dirs SET subdirs = subdirs - 1 WHERE path = ?", (parent,))
+
+def is_built():
+    return _connection().execute("SELECT 1 FROM meta WHERE key = 'last_reconcile'").fetchone() is not None
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> reconcile() --> count:int
+# Descripción: Reconstruye el índice completo recorriendo todo el RAID. Devuelve el número de carpetas indexadas
+#-----------------------------------------------------------------------------------------------------------------------------------
+def reconcile(root):
+    rows = _scan_tree(root, "")
+    conn = _connection()
+    with conn:
+        conn.execute("DELETE FROM dirs")
+        conn.executemany("INSERT INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_reconcile', ?)", (str(time.time()),))
+    return len(rows)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str, rel_path:str, removed:bool --> update_path() --> None
+# Descripción: Aplica al índice un cambio hecho en rel_path (fichero o carpeta, relativo a root) sin recorrer el RAID:
+# se relee solo la carpeta padre y, si rel_path es una carpeta borrada, se descuenta su subárbol. Las carpetas nuevas (y
+# con rescan, una existente cuyo contenido ha cambiado, p.ej. tras un borrado a medias) se dejan en cola: su subárbol lo
+# recorre apply_pending() en segundo plano
+#-----------------------------------------------------------------------------------------------------------------------------------
+def update_path(root, rel_path, removed=False, rescan=False):
+    if not is_built():
+        return  # El índice aún no existe; el primer reconcile() lo recogerá todo
+    conn = _connection()
+    parent = _parent(rel_path)
+    abs_path = os.path.join(root, rel_path)
+
+    with conn:
+        # Carpeta que ya no existe: se descuenta su subárbol de las antecesoras
+        row = conn.execute("SELECT bytes, alloc, files FROM dirs WHERE path = ?", (rel_path,)).fetchone()
+        if row is not None and (removed or not os.path.isdir(abs_path)):
+            _remove_subtree(conn, rel_path, row)
+            row = None
+
+        # Carpeta nueva (creada, movida o copiada) o que hay que releer
+        if not removed and (row is None or rescan) and os.path.isdir(abs_path):
+            conn.execute("INSERT OR REPLACE INTO pending VALUES (?, ?)", (rel_path, time.time()))
+
+        # Ficheros directos de la carpeta padre
+        current = conn.execute("SELECT own_bytes, own_alloc, own_files FROM dirs WHERE path = ?", (parent,)).fetchone()
+        if current is None:
+            return
+        try:
+            own, _subdirs = _scan_own(root, parent)
+        except FileNotFoundError:
+            return
+        conn.execute("UPDATE dirs SET own_bytes = ?, own_alloc = ?, own_files = ? WHERE path = ?", (*own, parent))
+        _add_to_ancestors(conn, parent, tuple(new - old for new, old in zip(own, current)))
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> apply_pending() --> count:int
+# Descripción: Recorre las carpetas que update_path() ha dejado en cola y sustituye su subárbol en el índice (sumando la
+# diferencia a sus antecesoras). El recorrido se hace fuera de la transacción. Devuelve cuántas había
+#-----------------------------------------------------------------------------------------------------------------------------------
+def apply_pending(root):
+    conn = _connection()
+    pending = conn.execute("SELECT path, queued FROM pending ORDER BY queued").fetchall()
+    for rel_path, queued in pending:
+        abs_path = os.path.join(root, rel_path)
+        rows = _scan_tree(root, rel_path) if os.path.isdir(abs_path) else None
+        with conn:
+            # Si se ha vuelto a encolar mientras tanto (queued distinto) se recorrerá otra vez
+            conn.execute("DELETE FROM pending WHERE path = ? AND queued = ?", (rel_path, queued))
+            parent = _parent(rel_path)
+            if rows is None or not conn.execute("SELECT 1 FROM dirs WHERE path = ?", (parent,)).fetchone():
+                continue  # Ya no existe, o su carpeta padre tampoco está indexada (la recogerá ella o reconcile())
+            row = conn.execute("SELECT bytes, alloc, files FROM dirs WHERE path = ?", (rel_path,)).fetchone()
+            if row is not None:
+                _remove_subtree(conn, rel_path, row)
+            conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            top = next(r for r in rows if r[0] == rel_path)
+            _add_to_ancestors(conn, parent, top[6:9])
+            conn.execute("UPDATE dirs SET subdirs = subdirs + 1 WHERE path = ?", (parent,))
+    return len(pending)
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str --> totals() --> (bytes:int, files:int)|None
+# Descripción: Totales del subárbol de una carpeta según el índice (None si no está indexada)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def totals(path):
+    if not is_built():
+        return None
+    row = _connection().execute("SELECT bytes, files FROM dirs WHERE path = ?", (path.strip('/'),)).fetchone()
+    return tuple(row) if row else None
+#-----------------------------------------------------------------------------------------------------------------------------------
+# path:str, depth:int --> usage() --> tree:dict|None
+# Descripción: Árbol de uso de path hasta depth niveles, listo para un treemap: cada nodo tiene sus totales, sus hijos
+# ordenados por tamaño y, si tiene ficheros directos, un hijo "(archivos)" con lo que ocupan
+#-----------------------------------------------------------------------------------------------------------------------------------
+def usage(path="", depth=1):
+    depth = max(1, min(depth, MAX_DEPTH))
+    path = path.strip('/')
+    conn = _connection()
+    base_depth = _depth(path)
+    prefix = path + '/' if path else ''
+    rows = conn.execute(
+        "SELECT path, own_bytes, own_alloc, own_files, bytes, alloc, files, subdirs FROM dirs "
+        "WHERE (path = ? OR substr(path, 1, ?) = ?) AND depth <= ?",
+        (path, len(prefix), prefix, base_depth + depth)).fetchall()
+
+    nodes = {}
+    for p, own_bytes, own_alloc, own_files, total_bytes, alloc, files, subdirs in rows:
+        nodes[p] = {"path": p, "name": os.path.basename(p) or "/", "type": "folder", "bytes": total_bytes,
+                    "alloc": alloc, "files": files, "subdirs": subdirs, "children": [],
+                    "_own": (own_bytes, own_alloc, own_files)}
+    if path not in nodes:
+        return None
+
+    for p in sorted(nodes, key=_depth, reverse=True):
+        node = nodes[p]
+        own_bytes, own_alloc, own_files = node.pop("_own")
+        if own_files and _depth(p) < base_depth + depth:
+            node["children"].append({"path": p, "name": "(archivos)", "type": "files", "bytes": own_bytes,
+                                     "alloc": own_alloc, "files": own_files})
+        node["children"].sort(key=lambda c: c["bytes"], reverse=True)
+        if p != path and _parent(p) in nodes:
+            nodes[_parent(p)]["children"].append(node)
+    return nodes[path]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# root:str --> start_reconciler() --> None
+# Descripción: Arranca la reconstrucción periódica (y el recorrido de las carpetas nuevas en cola) en el worker líder del
+# host, con prioridad mínima de CPU y E/S
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start_reconciler(root):
+    def _reconcile_forever():
+        bg.lower_thread_priority()
+        while True:
+            apply_pending(root)
+            row = _connection().execute("SELECT value FROM meta WHERE key = 'last_reconcile'").fetchone()
+            wait = float(row[0]) + RECONCILE_INTERVAL - time.time() if row else 0
+            if wait > 0:
+                time.sleep(min(wait, PENDING_INTERVAL))
+                continue
+            started = time.monotonic()
+            count = reconcile(root)
+            print(f"[INFO] Índice de uso de disco reconstruido: {count} carpetas en {time.monotonic() - started:.1f} s")
+
+    bg.run_as_host_leader("usage_reconciler", _reconcile_forever, retry_interval=60)
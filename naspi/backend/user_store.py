@@ -0,0 +1,113 @@
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Fichero: user_store.py
+# Descripción: Repositorio de usuarios en SQLite (data/users.db, modo WAL) con búsqueda indexada por id y por nombre de
+# usuario. Las altas y bajas son transacciones, así que varios workers de gunicorn pueden modificar usuarios a la vez sin
+# perder escrituras (antes se reescribía users.json entero sin bloqueo). La primera vez que se abre la base de datos se
+# importan los usuarios de data/users.json; el fichero se deja como está pero ya no se vuelve a leer.
+#-----------------------------------------------------------------------------------------------------------------------------------
+#Librerias
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# Variables Globales
+STORE_FILE = os.path.join(os.path.dirname(__file__), 'data', 'users.db')
+LEGACY_USERS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'users.json')
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+#-----------------------------------------------------------------------------------------------------------------------------------
+# CLASES
+#-----------------------------------------------------------------------------------------------------------------------------------
+class UserExistsError(ValueError):
+    """Ya existe un usuario con ese nombre."""
+#-----------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _migrate_json(conn):
+    """Importa users.json una sola vez (la marca en meta evita repetirlo aunque se borren usuarios después)."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    users = []
+    if os.path.exists(LEGACY_USERS_FILE):
+        with open(LEGACY_USERS_FILE, 'r', encoding='utf-8') as f:
+            users = json.load(f)
+    conn.executemany("INSERT OR IGNORE INTO users (id, username, password, role, created) VALUES (?, ?, ?, ?, ?)",
+                     [(str(u["id"]), u["username"], u["password"], u.get("role", "user"), time.time()) for u in users])
+    conn.execute("INSERT INTO meta VALUES ('json_migrated', ?)", (str(time.time()),))
+    if users:
+        print(f"[INFO] {len(users)} usuarios importados de {LEGACY_USERS_FILE}")
+
+def _connection():
+    """Conexión SQLite propia de cada hilo (se crea bajo demanda)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(STORE_FILE), exist_ok=True)
+        conn = sqlite3.connect(STORE_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL UNIQUE,
+                    password TEXT NOT NULL,     -- hash bcrypt
+                    role TEXT NOT NULL,
+                    created REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            # BEGIN IMMEDIATE: si dos workers arrancan a la vez solo uno hace la migración
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _migrate_json(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        _local.conn = conn
+    return conn
+
+def _as_dict(row):
+    return dict(row) if row else None
+#-----------------------------------------------------------------------------------------------------------------------------------
+# username:str --> get_by_username() --> user:dict|None
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_by_username(username):
+    return _as_dict(_connection().execute("SELECT id, username, password, role FROM users WHERE username = ?",
+                                          (username,)).fetchone())
+#-----------------------------------------------------------------------------------------------------------------------------------
+# user_id:str --> get_by_id() --> user:dict|None
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_by_id(user_id):
+    return _as_dict(_connection().execute("SELECT id, username, password, role FROM users WHERE id = ?",
+                                          (user_id,)).fetchone())
+#-----------------------------------------------------------------------------------------------------------------------------------
+# --> list_users() --> users:list
+# Descripción: Todos los usuarios, sin el hash de la contraseña
+#-----------------------------------------------------------------------------------------------------------------------------------
+def list_users():
+    rows = _connection().execute("SELECT id, username, role FROM users ORDER BY created, username").fetchall()
+    return [dict(row) for row in rows]
+#-----------------------------------------------------------------------------------------------------------------------------------
+# username:str, password_hash:str, role:str --> add_user() --> user:dict
+# Descripción: Crea un usuario. Lanza UserExistsError si el nombre ya está en uso
+#-----------------------------------------------------------------------------------------------------------------------------------
+def add_user(username, password_hash, role="user"):
+    user = {"id": str(uuid.uuid4()), "username": username, "role": role}
+    try:
+        with _connection() as conn:
+            conn.execute("INSERT INTO users (id, username, password, role, created) VALUES (?, ?, ?, ?, ?)",
+                         (user["id"], username, password_hash, role, time.time()))
+    except sqlite3.IntegrityError:
+        raise UserExistsError("Username already exists")
+    return user
+#-----------------------------------------------------------------------------------------------------------------------------------
+# user_id:str --> delete_user() --> deleted:bool
+#-----------------------------------------------------------------------------------------------------------------------------------
+def delete_user(user_id):
+    with _connection() as conn:
+        return conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount > 0
@@ -1,6 +1,6 @@
 'use client'
 
-import { useState } from 'react'
+import { useState, useEffect } from 'react'
 import { Button } from "@/components/ui/button"
 import Dashboard from '@/components/dashboard'
 import FileManager from '@/components/file-manager'
@@ -49,11 +49,24 @@ export default function HomePage() {
     setIsSidebarOpen(!isSidebarOpen)
   }
 
+  // Restaura el usuario si la cookie de sesión sigue siendo válida (p.ej. al recargar la página)
+  useEffect(() => {
+    fetch('/api/session')
+      .then(res => (res.ok ? res.json() : null))
+      .then(data => { if (data?.user) setUser(data.user) })
+      .catch(() => {})
+  }, [])
+
   const handleLogin = (userData: any) => {
     setUser(userData)
   }
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    try {
+      await fetch('/api/logout', { method: 'POST' })
+    } catch (error) {
+      console.error('Error al cerrar la sesión:', error)
+    }
     setUser(null)
     setActiveTab('dashboard')
   }
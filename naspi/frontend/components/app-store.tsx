@@ -1,12 +1,12 @@
 'use client'
 
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Download, Loader2, XCircle, Trash2 } from 'lucide-react';
+import { useServerEvent } from '@/lib/events';
 
 const BACKEND_API_BASE_URL = '/api';
-const ADMIN_API_KEY = "d9Kj@fPzW%x$3sVbL!gT&cQ#mN*hYu0eR1I_aZ2oJl4iKy5Rw6P7sV8";
 
 interface AvailableService {
   service_name: string;
@@ -26,6 +26,9 @@ export default function AppStore() {
   const [installationStatus, setInstallationStatus] = useState<InstallationStatus>({});
   const [installMessage, setInstallMessage] = useState<{ serviceName: string; type: 'success' | 'error'; message: string } | null>(null);
   const [progress, setProgress] = useState<{ [serviceName: string]: number }>({});
+  const [stage, setStage] = useState<{ [serviceName: string]: string }>({});
+  // Trabajos de instalación/desinstalación lanzados desde aquí: id del trabajo -> servicio
+  const serviceJobs = useRef(new Map<string, string>());
 
   const fetchAvailableApps = useCallback(async () => {
     setLoading(true);
@@ -35,7 +38,6 @@ export default function AppStore() {
       const response = await fetch(`${BACKEND_API_BASE_URL}/admin/available-services`, {
         method: 'GET',
         headers: {
-          'X-Admin-API-Key': ADMIN_API_KEY,
           'Content-Type': 'application/json',
         },
       });
@@ -72,6 +74,9 @@ export default function AppStore() {
     fetchAvailableApps();
   }, [fetchAvailableApps]);
 
+  // Cuando cambia el estado de los servicios se refresca qué apps están instaladas
+  useServerEvent('services', () => fetchAvailableApps());
+
   const handleInstallClick = async (serviceName: string) => {
     setInstallationStatus(prev => ({ ...prev, [serviceName]: 'installing' }));
     setProgress(prev => ({ ...prev, [serviceName]: 0 }));
@@ -81,16 +86,17 @@ export default function AppStore() {
       const response = await fetch(`${BACKEND_API_BASE_URL}/admin/install/${serviceName}`, {
         method: 'POST',
         headers: {
-          'X-Admin-API-Key': ADMIN_API_KEY,
           'Content-Type': 'application/json',
         },
       });
 
-      if (!response.ok) {
-        throw new Error('Error en la instalación.');
+      const data = await response.json();
+      if (response.status !== 202) {
+        throw new Error(data.message || 'Error en la instalación.');
       }
 
-      simulateProgress(serviceName);
+      // La instalación sigue en segundo plano; el progreso llega por el evento 'jobs'
+      serviceJobs.current.set(data.jobId, serviceName);
     } catch (err: any) {
       console.error(`Error al instalar ${serviceName}:`, err);
       setInstallationStatus(prev => ({ ...prev, [serviceName]: 'error' }));
@@ -106,16 +112,16 @@ export default function AppStore() {
       const response = await fetch(`${BACKEND_API_BASE_URL}/admin/uninstall/${serviceName}`, {
         method: 'DELETE',
         headers: {
-          'X-Admin-API-Key': ADMIN_API_KEY,
           'Content-Type': 'application/json',
         },
       });
 
-      if (!response.ok) {
-        throw new Error('Error en la desinstalación.');
+      const data = await response.json();
+      if (response.status !== 202) {
+        throw new Error(data.message || 'Error en la desinstalación.');
       }
 
-      setTimeout(fetchAvailableApps, 1000);
+      serviceJobs.current.set(data.jobId, serviceName);
     } catch (err: any) {
       console.error(`Error al desinstalar ${serviceName}:`, err);
       setInstallationStatus(prev => ({ ...prev, [serviceName]: 'error' }));
@@ -123,18 +129,31 @@ export default function AppStore() {
     }
   };
 
-  const simulateProgress = (serviceName: string) => {
-    let currentProgress = 0;
-    const interval = setInterval(() => {
-      currentProgress += Math.random() * 20;
-      setProgress(prev => ({ ...prev, [serviceName]: Math.min(currentProgress, 100) }));
-
-      if (currentProgress >= 100) {
-        clearInterval(interval);
-        fetchAvailableApps();
-      }
-    }, 300);
-  };
+  // Progreso real de los trabajos: bytes descargados de las imágenes y fase (descarga, despliegue...)
+  useServerEvent('jobs', (job) => {
+    const serviceName = serviceJobs.current.get(job?.id);
+    if (!serviceName) return;
+    const uninstall = job.params?.action === 'uninstall';
+    if (job.bytesTotal) {
+      setProgress(prev => ({ ...prev, [serviceName]: Math.round((job.bytesDone / job.bytesTotal) * 100) }));
+    }
+    setStage(prev => ({ ...prev, [serviceName]: job.stage || '' }));
+    if (!['completed', 'failed', 'cancelled'].includes(job.status)) return;
+
+    serviceJobs.current.delete(job.id);
+    if (job.status === 'completed') {
+      setInstallationStatus(prev => ({ ...prev, [serviceName]: uninstall ? 'idle' : 'installed' }));
+      setInstallMessage({ serviceName, type: 'success', message: job.result?.message || `${serviceName} listo` });
+      fetchAvailableApps();
+    } else {
+      setInstallationStatus(prev => ({ ...prev, [serviceName]: 'error' }));
+      setInstallMessage({
+        serviceName,
+        type: 'error',
+        message: `Error ${uninstall ? 'desinstalando' : 'instalando'} ${serviceName}: ${job.error || 'cancelado'}`,
+      });
+    }
+  });
 
   return (
     <div className="p-4 md:p-6 space-y-6">
@@ -174,7 +193,11 @@ export default function AppStore() {
                   {(installing || uninstalling) && (
                     <div className="flex items-center text-gray-500 dark:text-gray-400">
                       <Loader2 className="w-4 h-4 mr-2 animate-spin" />
-                      <span>{installing ? 'Instalando...' : 'Desinstalando...'}</span>
+                      <span>
+                        {installing ? 'Instalando...' : 'Desinstalando...'}
+                        {stage[app.service_name] && ` ${stage[app.service_name]}`}
+                        {installing && progress[app.service_name] > 0 && ` (${progress[app.service_name]}%)`}
+                      </span>
                     </div>
                   )}
 
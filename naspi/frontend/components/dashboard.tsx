@@ -3,6 +3,7 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { Progress } from "@/components/ui/progress"
 import { Activity, HardDrive, Download, Thermometer, Cpu, User } from 'lucide-react'
 import { useState, useEffect } from "react"
+import { useServerEvent } from "@/lib/events"
 
 interface HardwareData {
   CPU: string
@@ -25,20 +26,25 @@ export default function Dashboard({ user }: DashboardProps) {
   const [hardware, setHardware] = useState<HardwareData | null>(null)
 
   useEffect(() => {
-    fetchHardware(); // Llamado inicial
-
-    const interval = setInterval(fetchHardware, 3000); // Llama a fetchHardware cada 5 segundos
-
-    return () => clearInterval(interval); // Limpieza del intervalo al desmontar
+    fetchHardware(); // Llamado inicial, las actualizaciones llegan por /api/events
   }, []);
 
+  // El servidor empuja una muestra nueva solo cuando cambia
+  useServerEvent("hardware", (data) => applyHardware(data));
+
   const fetchHardware = async () => {
     try {
       const response = await fetch("/api/hardware");
       if (!response.ok) throw new Error("Failed to fetch hardware info");
 
-      const data = await response.json();
+      applyHardware(await response.json());
+    } catch (error) {
+      console.error("Error fetching hardware info:", error);
+    }
+  };
 
+  const applyHardware = (data: any) => {
+    try {
       // Extraer valores de "disk" usando una expresión regular
       const diskMatch = data.disk.match(/total=(\d+), used=(\d+), free=(\d+)/);
 
@@ -59,7 +65,7 @@ export default function Dashboard({ user }: DashboardProps) {
       });
 
     } catch (error) {
-      console.error("Error fetching hardware info:", error);
+      console.error("Error parsing hardware info:", error);
     }
   };
 
@@ -1,11 +1,12 @@
 'use client'
 
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
-import { Folder, File, Grid, List, Upload, Download, Trash, PlusCircle, Pause, Play, X } from 'lucide-react';
+import { Folder, File, Grid, List, Upload, Download, Trash, PlusCircle, Pause, Play, X, Search } from 'lucide-react';
 import { useUploadStore } from '../data/uploadStore';
+import { useServerEvent } from '@/lib/events';
 import {
   Dialog,
   DialogTrigger,
@@ -24,10 +25,50 @@ interface NotificationProps {
 interface FileItem {
   name: string;
   isFolder: boolean;
+  size: number;
+  mtime: number;
+}
+
+type SortKey = 'name' | 'size' | 'mtime';
+
+interface SearchResult {
+  path: string;
+  name: string;
+  type: 'file' | 'folder';
+  size: number;
+  mtime: number;
+  parent: string;
+}
+
+// Entradas por página de /api/files (las carpetas grandes se cargan por partes)
+// Ficheros con miniatura generada por el servidor (ver /api/thumbnail)
+const THUMBNAIL_EXTENSIONS = /\.(jpe?g|png|gif|webp|bmp|tiff?|mp4|mkv|mov|avi|webm|m4v|3gp)$/i;
+const PAGE_SIZE = 500;
+
+function formatSize(bytes: number): string {
+  const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+  let i = 0;
+  while (bytes >= 1024 && i < units.length - 1) {
+    bytes /= 1024;
+    i++;
+  }
+  return `${bytes.toFixed(i === 0 ? 0 : 1)} ${units[i]}`;
 }
 
 // Interface UploadStatus ya definida en uploadStore.ts
 
+// Subidas por sesión: chunks de 8 MB, 4 en vuelo a la vez y reintentos por chunk
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_PARALLEL_CHUNKS = 4;
+const UPLOAD_CHUNK_RETRIES = 3;
+
+// SHA-256 en hexadecimal, o null si el navegador no expone WebCrypto (solo existe en HTTPS o localhost)
+async function sha256Hex(data: ArrayBuffer): Promise<string | null> {
+  if (typeof crypto === "undefined" || !crypto.subtle) return null;
+  const hash = new Uint8Array(await crypto.subtle.digest("SHA-256", data));
+  return Array.from(hash, b => b.toString(16).padStart(2, "0")).join("");
+}
+
 const Notification: React.FC<NotificationProps> = ({ message, type }) => (
   <div className={`fixed top-10 left-1/2 -translate-x-1/2 px-6 py-3 rounded-lg shadow-lg text-white text-sm
     ${type === "success" ? "bg-green-500" : "bg-red-500"}`}>
@@ -38,6 +79,11 @@ const Notification: React.FC<NotificationProps> = ({ message, type }) => (
 export default function FileManager() {
   const [viewMode, setViewMode] = useState<'grid' | 'list'>('grid');
   const [files, setFiles] = useState<FileItem[]>([]);
+  const [sortKey, setSortKey] = useState<SortKey>('name');
+  const [sortOrder, setSortOrder] = useState<'asc' | 'desc'>('asc');
+  const [nextOffset, setNextOffset] = useState<number | null>(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState<SearchResult[] | null>(null);
   const [currentPath, setCurrentPath] = useState<string>('');
   const [notification, setNotification] = useState<NotificationProps | null>(null);
   const [showDeleteDialog, setShowDeleteDialog] = useState(false);
@@ -46,6 +92,7 @@ export default function FileManager() {
   const [currentFolderName, setCurrentFolderName] = useState<string | null>(null);
   const [showCreateFolderDialog, setShowCreateFolderDialog] = useState(false);
   const [newFolderName, setNewFolderName] = useState('');
+  const pendingJobs = useRef(new Map<string, string>()); // jobId -> carpeta que se está borrando
 
   // --- Obteniendo estado y acciones del Store ---
   const {
@@ -70,73 +117,154 @@ export default function FileManager() {
   };
 
   // --- fetchFiles ahora usa useCallback para evitar re-creaciones innecesarias ---
-  const fetchFiles = useCallback(async (path: string = '') => {
+  // El servidor devuelve la página ya ordenada (carpetas primero); offset > 0 añade la siguiente página a la lista
+  const fetchFiles = useCallback(async (path: string = '', offset: number = 0) => {
     try {
-      const res = await fetch(`/api/files?path=${encodeURIComponent(path)}`); // Encode path
+      const params = new URLSearchParams({
+        path, sort: sortKey, order: sortOrder, offset: offset.toString(), limit: PAGE_SIZE.toString(),
+      });
+      const res = await fetch(`/api/files?${params}`);
       if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`); // Check response status
       const data = await res.json();
-      const sorted = [
-        ...(data.folders?.map((f: string) => ({ name: f, isFolder: true })) || []), // Safety checks
-        ...(data.files?.map((f: string) => ({ name: f, isFolder: false })) || []), // Safety checks
-      ].sort((a, b) => a.name.localeCompare(b.name));
-      setFiles(sorted);
+      const page: FileItem[] = (data.entries || []).map((e: any) => ({
+        name: e.name, isFolder: e.type === 'folder', size: e.size, mtime: e.mtime,
+      }));
+      setFiles(prev => offset > 0 ? [...prev, ...page] : page);
+      setNextOffset(data.nextOffset ?? null);
       setCurrentPath(path);
     } catch (err: any) {
       console.error("Error cargando archivos:", err.message);
       showNotification("Error cargando archivos", "error");
       setFiles([]);
     }
-  }, [/* Dependencias vacías si showNotification no cambia, o añadir showNotification */]); // Ajustar dependencias si es necesario
+  }, [sortKey, sortOrder]); // Se recrea al cambiar la ordenación (y el efecto inicial recarga la carpeta actual)
 
 
-  // --- uploadFileInChunks ahora usa acciones del store ---
+  // --- uploadFileInChunks: sesión de subida con varios chunks en paralelo (ver /api/uploads) ---
   const uploadFileInChunks = useCallback(async (file: File, path: string) => {
-    const chunkSize = 5 * 1024 * 1024;
-    const totalChunks = Math.ceil(file.size / chunkSize);
-
-    for (let index = 0; index < totalChunks; index++) {
-      // Lee el estado directamente del store para la comprobación más actualizada
-      if (useUploadStore.getState().cancelled) {
-        console.log(`Cancellation check triggered for ${file.name}`); // Debug log
-        throw new Error("Upload cancelled");
-      }
-
-      while (useUploadStore.getState().paused) {
-        await new Promise(resolve => setTimeout(resolve, 300));
+    // Si una subida anterior del mismo fichero quedó a medias, se reanuda enviando solo los chunks que faltan
+    const resumeKey = `naspi-upload:${path}/${file.name}:${file.size}:${file.lastModified}`;
+    let session: { sessionId: string; chunkSize: number; totalChunks: number; missing: number[] } | null = null;
+
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+      const res = await fetch(`/api/uploads/${savedId}`);
+      if (res.ok) session = await res.json();
+      else localStorage.removeItem(resumeKey);
+    }
+    if (!session) {
+      const res = await fetch("/api/uploads", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ filename: file.name, path: path || '', size: file.size, chunkSize: UPLOAD_CHUNK_SIZE }),
+      });
+      if (!res.ok) {
+        const errorData = await res.json().catch(() => ({}));
+        throw new Error(errorData.error || `No se pudo iniciar la subida. Status: ${res.status}`);
       }
+      session = await res.json();
+      localStorage.setItem(resumeKey, session!.sessionId);
+    }
+    const { sessionId, chunkSize, totalChunks } = session!;
 
-      const start = index * chunkSize;
-      const end = Math.min(file.size, start + chunkSize);
-      const chunk = file.slice(start, end);
+    const cancel = async () => {
+      localStorage.removeItem(resumeKey);
+      await fetch(`/api/uploads/${sessionId}`, { method: "DELETE" }).catch(() => {});
+      throw new Error("Upload cancelled");
+    };
 
-      const formData = new FormData();
-      formData.append("chunk", chunk);
-      formData.append("filename", file.name);
-      formData.append("chunkIndex", index.toString());
-      formData.append("totalChunks", totalChunks.toString());
-      formData.append("path", path || '');
+    // SHA-256 de cada chunk: el servidor verifica cada uno y el del fichero completo (hash de los hashes de los chunks)
+    const chunkDigests: string[] = new Array(totalChunks);
+    const readChunk = (index: number) =>
+      file.slice(index * chunkSize, Math.min(file.size, (index + 1) * chunkSize)).arrayBuffer();
 
-      try {
-        const response = await fetch("/api/upload_chunk", {
-          method: "POST",
-          body: formData,
-        });
+    const sendChunk = async (index: number) => {
+      const start = index * chunkSize;
+      const chunk = await readChunk(index);
+      const headers: Record<string, string> = {
+        "Content-Type": "application/octet-stream",
+        "X-Upload-Offset": start.toString(),
+      };
+      const digest = await sha256Hex(chunk);
+      if (digest) {
+        chunkDigests[index] = digest;
+        headers["X-Chunk-SHA256"] = digest;
+      }
 
-        if (!response.ok) {
-          const errorData = await response.text(); // Get more error details
+      // Reenviar un chunk es seguro: el servidor lo escribe siempre en su offset
+      // (un 422 indica que el chunk llegó corrupto, así que también se reintenta)
+      for (let attempt = 1; ; attempt++) {
+        let response: Response | null = null;
+        try {
+          // Cuerpo crudo: el servidor lo vuelca al disco tal cual, sin parsear multipart
+          response = await fetch(`/api/uploads/${sessionId}/chunks/${index}`, {
+            method: "PUT",
+            headers,
+            body: chunk,
+          });
+        } catch (error) {
+          if (attempt >= UPLOAD_CHUNK_RETRIES) throw error;
+        }
+        if (response?.ok) return;
+        if (response && ((response.status < 500 && response.status !== 422) || attempt >= UPLOAD_CHUNK_RETRIES)) {
+          const errorData = await response.text();
           console.error("Chunk upload failed:", errorData);
           throw new Error(`Chunk ${index + 1} failed. Status: ${response.status}`);
         }
+        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+      }
+    };
+
+    const pending = [...session!.missing];
+    let received = totalChunks - pending.length;
+    updateFileProgress(file.name, Math.round((received / totalChunks) * 100));
+
+    // Cada "worker" va tomando el siguiente chunk pendiente hasta vaciar la lista
+    const worker = async () => {
+      while (pending.length > 0) {
+        if (useUploadStore.getState().cancelled) return;
+        while (useUploadStore.getState().paused) {
+          await new Promise(resolve => setTimeout(resolve, 300));
+        }
+        const index = pending.shift()!;
+        await sendChunk(index);
+        received++;
+        updateFileProgress(file.name, Math.round((received / totalChunks) * 100));
+      }
+    };
 
-        const currentProgress = Math.round(((index + 1) / totalChunks) * 100);
-        // --- Usa la acción del store para actualizar el progreso ---
-        updateFileProgress(file.name, currentProgress);
+    try {
+      await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_CHUNKS, pending.length) }, worker));
+    } catch (error) {
+      // La sesión se conserva para poder reanudar la subida más tarde
+      console.error(`Error uploading ${file.name}:`, error);
+      throw error;
+    }
+    if (useUploadStore.getState().cancelled) {
+      console.log(`Cancellation check triggered for ${file.name}`); // Debug log
+      await cancel();
+    }
 
-      } catch (error) {
-        console.error(`Error uploading chunk ${index + 1} for ${file.name}:`, error);
-        throw error;
+    // Digest del fichero: los chunks subidos en una sesión anterior (reanudada) se hashean ahora en local
+    let sha256Tree: string | null = null;
+    if (await sha256Hex(new ArrayBuffer(0))) {
+      for (let index = 0; index < totalChunks; index++) {
+        chunkDigests[index] ??= (await sha256Hex(await readChunk(index)))!;
       }
+      const concatenated = new Uint8Array(chunkDigests.flatMap(hex => hex.match(/../g)!.map(b => parseInt(b, 16))));
+      sha256Tree = await sha256Hex(concatenated.buffer);
     }
+
+    const response = await fetch(`/api/uploads/${sessionId}/complete`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(sha256Tree ? { sha256Tree } : {}),
+    });
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.error || `No se pudo completar la subida. Status: ${response.status}`);
+    }
+    localStorage.removeItem(resumeKey);
   }, [updateFileProgress]); // Dependencia de la acción del store
 
 
@@ -261,7 +389,12 @@ export default function FileManager() {
       });
       const data = await response.json().catch(() => ({})); // Intenta parsear JSON, si no, objeto vacío
 
-      if (response.ok) {
+      if (response.status === 202 && data.jobId) {
+        // El borrado se hace en segundo plano: el aviso final llega por el evento "jobs"
+        pendingJobs.current.set(data.jobId, currentFolderName);
+        showNotification(`Eliminando "${currentFolderName}" en segundo plano...`, "success");
+        fetchFiles(currentPath.split('/').slice(0, -1).join('/'));
+      } else if (response.ok) {
         showNotification(`Carpeta "${currentFolderName}" eliminada correctamente`, "success");
         const parentPath = currentPath.split('/').slice(0, -1).join('/');
         fetchFiles(parentPath); // Vuelve y refresca
@@ -277,29 +410,26 @@ export default function FileManager() {
     }
   }, [currentPath, fetchFiles /* , showNotification */]); // Añadir showNotification si su referencia puede cambiar
 
-  const handleDownload = useCallback(async (fileName: string) => {
+  const handleDownload = useCallback((fileName: string) => {
     const fullPath = currentPath ? `${currentPath}/${fileName}` : fileName;
     const encoded = encodeURIComponent(fullPath);
-    try {
-      const res = await fetch(`/api/files/${encoded}`);
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({ message: res.statusText }));
-        throw new Error(errorData.message || `Error ${res.status}`);
-      }
-      const blob = await res.blob();
-      const url = URL.createObjectURL(blob);
-      const link = document.createElement("a");
-      link.href = url;
-      link.download = fileName;
-      document.body.appendChild(link); // Necesario en algunos navegadores
-      link.click();
-      document.body.removeChild(link); // Limpiar
-      URL.revokeObjectURL(url);
-    } catch (error: any) {
-      showNotification(`Error al descargar "${fileName}": ${error.message}`, "error");
-      console.error("Download error:", error);
-    }
-  }, [currentPath /* , showNotification */]); // Añadir showNotification si su referencia puede cambiar
+    // Descarga nativa del navegador: no carga el fichero en memoria y permite reanudar (Range)
+    const link = document.createElement("a");
+    link.href = `/api/files/${encoded}`;
+    link.download = fileName;
+    document.body.appendChild(link); // Necesario en algunos navegadores
+    link.click();
+    document.body.removeChild(link); // Limpiar
+  }, [currentPath]);
+
+  // Carpeta completa como ZIP generado al vuelo por el servidor (sin fichero temporal ni carga en memoria)
+  const handleDownloadFolder = useCallback(() => {
+    const link = document.createElement("a");
+    link.href = `/api/archive?path=${encodeURIComponent(currentPath)}&format=zip`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+  }, [currentPath]);
 
   const handleDelete = useCallback(async (fileName: string) => {
     const fullPath = currentPath ? `${currentPath}/${fileName}` : fileName;
@@ -324,16 +454,60 @@ export default function FileManager() {
     fetchFiles(newPath);
   }, [currentPath, fetchFiles]);
 
+  // --- Búsqueda en todo el RAID (índice del servidor) ---
+  const handleSearch = useCallback(async (e: React.FormEvent) => {
+    e.preventDefault();
+    const q = searchQuery.trim();
+    if (!q) {
+      setSearchResults(null);
+      return;
+    }
+    try {
+      const res = await fetch(`/api/search?${new URLSearchParams({ q, limit: '200' })}`);
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || `HTTP error! status: ${res.status}`);
+      setSearchResults(data.results);
+    } catch (err: any) {
+      console.error("Error en la búsqueda:", err.message);
+      showNotification("Error en la búsqueda", "error");
+    }
+  }, [searchQuery]); // eslint-disable-line react-hooks/exhaustive-deps
+
+  const openSearchResult = useCallback((result: SearchResult) => {
+    setSearchResults(null);
+    setSearchQuery('');
+    fetchFiles(result.type === 'folder' ? result.path : result.parent);
+  }, [fetchFiles]);
+
   const handleGoBack = useCallback(() => {
     const parts = currentPath.split("/");
     parts.pop();
     fetchFiles(parts.join("/"));
   }, [currentPath, fetchFiles]);
 
-  // --- Efecto inicial para cargar archivos ---
+  // --- Efecto inicial para cargar archivos (y recargar la carpeta actual al cambiar la ordenación) ---
   useEffect(() => {
-    fetchFiles();
-  }, [fetchFiles]);
+    fetchFiles(currentPath);
+  }, [fetchFiles]); // eslint-disable-line react-hooks/exhaustive-deps
+
+  // --- Refresca la carpeta actual si otro cliente la modifica (subidas, borrados, carpetas nuevas) ---
+  useServerEvent('files', (event) => {
+    if (event?.parent === currentPath && !useUploadStore.getState().uploading) {
+      fetchFiles(currentPath);
+    }
+  });
+
+  // --- Aviso al terminar los trabajos en segundo plano lanzados desde esta pestaña ---
+  useServerEvent('jobs', (job) => {
+    const name = pendingJobs.current.get(job?.id);
+    if (!name || !['completed', 'failed', 'cancelled'].includes(job.status)) return;
+    pendingJobs.current.delete(job.id);
+    if (job.status === 'completed') {
+      showNotification(`"${name}" eliminada correctamente`, "success");
+    } else {
+      showNotification(`No se pudo eliminar "${name}": ${job.error || 'cancelado'}`, "error");
+    }
+  });
 
   // --- Renderizado ---
   return (
@@ -343,10 +517,39 @@ export default function FileManager() {
       <div className="flex justify-between items-center flex-wrap gap-2">
         <h1 className="text-2xl font-bold">File Manager</h1>
         <div className="flex flex-col sm:flex-row sm:items-center gap-2">
+          {/* Búsqueda */}
+          <form onSubmit={handleSearch} className="flex items-center gap-1">
+            <Input
+              value={searchQuery}
+              onChange={(e) => setSearchQuery(e.target.value)}
+              placeholder="Buscar en el NAS..."
+              className="h-9 w-48"
+            />
+            <Button type="submit" size="sm" variant="outline"><Search className="w-4 h-4" /></Button>
+          </form>
+
           {/* Botones de Vista */}
           <Button onClick={() => setViewMode("grid")} variant={viewMode === 'grid' ? 'secondary' : 'outline'} size="sm"><Grid className="w-4 h-4" /></Button>
           <Button onClick={() => setViewMode("list")} variant={viewMode === 'list' ? 'secondary' : 'outline'} size="sm"><List className="w-4 h-4" /></Button>
 
+          {/* Ordenación (la aplica el servidor) */}
+          <select
+            value={`${sortKey}:${sortOrder}`}
+            onChange={(e) => {
+              const [key, order] = e.target.value.split(':');
+              setSortKey(key as SortKey);
+              setSortOrder(order as 'asc' | 'desc');
+            }}
+            className="h-9 rounded-md border px-2 text-sm bg-white dark:bg-gray-800 dark:border-gray-700"
+          >
+            <option value="name:asc">Nombre (A-Z)</option>
+            <option value="name:desc">Nombre (Z-A)</option>
+            <option value="size:desc">Tamaño (mayor)</option>
+            <option value="size:asc">Tamaño (menor)</option>
+            <option value="mtime:desc">Modificado (reciente)</option>
+            <option value="mtime:asc">Modificado (antiguo)</option>
+          </select>
+
           {/* Botones de Acción */}
           <Button size="sm" onClick={() => {
             setNewFolderName('');
@@ -354,6 +557,11 @@ export default function FileManager() {
           }}>
             <PlusCircle className="w-4 h-4 mr-1" /> Crear Carpeta
           </Button>
+          {currentPath && (
+            <Button variant="outline" size="sm" onClick={handleDownloadFolder}>
+              <Download className="w-4 h-4 mr-1" /> Descargar Carpeta (ZIP)
+            </Button>
+          )}
           {currentPath && (
             <Button
               variant="destructive"
@@ -431,6 +639,33 @@ export default function FileManager() {
       )}
 
 
+      {/* Resultados de búsqueda */}
+      {searchResults !== null && (
+        <Card className="bg-white dark:bg-gray-800 shadow">
+          <CardHeader>
+            <div className="flex justify-between items-center">
+              <CardTitle className="text-lg font-semibold">Resultados ({searchResults.length})</CardTitle>
+              <Button size="sm" variant="ghost" onClick={() => setSearchResults(null)}><X className="w-4 h-4" /></Button>
+            </div>
+          </CardHeader>
+          <CardContent>
+            {searchResults.length === 0 && <p className="text-center text-gray-500 dark:text-gray-400">Sin resultados.</p>}
+            <div className="grid grid-cols-1 gap-1">
+              {searchResults.map((result) => (
+                <div key={result.path} onClick={() => openSearchResult(result)}
+                  className="flex items-center gap-2 p-2 rounded cursor-pointer hover:bg-gray-100 dark:hover:bg-gray-700">
+                  {result.type === 'folder'
+                    ? <Folder className="w-5 h-5 text-blue-500 dark:text-blue-400 shrink-0" />
+                    : <File className="w-5 h-5 text-gray-500 dark:text-gray-400 shrink-0" />}
+                  <span className="text-sm text-gray-800 dark:text-gray-200 truncate">{result.name}</span>
+                  <span className="text-xs text-gray-500 dark:text-gray-400 font-mono truncate ml-auto">/{result.parent}</span>
+                </div>
+              ))}
+            </div>
+          </CardContent>
+        </Card>
+      )}
+
       {/* Listado de Archivos */}
       <Card className="bg-white dark:bg-gray-800 shadow">
         <CardHeader>
@@ -449,10 +684,23 @@ export default function FileManager() {
               >
                 {item.isFolder ? (
                   <Folder className="w-10 h-10 mb-2 text-blue-500 dark:text-blue-400" />
+                ) : viewMode === 'grid' && THUMBNAIL_EXTENSIONS.test(item.name) ? (
+                  <img
+                    src={`/api/thumbnail/${encodeURIComponent(currentPath ? `${currentPath}/${item.name}` : item.name)}?size=256&v=${item.mtime}`}
+                    alt={item.name}
+                    loading="lazy"
+                    className="w-full h-24 object-cover rounded mb-2"
+                  />
                 ) : (
                   <File className="w-10 h-10 mb-2 text-gray-500 dark:text-gray-400" />
                 )}
                 <p className="w-full truncate text-sm text-gray-800 dark:text-gray-200 mb-1">{item.name}</p>
+                {viewMode === 'list' && (
+                  <p className="text-xs text-gray-500 dark:text-gray-400 mb-1">
+                    {!item.isFolder && `${formatSize(item.size)} · `}
+                    {new Date(item.mtime * 1000).toLocaleString()}
+                  </p>
+                )}
                 {/* Acciones aparecen en hover en modo grid, siempre visibles en lista */}
                 <div className={`flex justify-center space-x-1 ${viewMode === 'grid' ? 'absolute bottom-1 left-1/2 transform -translate-x-1/2 opacity-0 group-hover:opacity-100 transition-opacity duration-200' : 'mt-1'}`}>
                   {!item.isFolder && (
@@ -479,6 +727,13 @@ export default function FileManager() {
               </div>
             ))}
           </div>
+          {nextOffset !== null && (
+            <div className="flex justify-center mt-4">
+              <Button size="sm" variant="outline" onClick={() => fetchFiles(currentPath, nextOffset)}>
+                Cargar más
+              </Button>
+            </div>
+          )}
           {files.length === 0 && !uploading && <p className="text-center text-gray-500 dark:text-gray-400 mt-4">Esta carpeta está vacía.</p>}
         </CardContent>
       </Card>
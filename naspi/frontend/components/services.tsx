@@ -4,6 +4,7 @@ import { useState, useEffect } from 'react';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Loader2, Play, StopCircle, ExternalLink, CheckCircle2, XCircle, AlertCircle, Settings2 } from 'lucide-react';
+import { useServerEvent } from '@/lib/events';
 
 const BACKEND_API_BASE_URL = '/api';
 
@@ -62,18 +63,7 @@ export default function Services() {
             }
             const data = await response.json();
             if (data.success && Array.isArray(data.services)) {
-                const fixedList = data.services.map((service: any) => {
-                    let fixedStatus = service.status;
-                    if ((fixedStatus === 'Error/Unknown' || fixedStatus === 'Error/NoServices') && service.stack_id !== null) {
-                        fixedStatus = 'Running';
-                    }
-                    return {
-                        ...service,
-                        status: fixedStatus
-                    } as ServiceStatus;
-                });
-
-                setServicesList(fixedList);
+                applyServices(data.services);
             } else {
                 setError("La respuesta del backend no tiene el formato esperado para la lista de servicios.");
                 setServicesList([]);
@@ -87,6 +77,29 @@ export default function Services() {
         }
     };
 
+    const applyServices = (services: any[]) => {
+        const fixedList = services.map((service: any) => {
+            let fixedStatus = service.status;
+            if ((fixedStatus === 'Error/Unknown' || fixedStatus === 'Error/NoServices') && service.stack_id !== null) {
+                fixedStatus = 'Running';
+            }
+            return {
+                ...service,
+                status: fixedStatus
+            } as ServiceStatus;
+        });
+
+        setServicesList(fixedList);
+    };
+
+    // El backend empuja la lista completa cuando cambia el estado de algún servicio
+    useServerEvent('services', (services) => {
+        if (Array.isArray(services)) {
+            setError(null);
+            applyServices(services);
+        }
+    });
+
     const handleAccessService = (service: ServiceStatus, configMode = false) => {
         const NASPI_BASE_URL = `${window.location.protocol}//${window.location.hostname}`;
         
@@ -114,8 +127,6 @@ export default function Services() {
 
     useEffect(() => {
         fetchServices();
-        const interval = setInterval(fetchServices, 15000);
-        return () => clearInterval(interval);
     }, []);
 
     return (
@@ -9,6 +9,7 @@ import { Input } from "@/components/ui/input"
 import { Label } from "@/components/ui/label"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { Network, HardDrive, Users, Trash2 } from "lucide-react"
+import { useServerEvent } from "@/lib/events"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import {
   AlertDialog,
@@ -34,9 +35,37 @@ interface TelematicData {
   dns: string
 }
 
+interface UsageNode {
+  path: string
+  name: string
+  type: "folder" | "files"
+  bytes: number
+  files: number
+  children?: UsageNode[]
+}
+
+interface DuplicateSet {
+  sha256: string
+  size: number
+  copies: number
+  reclaimable: number
+  paths: string[]
+}
+
+function formatBytes(bytes: number): string {
+  const units = ["B", "KB", "MB", "GB", "TB"]
+  let i = 0
+  while (bytes >= 1024 && i < units.length - 1) {
+    bytes /= 1024
+    i++
+  }
+  return `${bytes.toFixed(i === 0 ? 0 : 1)} ${units[i]}`
+}
+
 interface NASData {
+  devices: string[]
   status: { [key: string]: string }
-  speed: string
+  speed: string[]
 }
 
 export default function SystemSettings() {
@@ -47,20 +76,23 @@ export default function SystemSettings() {
   const [NASstatus, setNASStatus] = useState<NASData | null>(null)
   const [userToDelete, setUserToDelete] = useState<User | null>(null)
   const [isDeleteDialogOpen, setIsDeleteDialogOpen] = useState(false)
+  const [usage, setUsage] = useState<UsageNode | null>(null)
+  const [usageMessage, setUsageMessage] = useState("")
+  const [duplicates, setDuplicates] = useState<DuplicateSet[]>([])
+  const [reclaimable, setReclaimable] = useState(0)
+  const [duplicatesMessage, setDuplicatesMessage] = useState("")
 
   useEffect(() => {
     fetchUsers();
     fetchTelematic();
     fetchNASStatus();
-
-    // Configurar actualización automática cada 60s (1 minuto)
-    const interval = setInterval(() => {
-      fetchNASStatus();
-    }, 60000);
-
-    return () => clearInterval(interval); // Limpiar intervalo al desmontar
+    fetchUsage();
+    fetchDuplicates();
   }, []);
 
+  // Estado SMART y velocidad de los discos empujados por el servidor cuando cambian
+  useServerEvent("nas_status", (data: NASData) => setNASStatus(data))
+
   const fetchUsers = async () => {
     try {
       const response = await fetch("/api/users")
@@ -145,6 +177,55 @@ export default function SystemSettings() {
     }
   }
 
+  // Uso de disco por carpeta (índice precalculado en el servidor)
+  const fetchUsage = async (path: string = "") => {
+    try {
+      const response = await fetch(`/api/storage/usage?path=${encodeURIComponent(path)}&depth=1`)
+      const data = await response.json()
+      if (!response.ok) {
+        setUsageMessage(data.error || "No se pudo obtener el uso de disco")
+        return
+      }
+      setUsage(data.usage)
+      setUsageMessage("")
+    } catch (error) {
+      console.error("Error fetching storage usage:", error)
+    }
+  }
+
+  // Ficheros duplicados (escaneo periódico en el servidor)
+  const fetchDuplicates = async () => {
+    try {
+      const response = await fetch(`/api/storage/duplicates?limit=20`)
+      const data = await response.json()
+      if (!response.ok) {
+        setDuplicatesMessage(data.error || "No se pudieron obtener los duplicados")
+        return
+      }
+      setDuplicates(data.sets)
+      setReclaimable(data.reclaimableBytes)
+      setDuplicatesMessage("")
+    } catch (error) {
+      console.error("Error fetching duplicates:", error)
+    }
+  }
+
+  // Sustituye las copias por enlaces duros al original (trabajo en segundo plano)
+  const deduplicate = async (sets: string[]) => {
+    try {
+      const response = await fetch(`/api/jobs`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ type: "dedup", params: { sets, mode: "hardlink" } }),
+      })
+      const data = await response.json()
+      setDuplicatesMessage(response.ok ? "Deduplicando en segundo plano..." : data.error || "No se pudo deduplicar")
+      if (response.ok) setDuplicates((prev) => prev.filter((d) => !sets.includes(d.sha256)))
+    } catch (error) {
+      console.error("Error starting dedup job:", error)
+    }
+  }
+
   return (
     <div className="space-y-6">
       <h1 className="text-2xl md:text-3xl font-semibold text-gray-800 dark:text-gray-200">System Settings</h1>
@@ -208,28 +289,96 @@ export default function SystemSettings() {
                 <thead className="bg-gray-200 dark:bg-gray-700">
                   <tr>
                     <th className="border p-2 text-left">SSD Name</th>
-                    <th className="border p-2 text-left">SSD 1</th>
-                    <th className="border p-2 text-left">SSD 2</th>
-                    <th className="border p-2 text-left">SSD 3</th>
+                    {(NASstatus?.devices || ["SSD 1", "SSD 2", "SSD 3"]).map((device, index) => (
+                      <th key={device} className="border p-2 text-left">{NASstatus ? device : `SSD ${index + 1}`}</th>
+                    ))}
                   </tr>
                 </thead>
                 <tbody>
                   <tr>
                     <td className="border p-2">SSD Status</td>
-                    <td className="border p-2">{NASstatus?.status["/dev/sda"] || "Loading..."}</td>
-                    <td className="border p-2">{NASstatus?.status["/dev/sdb"] || "Loading..."}</td>
-                    <td className="border p-2">{NASstatus?.status["/dev/sdc"] || "Loading..."}</td>
+                    {(NASstatus?.devices || ["", "", ""]).map((device, index) => (
+                      <td key={index} className="border p-2">{NASstatus?.status[device] || "Loading..."}</td>
+                    ))}
                   </tr>
                   <tr>
                     <td className="border p-2">SSD Speed</td>
-                    <td className="border p-2">{NASstatus?.speed[0] || "Loading..."}</td>
-                    <td className="border p-2">{NASstatus?.speed[1] || "Loading..."}</td>
-                    <td className="border p-2">{NASstatus?.speed[2] || "Loading..."}</td>
+                    {(NASstatus?.devices || ["", "", ""]).map((device, index) => (
+                      <td key={index} className="border p-2">{NASstatus?.speed[index] || "Loading..."}</td>
+                    ))}
                   </tr>
                 </tbody>
               </table>
             </CardContent>
           </Card>
+
+          <Card className="bg-white dark:bg-gray-800 mt-4">
+            <CardHeader>
+              <CardTitle className="text-lg font-medium text-gray-900 dark:text-gray-100">Storage Usage</CardTitle>
+            </CardHeader>
+            <CardContent className="space-y-2">
+              {usageMessage && <p className="text-sm text-gray-500 dark:text-gray-400">{usageMessage}</p>}
+              {usage && (
+                <>
+                  <div className="flex items-center gap-2 text-sm text-gray-600 dark:text-gray-300">
+                    {usage.path && (
+                      <Button variant="ghost" size="sm" onClick={() => fetchUsage(usage.path.split("/").slice(0, -1).join("/"))}>
+                        ⬅️ Volver
+                      </Button>
+                    )}
+                    <span className="font-mono">/{usage.path}</span>
+                    <span className="ml-auto">{formatBytes(usage.bytes)} · {usage.files} archivos</span>
+                  </div>
+                  {(usage.children || []).map((child) => (
+                    <div
+                      key={`${child.type}:${child.path}`}
+                      className={`space-y-1 ${child.type === "folder" ? "cursor-pointer" : ""}`}
+                      onClick={() => child.type === "folder" && fetchUsage(child.path)}
+                    >
+                      <div className="flex justify-between text-sm">
+                        <span className="truncate">{child.name}</span>
+                        <span className="text-gray-500 dark:text-gray-400">{formatBytes(child.bytes)}</span>
+                      </div>
+                      <div className="h-2 rounded bg-gray-200 dark:bg-gray-700">
+                        <div
+                          className="h-2 rounded bg-blue-500"
+                          style={{ width: `${usage.bytes ? (child.bytes / usage.bytes) * 100 : 0}%` }}
+                        />
+                      </div>
+                    </div>
+                  ))}
+                </>
+              )}
+            </CardContent>
+          </Card>
+
+          <Card className="bg-white dark:bg-gray-800 mt-4">
+            <CardHeader>
+              <CardTitle className="text-lg font-medium text-gray-900 dark:text-gray-100">Duplicate Files</CardTitle>
+            </CardHeader>
+            <CardContent className="space-y-2">
+              {duplicatesMessage && <p className="text-sm text-gray-500 dark:text-gray-400">{duplicatesMessage}</p>}
+              <div className="flex items-center justify-between text-sm text-gray-600 dark:text-gray-300">
+                <span>Recuperable: {formatBytes(reclaimable)}</span>
+                {duplicates.length > 0 && (
+                  <Button variant="outline" size="sm" onClick={() => deduplicate(duplicates.map((d) => d.sha256))}>
+                    Enlazar duplicados
+                  </Button>
+                )}
+              </div>
+              {duplicates.map((set) => (
+                <div key={set.sha256} className="border-t pt-2 text-sm dark:border-gray-700">
+                  <div className="flex justify-between">
+                    <span>{set.copies} copias de {formatBytes(set.size)}</span>
+                    <span className="text-gray-500 dark:text-gray-400">{formatBytes(set.reclaimable)}</span>
+                  </div>
+                  {set.paths.map((path) => (
+                    <p key={path} className="font-mono text-xs truncate text-gray-500 dark:text-gray-400">/{path}</p>
+                  ))}
+                </div>
+              ))}
+            </CardContent>
+          </Card>
         </TabsContent>
 
         <TabsContent value="users">
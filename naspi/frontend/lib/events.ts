@@ -0,0 +1,52 @@
+'use client'
+
+import { useEffect, useRef } from 'react'
+
+// Canal único de Server-Sent Events (/api/events) compartido por todos los componentes de la pestaña
+type Handler = (data: any) => void
+
+let source: EventSource | null = null
+const handlers = new Map<string, Set<Handler>>()
+
+function dispatch(event: MessageEvent) {
+  let data: any
+  try {
+    data = JSON.parse(event.data)
+  } catch {
+    return
+  }
+  handlers.get(event.type)?.forEach(handler => handler(data))
+}
+
+export function subscribe(event: string, handler: Handler): () => void {
+  if (!source) {
+    source = new EventSource('/api/events')
+  }
+  if (!handlers.has(event)) {
+    handlers.set(event, new Set())
+    source.addEventListener(event, dispatch)
+  }
+  handlers.get(event)!.add(handler)
+
+  return () => {
+    const set = handlers.get(event)
+    set?.delete(handler)
+    if (set && set.size === 0) {
+      handlers.delete(event)
+      source?.removeEventListener(event, dispatch)
+    }
+    // Sin suscriptores se cierra la conexión
+    if (handlers.size === 0 && source) {
+      source.close()
+      source = null
+    }
+  }
+}
+
+// Hook: llama a handler cada vez que el servidor empuja un evento del tipo indicado
+export function useServerEvent(event: string, handler: Handler) {
+  const handlerRef = useRef(handler)
+  handlerRef.current = handler
+
+  useEffect(() => subscribe(event, data => handlerRef.current(data)), [event])
+}